@@ -1,14 +1,29 @@
 import json
-import faiss
-import numpy as np
-from sentence_transformers import SentenceTransformer
-import subprocess
 import os
 import time
 import re
-from typing import Optional
+import argparse
+import itertools
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Dict, List, Optional
+import numpy as np
+from retriever import DomainRetrieverRegistry
+from doc_store import has_doc_store
+from embedding_cache import open_embedding_cache
+from encoder import DEFAULT_BACKEND, encoder_id, load_encoder, resolve_backend
+from ollama_client import OllamaClient
+from generation_cache import GenerationCache
+from lexical_index import reciprocal_rank_fusion
+from context_packer import pack_passages, truncate_to_tokens
+from reranker import DEFAULT_RERANK_MODEL, get_reranker
+from retry_policy import (LatencyWindow, RetryError, RetryPolicy, classify_error,
+                          run_with_retry)
+from tracing import tracer
 
 # ==== Domaines disponibles ====
+# "search_params" (optionnel) règle la recherche des index approchés,
+# ex: {"nprobe": 16} pour IVF ou {"efSearch": 64} pour HNSW (voir faiss_index/*.recall.json)
 AVAILABLE_DOMAINS = {
     "angular": {"index": "faiss_index/angular_faiss.index", "docs": "docs/angular_docs.json"},
     "java": {"index": "faiss_index/java_faiss.index", "docs": "docs/java_docs.json"},
@@ -18,8 +33,102 @@ AVAILABLE_DOMAINS = {
     }
 }
 
+# ==== Recherche fédérée multi-domaines ====
+# "parallel" : un thread par index de domaine, scores fusionnés ;
+# "combined" : index unique étiqueté par domaine (build_faiss_index.py --combined)
+COMBINED_INDEX = "faiss_index/combined_faiss.index"
+FEDERATED_MODE = os.environ.get("RAG_FEDERATED_MODE", "parallel")
+
+# ==== Filtrage de pertinence et re-ranking ====
+# Similarité cosinus minimale d'un passage : RAG_MIN_SIMILARITY si défini, sinon le
+# seuil calibré du domaine (calibrate_relevance.py), sinon MIN_SIMILARITY. Avec
+# MiniLM, les passages sans rapport avec la requête tombent sous 0.2 ; 0.0
+# correspondait à l'ancien seuil L2 < 2.0, qui acceptait presque tout.
+MIN_SIMILARITY = 0.2
+RELEVANCE_CALIBRATION = "faiss_index/relevance_calibration.json"
+# Candidats récupérés par chaque moteur avant filtrage, fusion et re-ranking (multiple de top_k)
+RETRIEVAL_CANDIDATES = 4
+# Re-classement des candidats par un cross-encoder CPU (RAG_RERANK=1)
+USE_RERANK = os.environ.get("RAG_RERANK", "0") == "1"
+RERANK_MODEL = os.environ.get("RAG_RERANK_MODEL", DEFAULT_RERANK_MODEL)
+RERANK_BATCH_SIZE = 16
+# Au-delà, les candidats restants gardent leur ordre de recherche
+RERANK_MAX_LATENCY_MS = float(os.environ.get("RAG_RERANK_MAX_MS", "300"))
+
+# ==== Recherche hybride BM25 + vecteurs (fusion RRF) ====
+# Retrouve les noms d'API exacts (@Component, ArrayList...) manqués par les embeddings.
+# RAG_HYBRID=0 revient à la recherche vectorielle seule.
+USE_HYBRID = os.environ.get("RAG_HYBRID", "1") != "0"
+
+# ==== Budget du contexte injecté dans le prompt ====
+# Les passages sont ajoutés par ordre de pertinence jusqu'à ce budget (tokens estimés),
+# les quasi-doublons sont écartés (voir context_packer.py)
+CONTEXT_TOKEN_BUDGET = int(os.environ.get("RAG_CONTEXT_TOKENS", "512"))
+
+# ==== Cache des index et documents (chargés une fois par processus) ====
+retriever_registry = DomainRetrieverRegistry(AVAILABLE_DOMAINS, combined_index=COMBINED_INDEX)
+
 # ==== Modèle d'embedding ====
-model = SentenceTransformer("all-MiniLM-L6-v2")
+# Chargé au premier encodage réellement nécessaire (cache disque manqué) :
+# importer ce module ne charge ni torch ni sentence-transformers.
+# EMBEDDING_BACKEND : torch (défaut), torch-int8, onnx ou onnx-int8 (voir encoder.py)
+EMBEDDING_MODEL_NAME = "all-MiniLM-L6-v2"
+EMBEDDING_BACKEND = resolve_backend(DEFAULT_BACKEND)
+_embedding_model = None
+_embedding_model_lock = threading.Lock()
+
+def get_embedding_model():
+    """Modèle SentenceTransformer, construit une seule fois au premier appel"""
+    global _embedding_model
+    if _embedding_model is None:
+        with _embedding_model_lock:
+            if _embedding_model is None:
+                print(f"🧠 Chargement du modèle d'embedding {EMBEDDING_MODEL_NAME} ({EMBEDDING_BACKEND})...")
+                _embedding_model = load_encoder(EMBEDDING_MODEL_NAME, EMBEDDING_BACKEND)
+    return _embedding_model
+
+def encode_queries(texts):
+    """Encoder des textes avec le modèle (chargé à la demande)"""
+    return get_embedding_model().encode(texts)
+
+def warm_up(domains: Optional[List[str]] = None):
+    """Précharger le modèle d'embedding et les index (ex: en tâche de fond pendant la vérification d'Ollama)"""
+    start = time.monotonic()
+    get_embedding_model().encode(["warm-up"])
+    for sujet in domains or []:
+        retriever_registry.get(sujet)
+    print(f"🔥 Préchargement terminé en {time.monotonic() - start:.1f}s")
+
+def __getattr__(name):
+    # Compatibilité : `Llama3_model.model` reste accessible, chargé au premier accès
+    if name == "model":
+        return get_embedding_model()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+# ==== Cache disque des embeddings (partagé avec build_faiss_index.py, un par backend) ====
+# Écriture différée : les requêtes nouvelles sont ajoutées au disque en fin de processus,
+# sans jamais attendre un build en cours
+embedding_cache = open_embedding_cache(encoder_id(EMBEDDING_MODEL_NAME, EMBEDDING_BACKEND), deferred_writes=True)
+
+# ==== Client HTTP Ollama (connexions keep-alive, modèle gardé en mémoire) ====
+ollama_client = OllamaClient()
+
+# ==== Cache des générations (adressé par le prompt complet) ====
+# LLM_CACHE_BYPASS=1 (ou --no-cache) force l'appel au LLM sans lire ni écrire le cache
+generation_cache = GenerationCache()
+USE_GENERATION_CACHE = os.environ.get("LLM_CACHE_BYPASS", "") != "1"
+
+# ==== Nouvelles tentatives des générations ====
+# Échéance d'une génération (secondes, attentes comprises) : au-delà, slide de secours
+LLM_DEADLINE = float(os.environ.get("LLM_DEADLINE", "300"))
+LLM_RETRY_BASE_DELAY = 1.0
+LLM_RETRY_MAX_DELAY = 20.0
+# Requête de couverture quand une génération dépasse ce percentile des latences
+# observées (ex: 0.95) ; vide = désactivé. Utile si OLLAMA_NUM_PARALLEL > 1.
+LLM_HEDGE_QUANTILE = float(os.environ["LLM_HEDGE_QUANTILE"]) if os.environ.get("LLM_HEDGE_QUANTILE") else None
+llm_latencies = LatencyWindow()
+# Délai avant le premier token en streaming (couverture des générations en streaming)
+llm_stream_latencies = LatencyWindow()
 
 # ==== Prompt multilingue avec instructions HTML STRICTES et exemples de code ====
 SYSTEM_PROMPT = {
@@ -213,88 +322,91 @@ def post_process_response(response: str) -> str:
     
     return response
 
-def check_ollama_status():
-    """Vérifier si Ollama est en cours d'exécution"""
-    try:
-        result = subprocess.run(
-            ["ollama", "list"],
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            timeout=10
-        )
-        return result.returncode == 0
-    except:
-        return False
-
-def generate_response(prompt: str, max_retries: int = 3, timeout: int = 300) -> str:
-    """Génération avec Ollama avec gestion des timeouts et retry"""
-    print(f"\n⏳ Génération avec Ollama (timeout: {timeout}s)...")
+def check_ollama_status(force: bool = False):
+    """Vérifier si Ollama est en cours d'exécution (résultat mis en cache par le client)"""
+    return ollama_client.is_available(force=force)
+
+def llm_retry_policy(max_retries: int, timeout: float, deadline: Optional[float] = None) -> RetryPolicy:
+    """Politique de nouvelle tentative d'une génération (voir retry_policy.py)"""
+    return RetryPolicy(max_attempts=max_retries, attempt_timeout=timeout,
+                       deadline=LLM_DEADLINE if deadline is None else deadline,
+                       base_delay=LLM_RETRY_BASE_DELAY, max_delay=LLM_RETRY_MAX_DELAY,
+                       hedge_quantile=LLM_HEDGE_QUANTILE)
+
+def generation_cache_enabled(use_cache: Optional[bool] = None) -> bool:
+    """Le cache est utilisé sauf bypass global ou explicite (use_cache=False)"""
+    return USE_GENERATION_CACHE if use_cache is None else use_cache
+
+def generate_response(prompt: str, max_retries: int = 3, timeout: int = 300, use_cache: Optional[bool] = None,
+                      deadline: Optional[float] = None) -> str:
+    """Génération avec Ollama : timeout par tentative, backoff à jitter et échéance globale.
+
+    `deadline` (défaut LLM_DEADLINE) borne la durée totale, attentes comprises ;
+    une erreur non récupérable (ex: modèle introuvable) n'est pas réessayée.
+    """
+    if generation_cache_enabled(use_cache):
+        cached = generation_cache.get(prompt, ollama_client.model)
+        if cached is not None:
+            print("♻️ Réponse trouvée dans le cache des générations")
+            tracer.event("llm_cache_hit")
+            with tracer.span("post_process"):
+                return post_process_response(cached)
+    
+    print(f"\n⏳ Génération avec Ollama (timeout: {timeout:.0f}s)...")
     
     if not check_ollama_status():
         return "❌ Ollama n'est pas en cours d'exécution. Démarrez-le avec 'ollama serve'"
     
-    for attempt in range(max_retries):
-        try:
-            print(f"🔄 Tentative {attempt + 1}/{max_retries}")
-            
-            # Utiliser un processus avec timeout plus long
-            process = subprocess.Popen(
-                ["ollama", "run", "llama3"],
-                stdin=subprocess.PIPE,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                text=True,
-                encoding='utf-8'
-            )
-            
-            # Envoyer le prompt et attendre la réponse
-            stdout, stderr = process.communicate(input=prompt, timeout=timeout)
-            
-            if process.returncode == 0 and stdout.strip():
-                print("✅ Génération réussie!")
-                # Post-traiter la réponse pour garantir le HTML
-                return post_process_response(stdout.strip())
-            else:
-                print(f"⚠️ Erreur dans la réponse: {stderr}")
-                if attempt < max_retries - 1:
-                    print(f"🔄 Nouvelle tentative dans 5 secondes...")
-                    time.sleep(5)
-                    
-        except subprocess.TimeoutExpired:
-            print(f"❌ Timeout ({timeout}s) - Tentative {attempt + 1}")
-            process.kill()
-            if attempt < max_retries - 1:
-                print("🔄 Nouvelle tentative avec timeout plus long...")
-                timeout += 60  # Augmenter le timeout
-                time.sleep(5)
-        except Exception as e:
-            print(f"❌ Erreur: {str(e)}")
-            if attempt < max_retries - 1:
-                time.sleep(5)
-    
-    return "❌ Échec de la génération après plusieurs tentatives"
+    policy = llm_retry_policy(max_retries, timeout, deadline)
+    try:
+        # Requêtes HTTP sur des connexions réutilisées du pool
+        output = run_with_retry(lambda t: ollama_client.generate(prompt, timeout=t), policy,
+                                accept=lambda out: bool(out.strip()), latencies=llm_latencies)
+    except RetryError as e:
+        tracer.event("llm_failed", reason=e.reason)
+        return f"❌ Échec de la génération après plusieurs tentatives ({e.reason})"
+    
+    print("✅ Génération réussie!")
+    if generation_cache_enabled(use_cache):
+        generation_cache.put(prompt, ollama_client.model, output.strip())
+    # Post-traiter la réponse pour garantir le HTML
+    with tracer.span("post_process"):
+        return post_process_response(output.strip())
+
+def summarize_context(context: str, sujet: str) -> str:
+    """Résumer le contexte RAG injecté dans le prompt (indépendant de la langue).
+
+    Le contexte de build_context tient déjà dans CONTEXT_TOKEN_BUDGET ; un
+    contexte fourni autrement est coupé au même budget.
+    """
+    context_summary = truncate_to_tokens(context, CONTEXT_TOKEN_BUDGET)
+    if not context_summary.strip():
+        context_summary = f"Connaissances générales sur {sujet}"
+    return context_summary
+
+def render_prompt(context_summary: str, sujet: str, niveau: str, current_topic: str, slide_number: int, lang: str = "fr") -> str:
+    """Remplir le SYSTEM_PROMPT d'une langue avec un contexte déjà résumé"""
+    with tracer.span("prompt_build", lang=lang):
+        return SYSTEM_PROMPT[lang].format(
+            sujet=sujet,
+            niveau=niveau,
+            current_topic=current_topic,
+            slide_number=slide_number,
+            context_summary=context_summary
+        )
 
 def build_optimized_prompt(context: str, sujet: str, niveau: str, current_topic: str, slide_number: int, lang: str = "fr") -> str:
     """Construire un prompt optimisé et plus court"""
     
     # Résumer le contexte si trop long
-    context_summary = context[:500] + "..." if len(context) > 500 else context
-    if not context_summary.strip():
-        context_summary = f"Connaissances générales sur {sujet}"
+    context_summary = summarize_context(context, sujet)
     
-    system_instruction = SYSTEM_PROMPT[lang].format(
-        sujet=sujet,
-        niveau=niveau,
-        current_topic=current_topic,
-        slide_number=slide_number,
-        context_summary=context_summary
-    )
+    system_instruction = render_prompt(context_summary, sujet, niveau, current_topic, slide_number, lang)
     
     return system_instruction
 
-def rag_query(query: str, sujet: str, niveau: str, plan: str, history: str, current_topic: str, slide_number: int, lang: str = "fr", top_k: int = 3) -> str:
-    """RAG query avec gestion d'erreur améliorée"""
-    
+def check_domain_files(sujet: str) -> Optional[str]:
+    """Vérifier le domaine et ses fichiers ; retourne un message d'erreur ou None"""
     if sujet not in AVAILABLE_DOMAINS:
         return f"❌ Domaine '{sujet}' non disponible. Disponibles : {', '.join(AVAILABLE_DOMAINS)}"
 
@@ -305,46 +417,181 @@ def rag_query(query: str, sujet: str, niveau: str, plan: str, history: str, curr
     if not os.path.exists(index_path):
         return f"❌ Index FAISS manquant: {index_path}. Exécutez build_faiss_index.py"
     
-    if not os.path.exists(docs_path):
+    if not (has_doc_store(docs_path) or os.path.exists(docs_path)):
         return f"❌ Documents manquants: {docs_path}. Exécutez build_faiss_index.py"
 
-    try:
-        # Charger l'index et les documents
-        index = faiss.read_index(index_path)
-        with open(docs_path, "r", encoding="utf-8") as f:
-            docs = json.load(f)
-
-        # Requête simplifiée
-        enhanced_query = f"{current_topic} {sujet}"
+    return None
+
+def search_domains(query_vectors, domains: List[str], top_k: int):
+    """Recherche dans un ou plusieurs domaines ; retourne (hits fusionnés par requête, latences en ms)"""
+    if len(domains) > 1 and FEDERATED_MODE == "combined" and os.path.exists(COMBINED_INDEX):
+        return retriever_registry.combined_search(query_vectors, top_k, domains)
+    # Un seul domaine : recherche directe, sans passer par le pool de threads
+    return retriever_registry.federated_search(domains, query_vectors, top_k)
+
+_relevance_thresholds: Optional[Dict[str, float]] = None
+
+def similarity_threshold(domain: str) -> float:
+    """Seuil de similarité cosinus d'un domaine (voir MIN_SIMILARITY)"""
+    global _relevance_thresholds
+    if os.environ.get("RAG_MIN_SIMILARITY"):
+        return float(os.environ["RAG_MIN_SIMILARITY"])
+    if _relevance_thresholds is None:
+        thresholds = {}
+        if os.path.exists(RELEVANCE_CALIBRATION):
+            with open(RELEVANCE_CALIBRATION, "r", encoding="utf-8") as f:
+                calibration = json.load(f)
+            # Les seuils dépendent de l'encodeur qui a produit les vecteurs
+            if calibration.get("model") == encoder_id(EMBEDDING_MODEL_NAME, EMBEDDING_BACKEND):
+                thresholds = {d: c["threshold"] for d, c in calibration.get("domains", {}).items()}
+            else:
+                print(f"⚠️ Calibration faite pour {calibration.get('model')}, seuil par défaut utilisé")
+        _relevance_thresholds = thresholds
+    return _relevance_thresholds.get(domain, MIN_SIMILARITY)
+
+def score_lexical_hits(query_vectors: np.ndarray, vector_results, lexical_results):
+    """Donner à chaque hit BM25 son score cosinus avec la requête ("score", comme les hits FAISS).
+
+    Un hit déjà retrouvé par FAISS reprend son score ; le texte des autres est
+    ré-encodé (vecteurs en général déjà dans le cache d'embeddings, écrits par
+    build_faiss_index) pour qu'ils passent le même seuil que les hits FAISS.
+    """
+    pending = []
+    for q, (vector_hits, lexical_hits) in enumerate(zip(vector_results, lexical_results)):
+        scores = {(hit["domain"], hit["id"]): hit["score"] for hit in vector_hits}
+        for hit in lexical_hits:
+            key = (hit["domain"], hit["id"])
+            if key in scores:
+                hit["score"] = scores[key]
+            else:
+                pending.append((q, hit))
+    if not pending:
+        return 0
+    vectors = embedding_cache.encode([hit["text"] for _, hit in pending], encode_queries)
+    vectors = vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+    for (q, hit), vector in zip(pending, vectors):
+        hit["score"] = float(vector @ query_vectors[q])
+    return len(pending)
+
+def select_hits(vector_hits, lexical_hits, top_k: int):
+    """Passages retenus pour une requête : hits FAISS et BM25 au-dessus du seuil, fusionnés (RRF).
+
+    Le seuil s'applique au score cosinus de chaque hit (voir score_lexical_hits) :
+    BM25 peut ajouter un passage manqué par FAISS, pas un passage hors sujet
+    qui n'aurait que des mots en commun avec la requête.
+    """
+    vector_hits = [hit for hit in vector_hits if hit["score"] > similarity_threshold(hit["domain"])]
+    lexical_hits = [hit for hit in lexical_hits if hit["score"] > similarity_threshold(hit["domain"])]
+    if not lexical_hits:
+        return vector_hits[:top_k]
+
+    by_key = {(hit["domain"], hit["id"]): hit for hit in lexical_hits + vector_hits}
+    fused = reciprocal_rank_fusion([
+        [(hit["domain"], hit["id"]) for hit in vector_hits],
+        [(hit["domain"], hit["id"]) for hit in lexical_hits],
+    ])
+    return [by_key[key] for key, _ in fused[:top_k]]
+
+def build_context(hits, sujet: str) -> str:
+    """Construire le contexte RAG à partir des passages retenus pour une requête.
+
+    Les passages (classés par pertinence) remplissent CONTEXT_TOKEN_BUDGET :
+    un passage qui ne tient plus est coupé au lieu d'évincer les suivants.
+    """
+    with tracer.span("context_pack", budget=CONTEXT_TOKEN_BUDGET) as span:
+        relevant_docs, stats = pack_passages(hits, CONTEXT_TOKEN_BUDGET)
+        span.update(stats)
+    
+    # Construire le contexte
+    return "\n---\n".join(relevant_docs) if relevant_docs else f"Utilise tes connaissances générales sur {sujet}"
+
+def retrieve_many(topics: List[str], sujet: str, top_k: int = 3, domains: Optional[List[str]] = None) -> List[str]:
+    """Contexte RAG de tous les topics d'un plan : un seul encodage batché et un seul appel FAISS.
+
+    `domains` (optionnel) élargit la recherche à plusieurs domaines, interrogés
+    en parallèle ; par défaut seul l'index de `sujet` est utilisé. Les topics
+    sans passage pertinent sont signalés avant toute génération.
+    """
+    if not topics:
+        return []
+    domains = domains or [sujet]
+
+    # Requêtes simplifiées
+    enhanced_queries = [f"{topic} {sujet}" for topic in topics]
+    for enhanced_query in enhanced_queries:
         print(f"🔍 Recherche pour: {enhanced_query}")
-        
-        # Recherche vectorielle
-        query_vector = model.encode([enhanced_query])
-        distances, indices = index.search(np.array(query_vector).astype("float32"), top_k)
-        
-        # Récupérer les documents pertinents
-        relevant_docs = []
-        for i, idx in enumerate(indices[0]):
-            if idx < len(docs) and distances[0][i] < 2.0:  # Seuil de pertinence élargi
-                relevant_docs.append(docs[idx][:400])  # Limiter la taille de chaque doc
-        
-        # Construire le contexte
-        context = "\n---\n".join(relevant_docs) if relevant_docs else f"Utilise tes connaissances générales sur {sujet}"
-        
-        # Construire le prompt optimisé
-        prompt = build_optimized_prompt(context, sujet, niveau, current_topic, slide_number, lang)
-        
-        # Générer la réponse
-        return generate_response(prompt, max_retries=2, timeout=180)
-        
+    
+    # Recherche vectorielle (requêtes encodées une seule fois pour tous les domaines)
+    # Sur-échantillonnage : le seuil, la fusion et le re-ranking choisissent ensuite les top_k
+    candidates = top_k * RETRIEVAL_CANDIDATES
+    with tracer.span("query_encode", queries=len(enhanced_queries)):
+        query_vectors = embedding_cache.encode(enhanced_queries, encode_queries)
+        # Vecteurs unitaires : le score d'un index produit scalaire est le cosinus
+        query_vectors = query_vectors / np.maximum(np.linalg.norm(query_vectors, axis=1, keepdims=True), 1e-12)
+    with tracer.span("faiss_search", domains=",".join(domains), queries=len(enhanced_queries)):
+        results, latencies = search_domains(query_vectors, domains, candidates)
+
+    # Recherche lexicale sur les topics (noms d'API exacts)
+    lexical_results = [[] for _ in topics]
+    if USE_HYBRID:
+        with tracer.span("bm25_search", domains=",".join(domains), queries=len(topics)) as span:
+            lexical_results = retriever_registry.lexical_search(domains, topics, candidates)
+        latencies["bm25"] = span["duration_ms"]
+        with tracer.span("bm25_score") as span:
+            span["encoded"] = score_lexical_hits(query_vectors, results, lexical_results)
+    if len(domains) > 1 or len(topics) > 1:
+        print("⏱️ Latence de recherche : " + ", ".join(f"{d}={ms:.1f}ms" for d, ms in latencies.items()))
+
+    selected = [select_hits(vector_hits, lexical_hits, candidates if USE_RERANK else top_k)
+                for vector_hits, lexical_hits in zip(results, lexical_results)]
+    if USE_RERANK:
+        reranker = get_reranker(RERANK_MODEL, RERANK_BATCH_SIZE, RERANK_MAX_LATENCY_MS)
+        with tracer.span("rerank", pairs=sum(len(hits) for hits in selected)):
+            selected = reranker.rerank_many(enhanced_queries, selected, top_k)
+
+    contexts = []
+    for topic, hits in zip(topics, selected):
+        if not hits:
+            print(f"⚠️ Aucun passage pertinent pour : {topic}")
+        contexts.append(build_context(hits, sujet))
+    return contexts
+
+def retrieve_context(sujet: str, current_topic: str, top_k: int = 3, domains: Optional[List[str]] = None) -> str:
+    """Recherche vectorielle et construction du contexte RAG pour un topic"""
+    return retrieve_many([current_topic], sujet, top_k, domains)[0]
+
+def check_domains(sujet: str, domains: Optional[List[str]] = None) -> Optional[str]:
+    """Vérifier les fichiers de tous les domaines interrogés"""
+    for domain in domains or [sujet]:
+        error = check_domain_files(domain)
+        if error:
+            return error
+    return None
+
+def rag_query(query: str, sujet: str, niveau: str, plan: str, history: str, current_topic: str, slide_number: int, lang: str = "fr", top_k: int = 3,
+              domains: Optional[List[str]] = None) -> str:
+    """RAG query avec gestion d'erreur améliorée"""
+    
+    error = check_domains(sujet, domains)
+    if error:
+        return error
+
+    try:
+        context = retrieve_context(sujet, current_topic, top_k, domains)
     except Exception as e:
         error_msg = f"❌ Erreur RAG: {str(e)}"
         print(error_msg)
         
-        # Fallback : générer sans contexte
+        # Fallback : générer sans contexte (seule la recherche est rattrapée ici ;
+        # les échecs du LLM sont déjà gérés par la politique de generate_response)
         print("🔄 Génération sans contexte RAG...")
-        fallback_prompt = build_optimized_prompt("", sujet, niveau, current_topic, slide_number, lang)
-        return generate_response(fallback_prompt, max_retries=1, timeout=120)
+        context = ""
+    
+    # Construire le prompt optimisé
+    prompt = build_optimized_prompt(context, sujet, niveau, current_topic, slide_number, lang)
+    
+    # Générer la réponse
+    return generate_response(prompt, max_retries=2, timeout=180)
 
 def generate_fallback_slide(current_topic: str, slide_number: int, sujet: str, niveau: str, lang: str = "fr") -> str:
     """Génération de slide de secours sans LLM"""
@@ -504,6 +751,477 @@ def extract_example_code_only(text: str) -> str:
         return match.group(0).strip()
     return "<pre><code>// Pas d'exemple de code disponible</code></pre>"
 
+# ==== Génération en streaming ====
+EXPLANATION_HEADER = r'\*\*(?:Explication orale|Spoken explanation|Explicación oral|Spiegazione orale)\s*\*\*'
+SUMMARY_HEADER = r'\*\*(?:Résumé HTML|HTML summary|Resumen HTML|Riepilogo HTML)\*\*'
+
+class SlideStreamParser:
+    """Parseur incrémental : émet chaque section dès qu'elle est fermée.
+
+    Sections émises (une seule fois chacune) :
+    - "explanation" : dès que la section suivante commence (ligne débutant par **)
+    - "summary" : dès que le </ul> du résumé HTML est reçu
+    - "code" : dès que le premier </code></pre> est reçu
+    Le contenu est extrait avec les mêmes fonctions que le mode bloquant.
+    """
+
+    _explanation_closed = re.compile(EXPLANATION_HEADER + r'\s*:?\s*.+?\n\s*\*\*', re.DOTALL | re.IGNORECASE)
+    _summary_closed = re.compile(SUMMARY_HEADER + r'\s*:?\s*<ul>.*?</ul>', re.DOTALL | re.IGNORECASE)
+    _code_closed = re.compile(r'<pre><code.*?>.*?</code></pre>', re.DOTALL | re.IGNORECASE)
+
+    def __init__(self):
+        self.buffer = ""
+        self.emitted = {}
+
+    def _check(self, section, pattern, extractor):
+        if section not in self.emitted and pattern.search(self.buffer):
+            self.emitted[section] = extractor(self.buffer)
+            return [(section, self.emitted[section])]
+        return []
+
+    def feed(self, token: str):
+        """Ajouter un token ; retourne la liste des sections nouvellement fermées"""
+        self.buffer += token
+        events = []
+        # Ne relancer les regex que sur les tokens qui peuvent fermer une section
+        if "*" in token:
+            events += self._check("explanation", self._explanation_closed, extract_explanation_only)
+        if ">" in token:
+            events += self._check("summary", self._summary_closed, extract_summary_only)
+            events += self._check("code", self._code_closed, extract_example_code_only)
+        return events
+
+    def close(self):
+        """Fin du flux : post-traiter le texte complet et émettre les sections restantes"""
+        self.buffer = post_process_response(self.buffer.strip())
+        events = []
+        for section, extractor in (("explanation", extract_explanation_only),
+                                   ("summary", extract_summary_only),
+                                   ("code", extract_example_code_only)):
+            if section not in self.emitted:
+                self.emitted[section] = extractor(self.buffer)
+                events.append((section, self.emitted[section]))
+        return events
+
+def open_stream(prompt: str, timeout: float):
+    """Ouvrir un stream Ollama et attendre son premier token ; retourne (premier token, suite du stream).
+
+    Le premier token vaut "" si le stream se termine sans contenu (réponse vide).
+    """
+    stream = ollama_client.generate_stream(prompt, timeout=timeout)
+    for token in stream:
+        if token:
+            return token, stream
+    return "", stream
+
+def generate_response_stream(prompt: str, max_retries: int = 3, timeout: int = 300, use_cache: Optional[bool] = None,
+                             deadline: Optional[float] = None):
+    """Génération en streaming : produit des événements (type, valeur).
+
+    Types : "token" (morceau brut), "explanation", "summary", "code" (sections
+    fermées) puis "done" avec le texte complet post-traité, ou "error".
+    L'ouverture du stream jusqu'au premier token suit la même politique que
+    generate_response (run_with_retry : backoff, timeout réduit au temps
+    restant, couverture) ; une fois des tokens transmis, il n'y a plus de
+    nouvelle tentative et le stream est coupé à l'échéance. Une réponse en
+    cache est rejouée comme un unique token.
+    """
+    if generation_cache_enabled(use_cache):
+        cached = generation_cache.get(prompt, ollama_client.model)
+        if cached is not None:
+            print("♻️ Réponse trouvée dans le cache des générations")
+            parser = SlideStreamParser()
+            yield ("token", cached)
+            yield from parser.feed(cached)
+            yield from parser.close()
+            yield ("done", parser.buffer)
+            return
+    
+    print(f"\n⏳ Génération en streaming avec Ollama (timeout: {timeout}s)...")
+    
+    if not check_ollama_status():
+        yield ("error", "❌ Ollama n'est pas en cours d'exécution. Démarrez-le avec 'ollama serve'")
+        return
+    
+    policy = llm_retry_policy(max_retries, timeout, deadline)
+    expires = time.monotonic() + policy.deadline
+    try:
+        first_token, stream = run_with_retry(lambda t: open_stream(prompt, t), policy,
+                                             accept=lambda opened: bool(opened[0]),
+                                             latencies=llm_stream_latencies,
+                                             discard=lambda opened: opened[1].close())
+    except RetryError as e:
+        tracer.event("llm_failed", reason=e.reason)
+        yield ("error", f"❌ Échec de la génération après plusieurs tentatives ({e.reason})")
+        return
+    
+    parser = SlideStreamParser()
+    try:
+        with tracer.span("llm_stream"):
+            for token in itertools.chain([first_token], stream):
+                yield ("token", token)
+                for event in parser.feed(token):
+                    yield event
+                # Le timeout de lecture borne l'attente entre deux morceaux, pas la durée totale
+                if time.monotonic() > expires:
+                    tracer.event("llm_deadline", deadline=policy.deadline, streamed=True)
+                    yield ("error", f"❌ Échéance de {policy.deadline:.0f}s atteinte pendant le streaming")
+                    return
+    except Exception as e:
+        # Des tokens ont déjà été transmis : pas de nouvelle tentative
+        print(f"❌ Erreur: {str(e)}")
+        tracer.event("llm_error", error=type(e).__name__, kind=classify_error(e), streamed=True)
+        yield ("error", "❌ Échec de la génération pendant le streaming")
+        return
+    finally:
+        stream.close()
+    
+    if generation_cache_enabled(use_cache):
+        generation_cache.put(prompt, ollama_client.model, parser.buffer.strip())
+    for event in parser.close():
+        yield event
+    print("✅ Génération réussie!")
+    yield ("done", parser.buffer)
+
+def rag_query_stream(sujet: str, niveau: str, current_topic: str, slide_number: int, lang: str = "fr", top_k: int = 3,
+                     domains: Optional[List[str]] = None):
+    """Version streaming de rag_query (mêmes événements que generate_response_stream)"""
+    error = check_domains(sujet, domains)
+    if error:
+        yield ("error", error)
+        return
+    
+    try:
+        context = retrieve_context(sujet, current_topic, top_k, domains)
+    except Exception as e:
+        print(f"❌ Erreur RAG: {str(e)}")
+        print("🔄 Génération sans contexte RAG...")
+        context = ""
+    
+    prompt = build_optimized_prompt(context, sujet, niveau, current_topic, slide_number, lang)
+    yield from generate_response_stream(prompt, max_retries=2, timeout=180)
+
+# ==== Génération d'une formation complète en mode batch ====
+# Nombre de slides générées en parallèle (Ollama sert OLLAMA_NUM_PARALLEL requêtes simultanées)
+DEFAULT_CONCURRENCY = int(os.environ.get("OLLAMA_NUM_PARALLEL", "2"))
+DEFAULT_SLIDE_TIMEOUT = 600
+
+def build_slide_entries(response_raw: str, slide_number: int, title: str):
+    """Extraire les entrées 'Explanation Output' et 'Summary Output' d'une slide"""
+    spoken_entry = {
+        "id": slide_number,
+        "title": title,
+        "script": extract_explanation_only(response_raw)
+    }
+    slide_entry = {
+        "id": slide_number,
+        "title": title,
+        "summary": extract_summary_only(response_raw),
+        "example_code": extract_example_code_only(response_raw)
+    }
+    return spoken_entry, slide_entry
+
+def save_course_outputs(spoken_data, slides_data, lang: str, sujet: str):
+    """Écrire les fichiers <lang>-explanation-<sujet>.json et <lang>-summary-code-<sujet>.json"""
+    save_slides_to_json(spoken_data, "Explanation Output/"+lang+"-explanation-"+sujet+".json")
+    save_slides_to_json(slides_data, "Summary Output/"+lang+"-summary-code-"+sujet+".json")
+
+def run_slides_concurrently(tasks, slide_fn, fallback_fn, concurrency: int, slide_timeout: float):
+    """Exécuter slide_fn(index, deadline) pour chaque tâche avec au plus `concurrency` slides en cours.
+
+    Les résultats sont retournés dans l'ordre des tâches. Une slide qui dépasse
+    `slide_timeout` secondes (mesurées depuis son démarrage, pas sa soumission)
+    ou qui lève une exception est remplacée par fallback_fn(index). `deadline`
+    (time.monotonic()) est transmis à slide_fn pour que l'appel au LLM s'arrête
+    lui-même : une slide abandonnée ne garde pas son thread au-delà du timeout.
+    """
+    results = [None] * len(tasks)
+    started = {}
+
+    def worker(i):
+        started[i] = time.monotonic()
+        return slide_fn(i, started[i] + slide_timeout)
+
+    pool = ThreadPoolExecutor(max_workers=max(1, concurrency))
+    futures = {pool.submit(worker, i): i for i in range(len(tasks))}
+    pending = set(futures)
+    try:
+        while pending:
+            done, pending = wait(pending, timeout=1.0, return_when=FIRST_COMPLETED)
+            for future in done:
+                i = futures[future]
+                try:
+                    results[i] = future.result()
+                except Exception as e:
+                    print(f"❌ Slide {i + 1} : erreur {str(e)}")
+                    results[i] = fallback_fn(i)
+            now = time.monotonic()
+            for future in list(pending):
+                i = futures[future]
+                if i in started and now - started[i] > slide_timeout:
+                    print(f"❌ Slide {i + 1} : timeout ({slide_timeout}s), slide de secours utilisée")
+                    results[i] = fallback_fn(i)
+                    pending.discard(future)
+    finally:
+        # Ne pas attendre les slides abandonnées après timeout ; annuler à la main
+        # celles qui n'ont pas démarré (cancel_futures n'existe qu'à partir de Python 3.9)
+        for future in pending:
+            future.cancel()
+        pool.shutdown(wait=False)
+    return results
+
+def generate_course(plan_parts, lang: str, niveau: str, sujet: str,
+                    concurrency: int = DEFAULT_CONCURRENCY, slide_timeout: float = DEFAULT_SLIDE_TIMEOUT,
+                    domains: Optional[List[str]] = None):
+    """Générer toutes les slides d'un plan sans interaction et écrire les fichiers de sortie"""
+    error = check_domains(sujet, domains)
+    if error:
+        print(error)
+        return []
+
+    start = time.monotonic()
+    context_summaries = retrieve_plan_contexts(plan_parts, sujet, domains)
+    print(f"\n🚀 Génération de {len(plan_parts)} slides (concurrence: {concurrency}, timeout: {slide_timeout}s)")
+
+    responses = run_slides_concurrently(
+        plan_parts,
+        lambda i, deadline: generate_slide_from_context(context_summaries[i], plan_parts[i], i + 1, sujet, niveau, lang,
+                                                        deadline),
+        lambda i: generate_fallback_slide(plan_parts[i], i + 1, sujet, niveau, lang),
+        concurrency,
+        slide_timeout
+    )
+
+    spoken_data, slides_data = [], []
+    for i, response_raw in enumerate(responses):
+        spoken_entry, slide_entry = build_slide_entries(response_raw, i + 1, plan_parts[i])
+        spoken_data.append(spoken_entry)
+        slides_data.append(slide_entry)
+    save_course_outputs(spoken_data, slides_data, lang, sujet)
+
+    print(f"⏱️ {len(plan_parts)} slides générées en {time.monotonic() - start:.1f}s")
+    return responses
+
+def generate_course_stream(plan_parts, lang: str, niveau: str, sujet: str, domains: Optional[List[str]] = None):
+    """Générer les slides une par une en streaming (rag_query_stream).
+
+    Chaque section est affichée dès qu'elle est fermée, sans attendre la fin de
+    la slide ; le temps jusqu'à la première explication est affiché par slide.
+    """
+    error = check_domains(sujet, domains)
+    if error:
+        print(error)
+        return []
+
+    start = time.monotonic()
+    print(f"\n📡 Génération de {len(plan_parts)} slides en streaming")
+    responses = []
+    for i, part in enumerate(plan_parts):
+        slide_start = time.monotonic()
+        response_raw = None
+        with tracer.slide(i + 1, part, lang=lang):
+            for kind, value in rag_query_stream(sujet, niveau, part, i + 1, lang, domains=domains):
+                if kind == "explanation":
+                    print(f"\n🗣️ Slide {i + 1} - explication ({time.monotonic() - slide_start:.1f}s) :\n{value}")
+                elif kind == "summary":
+                    print(f"\n📝 Slide {i + 1} - résumé :\n{value}")
+                elif kind == "code":
+                    print(f"\n💻 Slide {i + 1} - code :\n{value}")
+                elif kind == "done":
+                    response_raw = value
+                elif kind == "error":
+                    print(value)
+            if response_raw is None:
+                print(f"🔄 Slide {i + 1} [{lang}]: génération de slide de secours...")
+                tracer.event("fallback_slide")
+                response_raw = generate_fallback_slide(part, i + 1, sujet, niveau, lang)
+        responses.append(response_raw)
+
+    spoken_data, slides_data = [], []
+    for i, response_raw in enumerate(responses):
+        spoken_entry, slide_entry = build_slide_entries(response_raw, i + 1, plan_parts[i])
+        spoken_data.append(spoken_entry)
+        slides_data.append(slide_entry)
+    save_course_outputs(spoken_data, slides_data, lang, sujet)
+
+    print(f"⏱️ {len(plan_parts)} slides générées en {time.monotonic() - start:.1f}s")
+    return responses
+
+def retrieve_plan_contexts(plan_parts, sujet: str, domains: Optional[List[str]] = None):
+    """Contextes résumés de toutes les slides, récupérés avant toute génération"""
+    try:
+        contexts = retrieve_many(plan_parts, sujet, domains=domains)
+    except Exception as e:
+        print(f"❌ Erreur RAG: {str(e)}")
+        print("🔄 Génération sans contexte RAG...")
+        contexts = [""] * len(plan_parts)
+    return [summarize_context(context, sujet) for context in contexts]
+
+def generate_slide_from_context(context_summary: str, current_part: str, slide_number: int,
+                                sujet: str, niveau: str, lang: str, deadline: Optional[float] = None) -> str:
+    """Générer une slide dans une langue à partir d'un contexte déjà récupéré.
+
+    `deadline` (time.monotonic(), optionnel) : échéance de la slide, appliquée à l'appel au LLM.
+    """
+    with tracer.slide(slide_number, current_part, lang=lang):
+        prompt = render_prompt(context_summary, sujet, niveau, current_part, slide_number, lang)
+        remaining = None if deadline is None else min(LLM_DEADLINE, max(0.0, deadline - time.monotonic()))
+        timeout = 180 if remaining is None else min(180, max(1, remaining))
+        response_raw = generate_response(prompt, max_retries=2, timeout=timeout, deadline=remaining)
+        if "❌" in response_raw and "Échec" in response_raw:
+            print(f"🔄 Slide {slide_number} [{lang}]: génération de slide de secours...")
+            tracer.event("fallback_slide")
+            response_raw = generate_fallback_slide(current_part, slide_number, sujet, niveau, lang)
+    return response_raw
+
+def generate_course_multilang(plan_parts, langs, niveau: str, sujet: str,
+                              concurrency: int = DEFAULT_CONCURRENCY, slide_timeout: float = DEFAULT_SLIDE_TIMEOUT,
+                              domains: Optional[List[str]] = None):
+    """Générer une formation dans plusieurs langues en une seule passe.
+
+    La recherche et le résumé du contexte sont faits une seule fois par slide ;
+    seule la génération est lancée par langue, en parallèle. Retourne le temps
+    (mur) passé par langue, du démarrage de sa première slide à la fin de la dernière.
+    """
+    error = check_domains(sujet, domains)
+    if error:
+        print(error)
+        return {}
+
+    print(f"\n🌍 Génération de {len(plan_parts)} slides en {len(langs)} langues ({', '.join(langs)})")
+    start = time.monotonic()
+
+    # 1. Contexte commun à toutes les langues (une seule recherche pour tout le plan)
+    context_summaries = retrieve_plan_contexts(plan_parts, sujet, domains)
+    retrieval_time = time.monotonic() - start
+
+    # 2. Génération (slide, langue) en parallèle
+    tasks = [(i, lang) for lang in langs for i in range(len(plan_parts))]
+    spans = {}
+    spans_lock = threading.Lock()
+
+    def run_task(t, deadline):
+        i, lang = tasks[t]
+        task_start = time.monotonic()
+        try:
+            return generate_slide_from_context(context_summaries[i], plan_parts[i], i + 1, sujet, niveau, lang, deadline)
+        finally:
+            task_end = time.monotonic()
+            with spans_lock:
+                first, last = spans.get(lang, (task_start, task_start))
+                spans[lang] = (min(first, task_start), max(last, task_end))
+
+    responses = run_slides_concurrently(
+        tasks,
+        run_task,
+        lambda t: generate_fallback_slide(plan_parts[tasks[t][0]], tasks[t][0] + 1, sujet, niveau, tasks[t][1]),
+        concurrency,
+        slide_timeout
+    )
+
+    # 3. Fichiers de sortie par langue
+    for lang in langs:
+        spoken_data, slides_data = [], []
+        for t, (i, task_lang) in enumerate(tasks):
+            if task_lang != lang:
+                continue
+            spoken_entry, slide_entry = build_slide_entries(responses[t], i + 1, plan_parts[i])
+            spoken_data.append(spoken_entry)
+            slides_data.append(slide_entry)
+        save_course_outputs(spoken_data, slides_data, lang, sujet)
+
+    wall_times = {lang: round(spans[lang][1] - spans[lang][0], 2) for lang in langs if lang in spans}
+    print(f"\n⏱️ Recherche du contexte : {retrieval_time:.2f}s ({len(plan_parts)} slides, une fois pour toutes les langues)")
+    for lang, seconds in wall_times.items():
+        print(f"⏱️ [{lang}] {seconds:.1f}s")
+    print(f"⏱️ Total : {time.monotonic() - start:.1f}s")
+    return wall_times
+
+def parse_plan(text: str):
+    """Découper un plan : une partie par ligne, ou une seule ligne séparée par des virgules"""
+    lines = [line.strip() for line in text.splitlines() if line.strip()]
+    if len(lines) == 1 and "," in lines[0]:
+        return [p.strip() for p in lines[0].split(",") if p.strip()]
+    return lines
+
+def parse_args():
+    """Options du mode batch (sans options : mode interactif)"""
+    parser = argparse.ArgumentParser(description="Génération de formations avec RAG & Ollama")
+    parser.add_argument("--plan", help="Plan de la formation (parties séparées par des virgules)")
+    parser.add_argument("--plan-file", help="Fichier texte contenant une partie du plan par ligne")
+    parser.add_argument("--lang", default="fr",
+                        help="Langue (fr/en/es/it), liste séparée par des virgules, ou 'all'")
+    parser.add_argument("--sujet", choices=list(AVAILABLE_DOMAINS))
+    parser.add_argument("--niveau", default="débutant")
+    parser.add_argument("--domains",
+                        help="Domaines interrogés, séparés par des virgules (défaut : --sujet seul), ex: jee,angular")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="Ignorer le cache des générations (équivaut à LLM_CACHE_BYPASS=1)")
+    parser.add_argument("--warm-up", action="store_true",
+                        help="Charger le modèle d'embedding et les index en tâche de fond dès le démarrage")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY,
+                        help="Nombre maximal de slides générées en parallèle")
+    parser.add_argument("--slide-timeout", type=float, default=DEFAULT_SLIDE_TIMEOUT,
+                        help="Durée maximale d'une slide (secondes) avant slide de secours")
+    parser.add_argument("--stream", action="store_true",
+                        help="Générer les slides une par une en streaming (une seule langue)")
+    parser.add_argument("--trace",
+                        help="Fichier JSONL où écrire les temps de chaque étape (équivaut à RAG_TRACE_FILE)")
+    return parser.parse_args()
+
+def batch_main(args):
+    """Point d'entrée non interactif"""
+    global USE_GENERATION_CACHE
+    if args.no_cache:
+        USE_GENERATION_CACHE = False
+
+    if args.plan_file:
+        with open(args.plan_file, "r", encoding="utf-8") as f:
+            plan_parts = parse_plan(f.read())
+    else:
+        plan_parts = parse_plan(args.plan or "")
+
+    if not plan_parts or not args.sujet:
+        print("❌ Le mode batch nécessite --sujet et un plan (--plan ou --plan-file).")
+        return
+
+    langs = list(SYSTEM_PROMPT) if args.lang == "all" else [l.strip() for l in args.lang.split(",") if l.strip()]
+    unknown = [l for l in langs if l not in SYSTEM_PROMPT]
+    if unknown or not langs:
+        print(f"❌ Langue(s) non disponible(s) : {', '.join(unknown)}. Disponibles : {', '.join(SYSTEM_PROMPT)}")
+        return
+    if args.stream and len(langs) > 1:
+        print("❌ --stream ne prend en charge qu'une seule langue.")
+        return
+
+    domains = [d.strip() for d in args.domains.split(",") if d.strip()] if args.domains else None
+    unknown = [d for d in domains or [] if d not in AVAILABLE_DOMAINS]
+    if unknown:
+        print(f"❌ Domaine(s) non disponible(s) : {', '.join(unknown)}. Disponibles : {', '.join(AVAILABLE_DOMAINS)}")
+        return
+
+    if args.warm_up:
+        # Le chargement du modèle se fait pendant la vérification d'Ollama
+        threading.Thread(target=warm_up, args=(domains or [args.sujet],), daemon=True).start()
+
+    if not check_ollama_status():
+        print("❌ Ollama n'est pas accessible. Assurez-vous qu'il est démarré avec 'ollama serve'")
+        return
+
+    if args.stream:
+        generate_course_stream(plan_parts, langs[0], args.niveau, args.sujet, domains=domains)
+    elif len(langs) > 1:
+        generate_course_multilang(plan_parts, langs, args.niveau, args.sujet,
+                                  concurrency=args.concurrency, slide_timeout=args.slide_timeout, domains=domains)
+    else:
+        generate_course(plan_parts, langs[0], args.niveau, args.sujet,
+                        concurrency=args.concurrency, slide_timeout=args.slide_timeout, domains=domains)
+    print(f"🗂️ Cache des index : {retriever_registry.get_stats()}")
+    print(f"♻️ Cache des générations : {generation_cache.get_stats()}")
+    if USE_RERANK:
+        print(f"🎯 Re-ranking : {get_reranker(RERANK_MODEL, RERANK_BATCH_SIZE, RERANK_MAX_LATENCY_MS).get_stats()}")
+    tracer.print_summary()
+
 # ==== Interface terminal améliorée ====
 def main():
     print("\n📚 Formation interactive multilangue avec RAG & Ollama (LLaMA3)")
@@ -574,21 +1292,23 @@ def main():
         # Générer la slide
         question = f"Expliquer {current_part} pour {niveau} niveau en {sujet}"
         
-        response_raw = rag_query(
-            query=question,
-            sujet=sujet,
-            niveau=niveau,
-            plan=plan_input,
-            history=history,
-            current_topic=current_part,
-            slide_number=slide_number,
-            lang=lang
-        )
-        
-        # Vérifier si la génération a échoué
-        if "❌" in response_raw and "Échec" in response_raw:
-            print("🔄 Génération de slide de secours...")
-            response_raw = generate_fallback_slide(current_part, slide_number, sujet, niveau, lang)
+        with tracer.slide(slide_number, current_part, lang=lang):
+            response_raw = rag_query(
+                query=question,
+                sujet=sujet,
+                niveau=niveau,
+                plan=plan_input,
+                history=history,
+                current_topic=current_part,
+                slide_number=slide_number,
+                lang=lang
+            )
+            
+            # Vérifier si la génération a échoué
+            if "❌" in response_raw and "Échec" in response_raw:
+                print("🔄 Génération de slide de secours...")
+                tracer.event("fallback_slide")
+                response_raw = generate_fallback_slide(current_part, slide_number, sujet, niveau, lang)
         
         response = f"🟩 Slide {slide_number}: {current_part}\n\n{response_raw.strip()}"
         print("\n📘 Réponse générée :\n")
@@ -597,22 +1317,9 @@ def main():
 
         # Ajouter à l'historique
         history += f"\n\n--- SLIDE {slide_number}: {current_part} ---\n{response_raw.strip()}\n"
-        explanation_only = extract_explanation_only(response_raw)
-        spoken_data.append({
-            "id": slide_number,
-            "title": current_part,
-            "script": explanation_only
-        })
-
-        summary_only = extract_summary_only(response_raw)
-        example_code_only = extract_example_code_only(response_raw)
-
-        slides_data.append({
-            "id": slide_number,
-            "title": current_part,
-            "summary": summary_only,
-            "example_code": example_code_only
-        })
+        spoken_entry, slide_entry = build_slide_entries(response_raw, slide_number, current_part)
+        spoken_data.append(spoken_entry)
+        slides_data.append(slide_entry)
 
         slide_number += 1
         current_part_index += 1
@@ -629,15 +1336,25 @@ def main():
                 break
         else:
             print("✅ Toutes les parties du plan ont été traitées.")
-    save_slides_to_json(spoken_data,"Explanation Output/"+lang+"-explanation-"+sujet+".json")
-    save_slides_to_json(slides_data, "Summary Output/"+lang+"-summary-code-"+sujet+".json")
+    save_course_outputs(spoken_data, slides_data, lang, sujet)
 
     print("\n✅ Fin de la génération complète de la formation.")
     print(f"📊 Résumé : {slide_number - 1} slides générées sur {len(plan_parts)} parties planifiées.")
+    print(f"🗂️ Cache des index : {retriever_registry.get_stats()}")
+    print(f"♻️ Cache des générations : {generation_cache.get_stats()}")
+    if USE_RERANK:
+        print(f"🎯 Re-ranking : {get_reranker(RERANK_MODEL, RERANK_BATCH_SIZE, RERANK_MAX_LATENCY_MS).get_stats()}")
+    tracer.print_summary()
 
 if __name__ == "__main__":
     try:
-        main()
+        cli_args = parse_args()
+        if cli_args.trace:
+            tracer.configure(cli_args.trace)
+        if cli_args.plan or cli_args.plan_file:
+            batch_main(cli_args)
+        else:
+            main()
     except KeyboardInterrupt:
         print("\n✅ Programme interrompu par l'utilisateur.")
     except Exception as e:
@@ -0,0 +1,136 @@
+# asset_cache.py
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Dict, Optional
+
+DEFAULT_ASSET_DIR = "asset_cache"
+DEFAULT_MAX_BYTES = 2 * 1024 ** 3  # 2 Go
+
+
+def normalize_description(text: str) -> str:
+    """Normaliser une description avant calcul de la clé (casse, espaces multiples)"""
+    return " ".join(text.split()).lower()
+
+
+class AssetCache:
+    """Cache disque des images et diagrammes, adressé par le contenu.
+
+    La clé est le hash SHA-256 du type d'asset, du backend, de la
+    description normalisée et des paramètres de génération : une même
+    description, dans une autre formation ou lors d'une relance, réutilise
+    le fichier existant. Les fichiers sont rangés sous
+    <directory>/<2 premiers caractères>/<clé><extension> et un index SQLite
+    garde leur taille et leur dernière utilisation ; au-delà de `max_bytes`
+    les moins récemment utilisés sont supprimés.
+    """
+
+    def __init__(self, directory: str = DEFAULT_ASSET_DIR, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            os.makedirs(self.directory, exist_ok=True)
+            self._conn = sqlite3.connect(os.path.join(self.directory, "assets.sqlite"), check_same_thread=False)
+            self._conn.execute(
+                """CREATE TABLE IF NOT EXISTS assets (
+                    key TEXT PRIMARY KEY,
+                    path TEXT NOT NULL,
+                    kind TEXT NOT NULL,
+                    backend TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_used REAL NOT NULL
+                )"""
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_assets_last_used ON assets(last_used)")
+            self._conn.commit()
+        return self._conn
+
+    @staticmethod
+    def make_key(kind: str, backend: str, description: str, params: Optional[Dict] = None) -> str:
+        """Clé de cache : hash du type, du backend, de la description normalisée et des paramètres"""
+        payload = json.dumps({"kind": kind, "backend": backend, "params": params or {},
+                              "description": normalize_description(description)},
+                             sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def path_for(self, key: str, ext: str) -> str:
+        """Emplacement du fichier d'un asset"""
+        return os.path.join(self.directory, key[:2], key + ext)
+
+    def staging_path(self, ext: str) -> str:
+        """Fichier temporaire où générer un asset avant de l'ajouter au cache"""
+        directory = os.path.join(self.directory, "tmp")
+        os.makedirs(directory, exist_ok=True)
+        return os.path.join(directory, uuid.uuid4().hex + ext)
+
+    def get(self, key: str) -> Optional[str]:
+        """Chemin de l'asset en cache, ou None (absent ou fichier supprimé)"""
+        with self._lock:
+            conn = self._connection()
+            row = conn.execute("SELECT path FROM assets WHERE key = ?", (key,)).fetchone()
+            if row is None or not os.path.exists(row[0]):
+                if row is not None:
+                    conn.execute("DELETE FROM assets WHERE key = ?", (key,))
+                    conn.commit()
+                self.stats["misses"] += 1
+                return None
+            conn.execute("UPDATE assets SET last_used = ? WHERE key = ?", (time.time(), key))
+            conn.commit()
+            self.stats["hits"] += 1
+            return row[0]
+
+    def put(self, key: str, source_path: str, ext: str, kind: str, backend: str) -> str:
+        """Déplacer un fichier généré dans le cache puis appliquer l'éviction ; retourne son chemin"""
+        path = self.path_for(key, ext)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(source_path, path)
+        now = time.time()
+        with self._lock:
+            conn = self._connection()
+            conn.execute(
+                "INSERT OR REPLACE INTO assets (key, path, kind, backend, size, created_at, last_used) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, path, kind, backend, os.path.getsize(path), now, now)
+            )
+            self._evict(conn, keep=key)
+            conn.commit()
+        return path
+
+    def put_text(self, key: str, text: str, ext: str, kind: str, backend: str) -> str:
+        """Ajouter un asset texte (diagramme Mermaid)"""
+        staging = self.staging_path(ext)
+        with open(staging, "w", encoding="utf-8") as f:
+            f.write(text)
+        return self.put(key, staging, ext, kind, backend)
+
+    def _evict(self, conn: sqlite3.Connection, keep: str):
+        """Supprimer les assets les moins récemment utilisés au-delà de max_bytes (sous verrou)"""
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM assets").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for key, path, size in conn.execute(
+                "SELECT key, path, size FROM assets WHERE key != ? ORDER BY last_used ASC", (keep,)).fetchall():
+            if total <= self.max_bytes:
+                break
+            if os.path.exists(path):
+                os.remove(path)
+            conn.execute("DELETE FROM assets WHERE key = ?", (key,))
+            total -= size
+            self.stats["evictions"] += 1
+
+    def get_stats(self) -> Dict[str, int]:
+        """Compteurs hits / misses / evictions, nombre d'assets et taille totale"""
+        with self._lock:
+            entries, size = self._connection().execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM assets").fetchone()
+            return dict(self.stats, entries=entries, bytes=size)
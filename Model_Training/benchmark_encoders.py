@@ -0,0 +1,82 @@
+# benchmark_encoders.py
+# Compare les backends d'encodage (torch, torch-int8, onnx, onnx-int8) sur les
+# corpus indexés : débit en phrases/seconde et parité des k plus proches
+# voisins avec le modèle PyTorch de référence.
+# Usage : python Model_Training/benchmark_encoders.py --backends torch,onnx,onnx-int8
+import argparse
+import json
+import random
+import time
+
+from doc_store import DocStore, has_doc_store
+from encoder import ENCODER_BACKENDS, check_parity, load_encoder
+from Llama3_model import AVAILABLE_DOMAINS, EMBEDDING_MODEL_NAME
+
+def load_corpus(sujet: str, samples: int, seed: int = 0):
+    """Échantillon de passages d'un domaine et requêtes dérivées (première ligne du passage)"""
+    docs_path = AVAILABLE_DOMAINS[sujet]["docs"]
+    if has_doc_store(docs_path):
+        docs = [d for d in DocStore(docs_path) if d]
+    else:
+        with open(docs_path, "r", encoding="utf-8") as f:
+            docs = [d for d in json.load(f) if d]
+    random.Random(seed).shuffle(docs)
+    texts = docs[:samples]
+    queries = [t.strip().splitlines()[0][:120] for t in texts[:max(1, samples // 8)]]
+    return texts, queries
+
+def throughput(model, texts, batch_size: int) -> float:
+    """Phrases encodées par seconde (après un batch de chauffe)"""
+    model.encode(texts[:batch_size], batch_size=batch_size)
+    start = time.perf_counter()
+    model.encode(texts, batch_size=batch_size)
+    return len(texts) / (time.perf_counter() - start)
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark des backends d'encodage")
+    parser.add_argument("--backends", default=",".join(ENCODER_BACKENDS),
+                        help="Backends à comparer, séparés par des virgules (torch est la référence)")
+    parser.add_argument("--domains", default=",".join(AVAILABLE_DOMAINS))
+    parser.add_argument("--samples", type=int, default=512, help="Passages encodés par domaine")
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--k", type=int, default=5, help="Nombre de voisins comparés pour la parité")
+    parser.add_argument("--output", default="encoder_benchmark.json")
+    args = parser.parse_args()
+
+    backends = [b.strip() for b in args.backends.split(",") if b.strip()]
+    domains = [d.strip() for d in args.domains.split(",") if d.strip()]
+
+    print(f"🧠 Chargement du modèle de référence (torch)...")
+    reference = load_encoder(EMBEDDING_MODEL_NAME, "torch")
+    models = {"torch": reference}
+    for backend in backends:
+        if backend in models:
+            continue
+        try:
+            print(f"🧠 Chargement du backend {backend}...")
+            models[backend] = load_encoder(EMBEDDING_MODEL_NAME, backend)
+        except Exception as e:
+            print(f"❌ Backend {backend} indisponible : {str(e)}")
+
+    results = []
+    for sujet in domains:
+        texts, queries = load_corpus(sujet, args.samples)
+        print(f"\n📚 {sujet} : {len(texts)} passages, {len(queries)} requêtes")
+        for backend, model in models.items():
+            if backend not in backends:
+                continue
+            result = {"domain": sujet, "backend": backend,
+                      "dimension": model.get_sentence_embedding_dimension(),
+                      "sentences_per_sec": round(throughput(model, texts, args.batch_size), 1)}
+            if backend != "torch":
+                result.update(check_parity(reference, model, texts, queries, k=args.k, batch_size=args.batch_size))
+            results.append(result)
+            parity = f", voisins communs@{args.k} {result['overlap_at_k']:.1%}" if "overlap_at_k" in result else ""
+            print(f"  {backend:<11} {result['sentences_per_sec']:>8.1f} phrases/s (dim {result['dimension']}){parity}")
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump({"model": EMBEDDING_MODEL_NAME, "batch_size": args.batch_size, "results": results}, f, indent=2)
+    print(f"\n✅ Résultats sauvegardés dans {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,328 @@
+# benchmark_pipeline.py
+# Benchmark reproductible du pipeline, sans réseau : Ollama et Stable Diffusion
+# sont remplacés par des serveurs HTTP locaux qui renvoient des réponses fixes.
+# Mesure la latence de recherche (p50/p95 par domaine) sur faiss_index/*.index,
+# rag_query complet avec le LLM factice, le débit de build_faiss_index
+# (documents/s), le post-traitement regex sur les sorties d'exemple
+# (Summary Output/, Explanation Output/) et la file d'images.
+# Usage : python Model_Training/benchmark_pipeline.py --output benchmark_results.json
+import argparse
+import glob
+import json
+import os
+import platform
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+SECTIONS = ["retrieval", "rag_query", "build", "post_processing", "images"]
+
+# Titres des sections d'une réponse du LLM, par langue (préfixe des fichiers d'exemple)
+SECTION_TITLES = {
+    "fr": ("Explication orale", "Résumé HTML", "Exemples de code"),
+    "en": ("Spoken explanation", "HTML summary", "Code examples"),
+    "es": ("Explicación oral", "Resumen HTML", "Ejemplos de código"),
+    "it": ("Spiegazione orale", "Riepilogo HTML", "Esempi di codice"),
+}
+
+# PNG 1x1 renvoyé par le faux serveur Stable Diffusion
+STUB_PNG = ("iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAADUlEQVR42mNk+M9QDwADhgGAWjR9awAAAABJRU5ErkJggg==")
+
+# ==== Serveurs factices (Ollama, Automatic1111) ====
+
+class StubHandler(BaseHTTPRequestHandler):
+    """Répond aux routes utilisées par OllamaClient et generate_image_with_local_sd"""
+    protocol_version = "HTTP/1.1"
+    llm_response = ""
+    llm_delay = 0.0
+    image_delay = 0.0
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, payload: Dict):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        self._send({"models": []})
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if self.path == "/sdapi/v1/txt2img":
+            time.sleep(self.image_delay)
+            self._send({"images": [STUB_PNG]})
+        elif self.path == "/api/chat":
+            time.sleep(self.llm_delay)
+            self._send({"message": {"role": "assistant", "content": self.llm_response}, "done": True})
+        else:
+            time.sleep(self.llm_delay)
+            self._send({"response": self.llm_response, "done": True})
+
+def start_stub_server() -> Tuple[ThreadingHTTPServer, str]:
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+# ==== Données d'entrée ====
+
+def load_sample_responses() -> List[Dict]:
+    """Réponses brutes du LLM reconstituées à partir des sorties d'exemple.
+
+    Chaque slide donne deux variantes : résumé déjà en HTML (cas nominal) et
+    résumé en liste Markdown (chemin de convert_to_html_list).
+    """
+    samples = []
+    for summary_path in sorted(glob.glob("Summary Output/*-summary-code-*.json")):
+        name = os.path.basename(summary_path)
+        lang = name.split("-", 1)[0]
+        explanation_path = os.path.join("Explanation Output", name.replace("-summary-code-", "-explanation-"))
+        if lang not in SECTION_TITLES or not os.path.exists(explanation_path):
+            continue
+        with open(summary_path, "r", encoding="utf-8") as f:
+            slides = json.load(f)["slides"]
+        with open(explanation_path, "r", encoding="utf-8") as f:
+            scripts = {s["id"]: s["script"] for s in json.load(f)["slides"]}
+        explanation_title, summary_title, code_title = SECTION_TITLES[lang]
+        for slide in slides:
+            summary = slide["summary"]
+            markdown = "\n".join("- " + item.replace("<strong>", "**").replace("</strong>", "**")
+                                 for item in summary.replace("</li>", "").split("<li>")[1:])
+            for variant, summary_text in (("html", summary), ("markdown", markdown)):
+                samples.append({
+                    "lang": lang,
+                    "variant": variant,
+                    "summary": summary_text,
+                    "text": (f"**{explanation_title}** :\n{scripts.get(slide['id'], '')}\n\n"
+                             f"**{summary_title}** :\n{summary_text}\n\n"
+                             f"**{code_title}** :\n{slide['example_code']}\n\n")
+                })
+    return samples
+
+def title_queries(domain: Dict) -> List[str]:
+    """Requêtes d'un domaine : titres de RAG_Content (première ligne du contenu pour les slides sans titre)"""
+    with open(domain["source"], "r", encoding="utf-8") as f:
+        items = json.load(f)
+    queries = []
+    for item in items:
+        title = item.get("title", "").strip()
+        if not title or title.lower().startswith("slide "):
+            lines = [line.strip() for line in item.get("content", "").splitlines() if line.strip()]
+            title = lines[0] if lines else ""
+        if title and title not in queries:
+            queries.append(title)
+    return queries
+
+def latency_stats(samples_ms: List[float]) -> Dict[str, float]:
+    values = np.array(samples_ms, dtype="float64")
+    return {"count": int(len(values)), "mean_ms": round(float(values.mean()), 3),
+            "p50_ms": round(float(np.percentile(values, 50)), 3),
+            "p95_ms": round(float(np.percentile(values, 95)), 3),
+            "max_ms": round(float(values.max()), 3)}
+
+# ==== Mesures ====
+
+def bench_retrieval(domains: List[Dict], queries_per_domain: int) -> Dict:
+    """Latence de retrieve_context (encodage + FAISS + BM25 + contexte) par domaine.
+
+    Le cache d'embeddings est vide (EMBEDDING_CACHE_DIR temporaire) : chaque requête est encodée.
+    """
+    import Llama3_model
+    results = {}
+    for domain in domains:
+        sujet = domain["key"]
+        if Llama3_model.check_domain_files(sujet):
+            print(f"⚠️ {sujet} : index absent, ignoré")
+            continue
+        queries = title_queries(domain)[:queries_per_domain]
+        Llama3_model.retrieve_context(sujet, f"{queries[0]} (préchauffage)")  # chargement de l'index et du modèle
+        timings = []
+        for query in queries:
+            start = time.perf_counter()
+            Llama3_model.retrieve_context(sujet, query)
+            timings.append((time.perf_counter() - start) * 1000)
+        results[sujet] = latency_stats(timings)
+        print(f"🔍 {sujet:<8} p50 {results[sujet]['p50_ms']:.2f} ms, p95 {results[sujet]['p95_ms']:.2f} ms "
+              f"({len(queries)} requêtes)")
+    return results
+
+def bench_rag_query(domains: List[Dict], slides_per_domain: int) -> Dict:
+    """rag_query de bout en bout avec le LLM factice ; détail par étape issu de tracing"""
+    import Llama3_model
+    from tracing import tracer
+    results = {}
+    for domain in domains:
+        sujet = domain["key"]
+        if Llama3_model.check_domain_files(sujet):
+            continue
+        tracer.reset()
+        timings = []
+        for slide_number, topic in enumerate(title_queries(domain)[:slides_per_domain], 1):
+            start = time.perf_counter()
+            with tracer.slide(slide_number, topic):
+                Llama3_model.rag_query("", sujet, "débutant", "", "", topic, slide_number, "en")
+            timings.append((time.perf_counter() - start) * 1000)
+        results[sujet] = dict(latency_stats(timings), stages=tracer.summary())
+    return results
+
+def bench_build(domains: List[Dict], batch_size: int) -> Dict:
+    """Débit de construction des index (documents/s), dans un répertoire temporaire"""
+    import build_faiss_index
+    from doc_store import DocStore, has_doc_store
+    build_faiss_index.USE_EMBEDDING_CACHE = False  # mesurer l'encodage, pas le cache
+    build_faiss_index.get_model()  # chargement du modèle hors mesure
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        for domain in domains:
+            index_path = os.path.join(directory, os.path.basename(domain["index"]))
+            docs_path = os.path.join(directory, os.path.basename(domain["docs"]))
+            builder = (build_faiss_index.build_index_from_slides if domain["type"] == "slides"
+                       else build_faiss_index.build_index)
+            start = time.perf_counter()
+            ok = builder(domain["source"], index_path, docs_path, batch_size=batch_size, full_rebuild=True,
+                         index_spec=domain.get("index_spec"), chunking=domain.get("chunking"))
+            seconds = time.perf_counter() - start
+            if not ok:
+                results[domain["key"]] = {"error": "build failed"}
+                continue
+            documents = len(DocStore(docs_path)) if has_doc_store(docs_path) else 0
+            results[domain["key"]] = {"documents": documents, "seconds": round(seconds, 3),
+                                      "docs_per_sec": round(documents / seconds, 1)}
+            print(f"🏗️ {domain['key']:<8} {documents} documents en {seconds:.2f}s "
+                  f"({results[domain['key']]['docs_per_sec']} docs/s)")
+    return results
+
+def bench_post_processing(samples: List[Dict], iterations: int) -> Dict:
+    """Temps moyen (µs) des fonctions regex de post-traitement et d'extraction"""
+    from Llama3_model import (convert_to_html_list, extract_example_code_only, extract_explanation_only,
+                              extract_summary_only, post_process_response)
+    functions = {
+        "post_process_response": post_process_response,
+        "extract_explanation_only": extract_explanation_only,
+        "extract_summary_only": extract_summary_only,
+        "extract_example_code_only": extract_example_code_only,
+    }
+    results = {}
+    for variant in ("html", "markdown"):
+        texts = [s["text"] for s in samples if s["variant"] == variant]
+        summaries = [s["summary"] for s in samples if s["variant"] == variant]
+        if not texts:
+            continue
+        results[variant] = {}
+        for name, fn in functions.items():
+            start = time.perf_counter()
+            for _ in range(iterations):
+                for text in texts:
+                    fn(text)
+            results[variant][name] = round((time.perf_counter() - start) * 1e6 / (iterations * len(texts)), 2)
+        start = time.perf_counter()
+        for _ in range(iterations):
+            for summary in summaries:
+                convert_to_html_list(summary)
+        results[variant]["convert_to_html_list"] = round((time.perf_counter() - start) * 1e6 / (iterations * len(summaries)), 2)
+        results[variant]["samples"] = len(texts)
+    return results
+
+def bench_images(count: int, workers: int) -> Dict:
+    """Débit de la file d'images avec le faux serveur SD (descriptions distinctes, puis relance en cache)"""
+    import enhanced_llama3_model
+    enhanced_llama3_model.IMAGE_WORKERS = workers
+    pipeline = enhanced_llama3_model.get_image_pipeline()
+    descriptions = [f"Diagram {i} with boxes and arrows" for i in range(count)]
+    results = {}
+    for run in ("cold", "cached"):
+        start = time.perf_counter()
+        futures = [pipeline.submit(description, "") for description in descriptions]
+        rendered = sum(1 for future in futures if future.result())
+        seconds = time.perf_counter() - start
+        results[run] = {"images": rendered, "seconds": round(seconds, 3),
+                        "images_per_sec": round(rendered / seconds, 1) if seconds else None}
+    pipeline.close()
+    results["stats"] = pipeline.get_stats()
+    return results
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True).stdout.strip()
+    except OSError:
+        return ""
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark hors ligne du pipeline RAG")
+    parser.add_argument("--sections", default=",".join(SECTIONS),
+                        help=f"Mesures à lancer, séparées par des virgules ({', '.join(SECTIONS)})")
+    parser.add_argument("--domains", help="Domaines mesurés (défaut : tous), ex: java,jee")
+    parser.add_argument("--queries", type=int, default=50, help="Requêtes de recherche par domaine")
+    parser.add_argument("--slides", type=int, default=10, help="Appels rag_query par domaine")
+    parser.add_argument("--iterations", type=int, default=200, help="Répétitions du post-traitement")
+    parser.add_argument("--images", type=int, default=16, help="Images soumises à la file")
+    parser.add_argument("--image-workers", type=int, default=2)
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--llm-delay", type=float, default=0.0, help="Latence simulée du LLM factice (s)")
+    parser.add_argument("--image-delay", type=float, default=0.05, help="Latence simulée du serveur SD (s)")
+    parser.add_argument("--output", default="benchmark_results.json")
+    args = parser.parse_args()
+
+    sections = [s.strip() for s in args.sections.split(",") if s.strip()]
+    unknown = [s for s in sections if s not in SECTIONS]
+    if unknown:
+        print(f"❌ Mesure(s) inconnue(s) : {', '.join(unknown)}. Disponibles : {', '.join(SECTIONS)}")
+        return
+
+    samples = load_sample_responses()
+    StubHandler.llm_response = next((s["text"] for s in samples if s["variant"] == "html"), "")
+    StubHandler.llm_delay = args.llm_delay
+    StubHandler.image_delay = args.image_delay
+    server, url = start_stub_server()
+
+    # Les modules lisent leur configuration à l'import : tout pointe vers le serveur
+    # factice, sans cache des générations et avec des caches d'assets et d'embeddings
+    # jetables (vides à chaque exécution : les requêtes sont toujours encodées)
+    asset_dir = tempfile.mkdtemp(prefix="asset_cache_")
+    embedding_dir = tempfile.mkdtemp(prefix="embedding_cache_")
+    os.environ.update(OLLAMA_HOST=url, LOCAL_SD_URL=url, LLM_CACHE_BYPASS="1", ASSET_CACHE_DIR=asset_dir,
+                      EMBEDDING_CACHE_DIR=embedding_dir)
+    from build_faiss_index import DOMAINS
+    wanted = [d.strip() for d in args.domains.split(",")] if args.domains else [d["key"] for d in DOMAINS]
+    domains = [d for d in DOMAINS if d["key"] in wanted]
+
+    report = {"commit": git_commit(), "timestamp": time.strftime("%Y-%m-%d %H:%M:%S"),
+              "python": platform.python_version(), "machine": platform.machine(),
+              "cpu_count": os.cpu_count(), "parameters": vars(args)}
+    try:
+        if "retrieval" in sections:
+            print("\n📊 Recherche (retrieve_context)")
+            report["retrieval"] = bench_retrieval(domains, args.queries)
+        if "rag_query" in sections:
+            print("\n📊 rag_query avec LLM factice")
+            report["rag_query"] = bench_rag_query(domains, args.slides)
+        if "build" in sections:
+            print("\n📊 Construction des index")
+            report["build"] = bench_build(domains, args.batch_size)
+        if "post_processing" in sections:
+            print(f"\n📊 Post-traitement ({len(samples)} réponses d'exemple)")
+            report["post_processing"] = bench_post_processing(samples, args.iterations)
+        if "images" in sections:
+            print("\n📊 File d'images avec serveur SD factice")
+            report["images"] = bench_images(args.images, args.image_workers)
+    finally:
+        server.shutdown()
+        for directory in (asset_dir, embedding_dir):
+            shutil.rmtree(directory, ignore_errors=True)
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(f"\n✅ Résultats sauvegardés dans {args.output}")
+
+if __name__ == "__main__":
+    main()
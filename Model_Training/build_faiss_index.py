@@ -1,9 +1,81 @@
 import json
+import hashlib
 import faiss
 import numpy as np
-from sentence_transformers import SentenceTransformer
 import os
+import argparse
+import re
+import time
+from contextlib import contextmanager
 from pathlib import Path
+from embedding_cache import open_embedding_cache
+from encoder import DEFAULT_BACKEND, ENCODER_BACKENDS, encoder_id, load_encoder, resolve_backend
+from doc_store import DocStore, has_doc_store, store_paths, write_doc_store
+from retriever import TAG_SHIFT, combined_tags_path, manifest_hash, manifest_path_for
+from lexical_index import lexical_index_path, write_lexical_index
+
+MODEL_NAME = "all-MiniLM-L6-v2"
+# Backend d'encodage (--backend ou EMBEDDING_BACKEND) ; il fait partie de l'identité des vecteurs
+EMBEDDING_BACKEND = DEFAULT_BACKEND
+DEFAULT_BATCH_SIZE = 64
+# Nombre de batches encodés avant d'écrire dans la matrice (borne la mémoire temporaire)
+BATCHES_PER_CHUNK = 16
+# Passages : un code plus court (en mots) est rattaché au texte ; un passage sans assez de mots est ignoré
+MIN_CHUNK_TOKENS = 16
+MIN_CHUNK_WORDS = 3
+
+# Cache disque des embeddings, partagé avec rag_query (désactivable avec --no-embedding-cache)
+USE_EMBEDDING_CACHE = True
+
+_model = None
+_embedding_cache = None
+
+def get_model():
+    """Charger le modèle d'embedding une seule fois pour tous les domaines"""
+    global _model
+    if _model is None:
+        _model = load_encoder(MODEL_NAME, EMBEDDING_BACKEND)
+    return _model
+
+def get_embedding_cache():
+    """Cache d'embeddings partagé (None si désactivé)"""
+    global _embedding_cache
+    if USE_EMBEDDING_CACHE and _embedding_cache is None:
+        _embedding_cache = open_embedding_cache(encoder_id(MODEL_NAME, EMBEDDING_BACKEND))
+    return _embedding_cache if USE_EMBEDDING_CACHE else None
+
+@contextmanager
+def encoding_pool(model, num_workers=0):
+    """Pool multi-processus CPU de sentence-transformers (None si num_workers <= 1)"""
+    if num_workers <= 1:
+        yield None
+        return
+    pool = model.start_multi_process_pool(["cpu"] * num_workers)
+    try:
+        yield pool
+    finally:
+        model.stop_multi_process_pool(pool)
+
+def encode_texts(model, texts, batch_size=DEFAULT_BATCH_SIZE, pool=None, cache=None):
+    """Encoder les textes par batches directement dans une matrice float32 préallouée"""
+    if cache is not None:
+        # Seuls les textes absents du cache disque passent par le modèle
+        return cache.encode(texts, lambda missing: encode_texts(model, missing, batch_size, pool))
+    
+    dim = model.get_sentence_embedding_dimension()
+    vectors = np.empty((len(texts), dim), dtype="float32")
+    chunk_size = batch_size * BATCHES_PER_CHUNK
+
+    for start in range(0, len(texts), chunk_size):
+        chunk = texts[start:start + chunk_size]
+        if pool is not None:
+            embeddings = model.encode_multi_process(chunk, pool, batch_size=batch_size)
+        else:
+            embeddings = model.encode(chunk, batch_size=batch_size, convert_to_numpy=True)
+        vectors[start:start + len(chunk)] = embeddings
+        print(f"🧮 {min(start + chunk_size, len(texts))}/{len(texts)} documents encodés")
+
+    return vectors
 
 def ensure_directories():
     """Créer les répertoires nécessaires s'ils n'existent pas"""
@@ -12,7 +84,281 @@ def ensure_directories():
 
     
 
-def build_index(json_path, index_path, docs_path):
+# Spécification d'index par défaut (recherche exacte)
+DEFAULT_INDEX_SPEC = {"type": "flat"}
+# Index de l'index combiné : produit scalaire, le score est directement le cosinus
+COMBINED_INDEX_SPEC = {"type": "flat", "metric": "ip"}
+RECALL_K = 10
+RECALL_QUERIES = 200
+
+def make_index(index_spec, vectors):
+    """Créer (et entraîner si nécessaire) un index FAISS selon sa spécification.
+    
+    Types supportés : flat, ivf_flat (nlist), ivf_pq (nlist, m, nbits), hnsw (M, efConstruction).
+    "metric": "ip" crée un index produit scalaire (cosinus sur vecteurs normalisés), sinon L2.
+    Les paramètres sont réduits si le corpus est trop petit pour les entraîner.
+    """
+    n, dim = vectors.shape
+    index_type = index_spec.get("type", "flat")
+    
+    if index_type in ("ivf_flat", "ivf_pq"):
+        # FAISS recommande au moins 39 points d'entraînement par centroïde
+        nlist = max(1, min(index_spec.get("nlist", 100), n // 39))
+        if index_type == "ivf_pq":
+            m = index_spec.get("m", 16)
+            nbits = index_spec.get("nbits", 8)
+            if n < 2 ** nbits or dim % m != 0:
+                print(f"⚠️ IVF-PQ impossible ({n} vecteurs, dim {dim}, m={m}) : repli sur IVF-Flat")
+                index_type = "ivf_flat"
+            else:
+                factory = f"IDMap,IVF{nlist},PQ{m}x{nbits}"
+        if index_type == "ivf_flat":
+            factory = f"IDMap,IVF{nlist},Flat"
+    elif index_type == "hnsw":
+        factory = f"IDMap,HNSW{index_spec.get('M', 32)}"
+    else:
+        factory = "IDMap,Flat"
+    
+    metric = faiss.METRIC_INNER_PRODUCT if index_spec.get("metric") == "ip" else faiss.METRIC_L2
+    print(f"🏗️ Type d'index : {factory} ({'produit scalaire' if metric == faiss.METRIC_INNER_PRODUCT else 'L2'})")
+    index = faiss.index_factory(dim, factory, metric)
+    if index_type == "hnsw":
+        faiss.downcast_index(index.index).hnsw.efConstruction = index_spec.get("efConstruction", 40)
+    if not index.is_trained:
+        print(f"🎯 Entraînement de l'index sur {n} vecteurs")
+        index.train(vectors)
+    return index
+
+def supports_removal(index_spec):
+    """HNSW ne supporte pas remove_ids : toute suppression impose une reconstruction"""
+    return index_spec.get("type", "flat") != "hnsw"
+
+def search_parameter_sweep(index_spec):
+    """Nom et valeurs du paramètre de recherche à évaluer pour un type d'index"""
+    index_type = index_spec.get("type", "flat")
+    if index_type in ("ivf_flat", "ivf_pq"):
+        return "nprobe", [1, 2, 4, 8, 16, 32, 64]
+    if index_type == "hnsw":
+        return "efSearch", [16, 32, 64, 128, 256]
+    return None, []
+
+def write_recall_report(index, stored_docs, index_spec, index_path, batch_size=DEFAULT_BATCH_SIZE):
+    """Comparer l'index approché à un index Flat exact : rappel@k et latence par requête.
+    
+    Les requêtes sont un échantillon des documents eux-mêmes ; le rapport est
+    écrit dans faiss_index/<nom>.recall.json.
+    """
+    param_name, values = search_parameter_sweep(index_spec)
+    if param_name is None:
+        return None
+    
+    live_ids = np.array([i for i, doc in enumerate(stored_docs) if doc is not None], dtype="int64")
+    vectors = encode_texts(get_model(), [stored_docs[i] for i in live_ids],
+                           batch_size=batch_size, cache=get_embedding_cache())
+    k = min(RECALL_K, len(live_ids))
+    # Mêmes vecteurs (normalisés) et même métrique que l'index testé
+    vectors = np.ascontiguousarray(vectors, dtype="float32")
+    faiss.normalize_L2(vectors)
+    
+    if index_spec.get("metric") == "ip":
+        exact = faiss.IndexFlatIP(vectors.shape[1])
+    else:
+        exact = faiss.IndexFlatL2(vectors.shape[1])
+    exact.add(vectors)
+    rng = np.random.default_rng(0)
+    sample = rng.choice(len(live_ids), size=min(RECALL_QUERIES, len(live_ids)), replace=False)
+    queries = vectors[sample]
+    _, exact_rows = exact.search(queries, k)
+    expected = live_ids[exact_rows]
+    
+    params = faiss.ParameterSpace()
+    report = {"index_spec": index_spec, "k": k, "queries": len(sample), "parameter": param_name, "results": []}
+    print(f"\n📈 Rappel@{k} / latence ({len(sample)} requêtes) :")
+    for value in values:
+        params.set_index_parameter(index, param_name, value)
+        start = time.perf_counter()
+        found = np.vstack([index.search(queries[i:i + 1], k)[1] for i in range(len(queries))])
+        latency_ms = (time.perf_counter() - start) * 1000 / len(queries)
+        recall = float(np.mean([len(set(f) & set(e)) / k for f, e in zip(found, expected)]))
+        report["results"].append({param_name: value, "recall": round(recall, 4), "latency_ms": round(latency_ms, 4)})
+        print(f"   {param_name}={value:<4} rappel={recall:.3f} latence={latency_ms:.3f} ms")
+    
+    report_path = os.path.splitext(index_path)[0] + ".recall.json"
+    with open(report_path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"✅ Rapport de rappel sauvegardé : {report_path}")
+    return report
+
+def split_into_windows(text, window, overlap):
+    """Découper un texte en fenêtres glissantes de `window` tokens avec `overlap` tokens communs.
+    
+    Les tokens sont les mots séparés par des espaces ; chaque fenêtre est une
+    tranche du texte original (retours à la ligne et indentation conservés).
+    """
+    spans = [m.span() for m in re.finditer(r"\S+", text)]
+    if not spans:
+        return []
+    if len(spans) <= window:
+        return [text[spans[0][0]:spans[-1][1]]]
+    
+    step = max(1, window - overlap)
+    chunks = []
+    for start in range(0, len(spans), step):
+        end = min(start + window, len(spans))
+        chunks.append(text[spans[start][0]:spans[end - 1][1]])
+        if end == len(spans):
+            break
+    return chunks
+
+def has_substance(piece, min_words=MIN_CHUNK_WORDS):
+    """Un passage sans au moins `min_words` mots (ex: ";" ou un identifiant seul) n'apporte rien au contexte"""
+    return len(re.findall(r"\w+", piece)) >= min_words
+
+def make_chunks(header, content, code_examples, chunking):
+    """Passages d'un élément : fenêtres du contenu + fenêtres du code (hors du texte).
+    
+    Les exemples de code de l'élément sont joints puis découpés avec la même
+    fenêtre que le contenu. Si le texte ou le code fait moins de `min_tokens`
+    mots, les deux sont découpés ensemble plutôt que de laisser un fragment
+    occuper un passage à lui seul. Les passages sans substance sont ignorés.
+    Chaque passage est préfixé par `header` (titre), ce qui suffit à le
+    rattacher à son élément.
+    """
+    window, overlap = chunking.get("window", 128), chunking.get("overlap", 32)
+    min_tokens = chunking.get("min_tokens", MIN_CHUNK_TOKENS)
+    code = "\n".join(example for example in code_examples if example.strip())
+    if min(len(content.split()), len(code.split())) < min_tokens:
+        pieces = split_into_windows(f"{content}\n\n{code}", window, overlap)
+    else:
+        pieces = split_into_windows(content, window, overlap) + split_into_windows(code, window, overlap)
+    chunks = [f"{header}\n\n{piece}" for piece in pieces if has_substance(piece)]
+    return chunks or [header]
+
+def document_hash(text):
+    """Hash de contenu d'un document"""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+def load_previous_state(index_path, docs_path, index_spec=DEFAULT_INDEX_SPEC):
+    """Charger index, documents et manifeste existants s'ils sont compatibles, sinon None"""
+    manifest_path = manifest_path_for(index_path)
+    if not all(os.path.exists(p) for p in (index_path, manifest_path)):
+        return None
+    if not (has_doc_store(docs_path) or os.path.exists(docs_path)):
+        return None
+    
+    try:
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+        if has_doc_store(docs_path):
+            docs = DocStore(docs_path).tolist()
+        else:
+            with open(docs_path, "r", encoding="utf-8") as f:
+                docs = json.load(f)
+        index = faiss.read_index(index_path)
+    except Exception as e:
+        print(f"⚠️ État précédent illisible, reconstruction complète : {str(e)}")
+        return None
+    
+    if manifest.get("model") != encoder_id(MODEL_NAME, EMBEDDING_BACKEND) or not isinstance(index, faiss.IndexIDMap):
+        return None
+    if manifest.get("index_spec", DEFAULT_INDEX_SPEC) != index_spec:
+        print("ℹ️ Type d'index modifié, reconstruction complète")
+        return None
+    if index.ntotal != len(manifest.get("documents", {})):
+        print("⚠️ Manifeste incohérent avec l'index, reconstruction complète")
+        return None
+    
+    return index, docs, manifest["documents"]
+
+def update_index(docs, index_path, docs_path, batch_size=DEFAULT_BATCH_SIZE, num_workers=0, full_rebuild=False,
+                 index_spec=None):
+    """Mettre à jour l'index en n'encodant que les documents nouveaux ou modifiés.
+    
+    Le manifeste associe le hash de contenu de chaque document à son id FAISS,
+    qui est aussi sa position dans la liste des documents sauvegardée (les
+    emplacements libérés par les suppressions valent None et sont réutilisés).
+    Les index IVF sont entraînés lors d'une reconstruction complète uniquement.
+    """
+    index_spec = index_spec or DEFAULT_INDEX_SPEC
+    # Dédoublonner par contenu en gardant l'ordre du fichier source
+    wanted = {}
+    for text in docs:
+        wanted.setdefault(document_hash(text), text)
+    if len(wanted) < len(docs):
+        print(f"ℹ️ {len(docs) - len(wanted)} documents en double ignorés")
+    
+    previous = None if full_rebuild else load_previous_state(index_path, docs_path, index_spec)
+    if previous is not None and not supports_removal(index_spec):
+        if any(h not in wanted for h in previous[2]):
+            print("ℹ️ Suppressions impossibles sur un index HNSW, reconstruction complète")
+            previous = None
+    model = get_model()
+    
+    if previous is None:
+        print("🆕 Reconstruction complète de l'index")
+        # Créé après l'encodage pour pouvoir être entraîné sur le corpus
+        index = None
+        stored_docs, id_by_hash = [], {}
+    else:
+        index, stored_docs, id_by_hash = previous
+    
+    removed = {h: doc_id for h, doc_id in id_by_hash.items() if h not in wanted}
+    added = [h for h in wanted if h not in id_by_hash]
+    print(f"🧾 {len(added)} ajoutés/modifiés, {len(removed)} supprimés, "
+          f"{len(id_by_hash) - len(removed)} inchangés")
+    
+    if removed:
+        index.remove_ids(np.array(sorted(removed.values()), dtype="int64"))
+        for h, doc_id in removed.items():
+            stored_docs[doc_id] = None
+            del id_by_hash[h]
+    
+    if added:
+        # Réutiliser les emplacements libres avant d'agrandir la liste
+        free_ids = [i for i, doc in enumerate(stored_docs) if doc is None]
+        new_ids = free_ids[:len(added)]
+        new_ids += list(range(len(stored_docs), len(stored_docs) + len(added) - len(new_ids)))
+        stored_docs.extend([None] * (max(new_ids) + 1 - len(stored_docs)))
+        
+        texts = [wanted[h] for h in added]
+        with encoding_pool(model, num_workers) as pool:
+            vectors_array = encode_texts(model, texts, batch_size=batch_size, pool=pool,
+                                         cache=get_embedding_cache())
+        
+        # Vecteurs unitaires : produit scalaire = cosinus, L2² = 2 - 2·cosinus
+        faiss.normalize_L2(vectors_array)
+        if index is None:
+            index = make_index(index_spec, vectors_array)
+        print(f"🔄 Ajout de {len(vectors_array)} vecteurs à l'index FAISS")
+        index.add_with_ids(vectors_array, np.array(new_ids, dtype="int64"))
+        for h, doc_id, text in zip(added, new_ids, texts):
+            stored_docs[doc_id] = text
+            id_by_hash[h] = doc_id
+    
+    # Sauvegarder l'index, les documents et le manifeste
+    # (écriture dans un fichier temporaire puis remplacement atomique : les
+    # lecteurs qui ont memory-mappé l'ancienne version ne sont pas corrompus)
+    ensure_directories()
+    faiss.write_index(index, index_path + ".tmp")
+    os.replace(index_path + ".tmp", index_path)
+    
+    write_doc_store(stored_docs, docs_path)
+    
+    # Index lexical BM25 sur les mêmes documents (recherche hybride avec FAISS)
+    if added or removed or not os.path.exists(lexical_index_path(index_path)):
+        write_lexical_index(stored_docs, lexical_index_path(index_path))
+    
+    with open(manifest_path_for(index_path), "w", encoding="utf-8") as f:
+        json.dump({"model": encoder_id(MODEL_NAME, EMBEDDING_BACKEND), "index_spec": index_spec, "documents": id_by_hash}, f, indent=2)
+    
+    if get_embedding_cache() is not None:
+        get_embedding_cache().save()
+    
+    if added or removed:
+        write_recall_report(index, stored_docs, index_spec, index_path, batch_size)
+
+def build_index(json_path, index_path, docs_path, batch_size=DEFAULT_BATCH_SIZE, num_workers=0, full_rebuild=False,
+                index_spec=None, chunking=None):
     """Construire l'index FAISS pour du contenu avec exemples de code"""
     print(f"📚 Construction de l'index pour : {json_path}")
     
@@ -31,10 +377,7 @@ def build_index(json_path, index_path, docs_path):
         
         print(f"📄 Chargement de {len(data)} éléments")
         
-        model = SentenceTransformer("all-MiniLM-L6-v2")
-        
         docs = []
-        vectors = []
         
         for i, item in enumerate(data):
             try:
@@ -46,46 +389,42 @@ def build_index(json_path, index_path, docs_path):
                 title = item.get("title", f"Item {i+1}")
                 content = item.get("content", "")
                 
+                if chunking:
+                    # Découpage en passages (le code reste hors des fenêtres de texte)
+                    docs.extend(make_chunks(title, content, code_examples, chunking))
+                    continue
+                
                 full_text = f"{title}\n\n{content}"
                 if code_block:
                     full_text += f"\n\n{code_block}"
                 
                 docs.append(full_text)
-                vec = model.encode(full_text)
-                vectors.append(vec)
                 
             except Exception as e:
                 print(f"⚠️ Erreur lors du traitement de l'item {i+1}: {str(e)}")
                 continue
         
-        if not vectors:
+        if not docs:
             print("❌ Aucun vecteur généré")
             return False
         
-        print(f"🔄 Création de l'index FAISS avec {len(vectors)} vecteurs")
+        if chunking:
+            print(f"✂️ {len(docs)} passages (fenêtre {chunking.get('window', 128)}, recouvrement {chunking.get('overlap', 32)})")
         
-        # Créer l'index FAISS
-        dim = len(vectors[0])
-        index = faiss.IndexFlatL2(dim)
-        vectors_array = np.array(vectors).astype("float32")
-        index.add(vectors_array)
-        
-        # Sauvegarder l'index et les documents
-        ensure_directories()
-        faiss.write_index(index, index_path)
-        
-        with open(docs_path, "w", encoding="utf-8") as f:
-            json.dump(docs, f, indent=2, ensure_ascii=False)
+        # Mise à jour incrémentale (ou reconstruction complète) de l'index
+        update_index(docs, index_path, docs_path, batch_size=batch_size, num_workers=num_workers,
+                     full_rebuild=full_rebuild, index_spec=index_spec)
         
         print(f"✅ Index créé avec succès : {index_path}")
-        print(f"✅ Documents sauvegardés : {docs_path}")
+        print(f"✅ Documents sauvegardés : {store_paths(docs_path)[0]}")
         return True
         
     except Exception as e:
         print(f"❌ Erreur lors de la construction de l'index : {str(e)}")
         return False
 
-def build_index_from_slides(json_path, index_path, docs_path):
+def build_index_from_slides(json_path, index_path, docs_path, batch_size=DEFAULT_BATCH_SIZE, num_workers=0,
+                            full_rebuild=False, index_spec=None, chunking=None):
     """Construire l'index FAISS pour du contenu de slides"""
     print(f"📚 Construction de l'index slides pour : {json_path}")
     
@@ -104,10 +443,7 @@ def build_index_from_slides(json_path, index_path, docs_path):
         
         print(f"📄 Chargement de {len(data)} slides")
         
-        model = SentenceTransformer("all-MiniLM-L6-v2")
-        
         docs = []
-        vectors = []
         
         for slide in data:
             try:
@@ -115,90 +451,196 @@ def build_index_from_slides(json_path, index_path, docs_path):
                 title = slide.get("title", f"Slide {slide_number}")
                 content = slide.get("content", "")
                 
+                if chunking:
+                    docs.extend(make_chunks(f"Slide {slide_number}: {title}", content, [], chunking))
+                    continue
+                
                 # Créer le texte de la slide
                 slide_text = f"Slide {slide_number}: {title}\n\n{content}"
                 
                 docs.append(slide_text)
-                vec = model.encode(slide_text)
-                vectors.append(vec)
                 
             except Exception as e:
                 print(f"⚠️ Erreur lors du traitement de la slide {slide.get('slide_number', 'Unknown')}: {str(e)}")
                 continue
         
-        if not vectors:
+        if not docs:
             print("❌ Aucun vecteur généré")
             return False
         
-        print(f"🔄 Création de l'index FAISS avec {len(vectors)} vecteurs")
-        
-        # Créer l'index FAISS
-        dim = len(vectors[0])
-        index = faiss.IndexFlatL2(dim)
-        vectors_array = np.array(vectors).astype("float32")
-        index.add(vectors_array)
+        if chunking:
+            print(f"✂️ {len(docs)} passages (fenêtre {chunking.get('window', 128)}, recouvrement {chunking.get('overlap', 32)})")
         
-        # Sauvegarder l'index et les documents
-        ensure_directories()
-        faiss.write_index(index, index_path)
-        
-        with open(docs_path, "w", encoding="utf-8") as f:
-            json.dump(docs, f, indent=2, ensure_ascii=False)
+        # Mise à jour incrémentale (ou reconstruction complète) de l'index
+        update_index(docs, index_path, docs_path, batch_size=batch_size, num_workers=num_workers,
+                     full_rebuild=full_rebuild, index_spec=index_spec)
         
         print(f"✅ Index slides créé avec succès : {index_path}")
-        print(f"✅ Documents sauvegardés : {docs_path}")
+        print(f"✅ Documents sauvegardés : {store_paths(docs_path)[0]}")
         return True
         
     except Exception as e:
         print(f"❌ Erreur lors de la construction de l'index slides : {str(e)}")
         return False
 
+# ==== Domaines à indexer ====
+# index_spec : flat (exact), ivf_flat {nlist}, ivf_pq {nlist, m, nbits} ou hnsw {M, efConstruction} ;
+#              "metric": "ip" (produit scalaire = cosinus) ou L2 par défaut
+# chunking : fenêtre et recouvrement (en mots) des passages indexés ; None = un vecteur par élément
+# key : nom du domaine dans AVAILABLE_DOMAINS (étiquette dans l'index combiné)
+DOMAINS = [
+    {
+        "name": "Angular",
+        "key": "angular",
+        "source": "RAG_Content/angular_training.json",
+        "index": "faiss_index/angular_faiss.index",
+        "docs": "docs/angular_docs.json",
+        "type": "standard",
+        "index_spec": {"type": "flat", "metric": "ip"},
+        "chunking": {"window": 128, "overlap": 32}
+    },
+    {
+        "name": "Java",
+        "key": "java",
+        "source": "RAG_Content/java_training.json", 
+        "index": "faiss_index/java_faiss.index",
+        "docs": "docs/java_docs.json",
+        "type": "standard",
+        "index_spec": {"type": "flat", "metric": "ip"},
+        "chunking": {"window": 128, "overlap": 32}
+    },
+    {
+        "name": "Spring JEE",
+        "key": "jee",
+        "source": "RAG_Content/spring_jee.json",
+        "index": "faiss_index/spring_jee_faiss.index", 
+        "docs": "docs/spring_jee_slides_docs.json",
+        "type": "slides",
+        "index_spec": {"type": "flat", "metric": "ip"},
+        "chunking": {"window": 128, "overlap": 32}
+    }
+]
+
+COMBINED_INDEX_PATH = "faiss_index/combined_faiss.index"
+
+def combined_index_stale(domains, index_path=COMBINED_INDEX_PATH):
+    """L'index combiné existe mais un domaine a changé depuis sa construction (ou format sans versions)"""
+    tags_path = combined_tags_path(index_path)
+    if not (os.path.exists(index_path) and os.path.exists(tags_path)):
+        return False
+    with open(tags_path, "r", encoding="utf-8") as f:
+        manifests = json.load(f).get("manifests")
+    if manifests is None:
+        return True
+    return any(manifests.get(d["key"]) != manifest_hash(d["index"]) for d in domains
+               if d.get("key") and has_doc_store(d["docs"]))
+
+def build_combined_index(domains, index_path=COMBINED_INDEX_PATH, batch_size=DEFAULT_BATCH_SIZE, num_workers=0):
+    """Index unique regroupant tous les domaines, pour la recherche fédérée filtrée.
+    
+    Chaque vecteur a pour id (étiquette du domaine << TAG_SHIFT) | id local, ce
+    qui permet de restreindre la recherche à certains domaines (IDSelector) et
+    de retrouver le passage dans le store du domaine. Les embeddings viennent
+    du cache disque déjà rempli par la construction des index par domaine.
+    """
+    try:
+        tags, manifests, all_vectors, all_ids = {}, {}, [], []
+        model = get_model()
+        for tag, domain in enumerate(d for d in domains if d.get("key")):
+            if not has_doc_store(domain["docs"]):
+                print(f"⚠️ Store manquant pour {domain['name']}, domaine ignoré")
+                continue
+            stored_docs = DocStore(domain["docs"]).tolist()
+            local_ids = [i for i, doc in enumerate(stored_docs) if doc]
+            if not local_ids:
+                continue
+            with encoding_pool(model, num_workers) as pool:
+                vectors = encode_texts(model, [stored_docs[i] for i in local_ids], batch_size=batch_size,
+                                       pool=pool, cache=get_embedding_cache())
+            tags[domain["key"]] = tag
+            manifests[domain["key"]] = manifest_hash(domain["index"])
+            all_vectors.append(vectors)
+            all_ids.append((np.int64(tag) << TAG_SHIFT) | np.array(local_ids, dtype="int64"))
+        
+        if not all_vectors:
+            print("❌ Aucun document à regrouper dans l'index combiné")
+            return False
+        
+        vectors = np.vstack(all_vectors)
+        faiss.normalize_L2(vectors)
+        index = make_index(COMBINED_INDEX_SPEC, vectors)
+        index.add_with_ids(vectors, np.concatenate(all_ids))
+        
+        ensure_directories()
+        faiss.write_index(index, index_path + ".tmp")
+        os.replace(index_path + ".tmp", index_path)
+        tags_path = combined_tags_path(index_path)
+        with open(tags_path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump({"tags": tags, "manifests": manifests}, f, indent=2)
+        os.replace(tags_path + ".tmp", tags_path)
+        
+        print(f"✅ Index combiné créé : {index.ntotal} vecteurs ({', '.join(tags)})")
+        return True
+    except Exception as e:
+        print(f"❌ Erreur lors de la création de l'index combiné: {str(e)}")
+        return False
+
+def parse_args():
+    """Options de ligne de commande du builder"""
+    parser = argparse.ArgumentParser(description="Construction des index FAISS")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE,
+                        help="Nombre de documents encodés par batch")
+    parser.add_argument("--full", action="store_true",
+                        help="Forcer la reconstruction complète (ignorer les manifestes)")
+    parser.add_argument("--no-embedding-cache", action="store_true",
+                        help="Ne pas lire ni écrire le cache disque des embeddings")
+    parser.add_argument("--workers", type=int, default=0,
+                        help="Nombre de processus CPU pour l'encodage (0 ou 1 = mono-processus)")
+    parser.add_argument("--backend", choices=list(ENCODER_BACKENDS), default=DEFAULT_BACKEND,
+                        help="Backend d'encodage CPU (changer de backend reconstruit les index)")
+    parser.add_argument("--combined", action="store_true",
+                        help="Construire aussi l'index combiné multi-domaines (recherche fédérée)")
+    return parser.parse_args()
+
 def main():
     """Fonction principale pour créer tous les index"""
+    global USE_EMBEDDING_CACHE, EMBEDDING_BACKEND
+    args = parse_args()
+    USE_EMBEDDING_CACHE = not args.no_embedding_cache
+    EMBEDDING_BACKEND = resolve_backend(args.backend)
     print("🚀 Démarrage de la construction des index FAISS\n")
-    
-    # Configuration des domaines
-    domains = [
-        {
-            "name": "Angular",
-            "source": "RAG_Content/angular_training.json",
-            "index": "faiss_index/angular_faiss.index",
-            "docs": "docs/angular_docs.json",
-            "type": "standard"
-        },
-        {
-            "name": "Java",
-            "source": "RAG_Content/java_training.json", 
-            "index": "faiss_index/java_faiss.index",
-            "docs": "docs/java_docs.json",
-            "type": "standard"
-        },
-        {
-            "name": "Spring JEE",
-            "source": "RAG_Content/spring_jee.json",
-            "index": "faiss_index/spring_jee_faiss.index", 
-            "docs": "docs/spring_jee_slides_docs.json",
-            "type": "slides"
-        }
-    ]
+    print(f"🧠 Encodeur : {encoder_id(MODEL_NAME, EMBEDDING_BACKEND)}")
     
     results = []
     
-    for domain in domains:
+    for domain in DOMAINS:
         print(f"\n{'='*50}")
         print(f"🏗️ Construction de l'index pour {domain['name']}")
         print(f"{'='*50}")
         
-        if domain["type"] == "slides":
-            success = build_index_from_slides(domain["source"], domain["index"], domain["docs"])
-        else:
-            success = build_index(domain["source"], domain["index"], domain["docs"])
+        builder = build_index_from_slides if domain["type"] == "slides" else build_index
+        success = builder(
+            domain["source"], domain["index"], domain["docs"],
+            batch_size=args.batch_size, num_workers=args.workers, full_rebuild=args.full,
+            index_spec=domain.get("index_spec"), chunking=domain.get("chunking")
+        )
         
         results.append({
             "domain": domain["name"],
             "success": success
         })
     
+    # Un index combiné existant est reconstruit dès qu'un domaine a changé (ids locaux réutilisés)
+    stale = combined_index_stale(DOMAINS)
+    if args.combined or stale:
+        print(f"\n{'='*50}")
+        print("🏗️ Construction de l'index combiné" + (" (domaines modifiés)" if stale else ""))
+        print(f"{'='*50}")
+        results.append({
+            "domain": "Combiné",
+            "success": build_combined_index(DOMAINS, batch_size=args.batch_size, num_workers=args.workers)
+        })
+    
     # Résumé final
     print(f"\n{'='*50}")
     print("📊 RÉSUMÉ DE LA CONSTRUCTION")
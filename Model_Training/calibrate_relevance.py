@@ -0,0 +1,113 @@
+# calibrate_relevance.py
+# Choisit le seuil de similarité cosinus de chaque domaine à partir de requêtes
+# étiquetées construites depuis les titres de RAG_Content : pour chaque élément,
+# ses passages sont pertinents, les autres passages retrouvés (et tous ceux
+# retrouvés pour les requêtes des autres domaines) ne le sont pas. Le seuil qui
+# maximise le F1 est écrit dans faiss_index/relevance_calibration.json, lu par
+# Llama3_model (RAG_MIN_SIMILARITY reste prioritaire).
+# Usage : python Model_Training/calibrate_relevance.py [--domains angular,java] [--candidates 20]
+import argparse
+import json
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from build_faiss_index import DOMAINS
+from encoder import encoder_id
+from Llama3_model import (EMBEDDING_BACKEND, EMBEDDING_MODEL_NAME, RELEVANCE_CALIBRATION, check_domain_files,
+                          encode_queries, retriever_registry)
+
+def labelled_queries(domain: Dict) -> List[Tuple[str, str]]:
+    """(requête, en-tête des passages pertinents) pour chaque élément de RAG_Content.
+
+    La requête reprend la forme de retrieve_many ("{topic} {sujet}") ; le topic
+    est le titre, ou la première ligne du contenu pour les slides sans titre.
+    """
+    with open(domain["source"], "r", encoding="utf-8") as f:
+        items = json.load(f)
+    queries = []
+    for i, item in enumerate(items):
+        title = item.get("title", "").strip()
+        if domain["type"] == "slides":
+            slide_number = item.get("slide_number", "Unknown")
+            header = f"Slide {slide_number}: {item.get('title', f'Slide {slide_number}')}"
+        else:
+            header = item.get("title", f"Item {i+1}")
+        topic = title
+        if not topic or topic.lower().startswith("slide "):
+            lines = [line.strip() for line in item.get("content", "").splitlines() if line.strip()]
+            topic = lines[0] if lines else ""
+        if topic:
+            queries.append((f"{topic} {domain['key']}", header))
+    return queries
+
+def is_relevant(text: str, header: str) -> bool:
+    """Un passage appartient à l'élément s'il commence par son en-tête (voir make_chunks)"""
+    return text == header or text.startswith(f"{header}\n\n")
+
+def score_pairs(sujet: str, queries: List[Tuple[str, str]], candidates: int) -> List[Tuple[float, int]]:
+    """(score, étiquette) des candidats retrouvés dans `sujet` ; en-tête None = requête hors domaine"""
+    vectors = np.asarray(encode_queries([query for query, _ in queries]), dtype="float32")
+    vectors = vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+    results, _ = retriever_registry.search(sujet, vectors, candidates)
+    pairs = []
+    for (_, header), hits in zip(queries, results):
+        for hit in hits:
+            pairs.append((hit["score"], int(header is not None and is_relevant(hit["text"], header))))
+    return pairs
+
+def best_threshold(pairs: List[Tuple[float, int]]) -> Dict[str, float]:
+    """Seuil (score > seuil gardé) maximisant le F1 sur les paires étiquetées"""
+    ordered = sorted(pairs, key=lambda pair: -pair[0])
+    positives = sum(label for _, label in ordered)
+    best = {"threshold": ordered[-1][0] - 1e-6, "precision": 0.0, "recall": 0.0, "f1": 0.0}
+    kept_positives = 0
+    for i, (score, label) in enumerate(ordered):
+        kept_positives += label
+        # Couper seulement entre deux scores distincts
+        if i + 1 < len(ordered) and ordered[i + 1][0] == score:
+            continue
+        precision = kept_positives / (i + 1)
+        recall = kept_positives / positives if positives else 0.0
+        f1 = 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+        if f1 > best["f1"]:
+            threshold = (score + ordered[i + 1][0]) / 2 if i + 1 < len(ordered) else score - 1e-6
+            best = {"threshold": threshold, "precision": precision, "recall": recall, "f1": f1}
+    return {key: round(value, 4) for key, value in best.items()}
+
+def main():
+    parser = argparse.ArgumentParser(description="Calibration du seuil de similarité par domaine")
+    parser.add_argument("--domains", default=",".join(d["key"] for d in DOMAINS))
+    parser.add_argument("--candidates", type=int, default=20, help="Candidats examinés par requête")
+    parser.add_argument("--output", default=RELEVANCE_CALIBRATION)
+    args = parser.parse_args()
+
+    selected = [d for d in DOMAINS if d["key"] in {k.strip() for k in args.domains.split(",")}]
+    queries = {d["key"]: labelled_queries(d) for d in selected}
+
+    calibration = {"model": encoder_id(EMBEDDING_MODEL_NAME, EMBEDDING_BACKEND), "domains": {}}
+    for domain in selected:
+        sujet = domain["key"]
+        error = check_domain_files(sujet)
+        if error:
+            print(f"⚠️ {sujet} ignoré : {error}")
+            continue
+        # Requêtes du domaine + requêtes des autres domaines (négatifs)
+        off_domain = [(query, None) for other, items in queries.items() if other != sujet for query, _ in items]
+        pairs = score_pairs(sujet, queries[sujet] + off_domain, args.candidates)
+        if not any(label for _, label in pairs):
+            print(f"⚠️ {sujet} : aucun passage pertinent retrouvé, seuil par défaut conservé")
+            continue
+        result = best_threshold(pairs)
+        result["queries"] = len(queries[sujet])
+        calibration["domains"][sujet] = result
+        print(f"🎯 {sujet} : seuil {result['threshold']:.3f} (précision {result['precision']:.1%}, "
+              f"rappel {result['recall']:.1%}, F1 {result['f1']:.3f}, {result['queries']} requêtes, "
+              f"{len(off_domain)} hors domaine)")
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(calibration, f, indent=2)
+    print(f"\n✅ Calibration sauvegardée dans {args.output}")
+
+if __name__ == "__main__":
+    main()
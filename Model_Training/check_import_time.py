@@ -0,0 +1,65 @@
+# check_import_time.py
+# Vérifie que l'import des modules du projet reste rapide : chaque module est
+# importé dans un processus neuf, doit tenir dans le budget et ne charger
+# aucune dépendance lourde (torch, sentence-transformers, faiss, requests).
+# Usage : python Model_Training/check_import_time.py [--budget 1.0]
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+MODULES = ["Llama3_model", "retriever", "ollama_client", "embedding_cache", "generation_cache", "encoder", "tracing", "retry_policy", "context_packer", "reranker", "enhanced_llama3_model"]
+HEAVY_MODULES = ["torch", "sentence_transformers", "faiss", "requests"]
+DEFAULT_BUDGET = 1.0  # secondes, démarrage de l'interpréteur compris
+
+PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+print(json.dumps({{"import": time.perf_counter() - start,
+                  "heavy": [m for m in {heavy!r} if m in sys.modules]}}))
+"""
+
+def measure(module: str):
+    """Importer `module` dans un processus neuf ; retourne (durée totale, durée d'import, modules lourds chargés)"""
+    env = dict(os.environ)
+    here = os.path.dirname(os.path.abspath(__file__))
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [here, env.get("PYTHONPATH")]))
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable, "-c", PROBE.format(module=module, heavy=HEAVY_MODULES)],
+                            env=env, capture_output=True, text=True)
+    total = time.perf_counter() - start
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1] if result.stderr.strip() else "échec de l'import")
+    report = json.loads(result.stdout.strip().splitlines()[-1])
+    return total, report["import"], report["heavy"]
+
+def main():
+    parser = argparse.ArgumentParser(description="Budget de temps d'import des modules")
+    parser.add_argument("--budget", type=float, default=DEFAULT_BUDGET,
+                        help="Durée maximale (secondes) d'un processus qui importe le module")
+    args = parser.parse_args()
+
+    failures = 0
+    for module in MODULES:
+        try:
+            total, import_time, heavy = measure(module)
+        except Exception as e:
+            print(f"❌ {module}: {str(e)}")
+            failures += 1
+            continue
+        ok = total <= args.budget and not heavy
+        failures += not ok
+        status = "✅" if ok else "❌"
+        extra = f" — modules lourds chargés : {', '.join(heavy)}" if heavy else ""
+        print(f"{status} {module}: {total:.2f}s (import {import_time * 1000:.0f}ms){extra}")
+
+    if failures:
+        print(f"\n❌ {failures} module(s) hors budget ({args.budget}s)")
+        sys.exit(1)
+    print(f"\n🎉 Tous les modules s'importent en moins de {args.budget}s")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+# context_packer.py
+import re
+from typing import Dict, List, Set, Tuple
+
+DEFAULT_TOKEN_BUDGET = 512
+# Part minimale d'un passage gardée quand il ne tient plus en entier (tokens)
+MIN_PARTIAL_TOKENS = 48
+# Deux passages sont des quasi-doublons si ce taux de leurs trigrammes de mots est commun
+DUPLICATE_THRESHOLD = 0.8
+SEPARATOR = "\n---\n"
+
+# Un mot ou un signe de ponctuation ≈ un token ; les mots longs (identifiants Java,
+# URLs) comptent un token de plus par tranche de 6 caractères
+_PIECE_PATTERN = re.compile(r"\w+|[^\w\s]")
+_WORD_PATTERN = re.compile(r"\w+")
+
+
+def estimate_tokens(text: str) -> int:
+    """Estimation du nombre de tokens d'un texte (sans tokenizer : légèrement pessimiste)"""
+    return sum(1 + (len(piece) - 1) // 6 for piece in _PIECE_PATTERN.findall(text))
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Couper un texte à max_tokens, de préférence à une fin de ligne ou de phrase"""
+    used = 0
+    end = 0
+    for match in _PIECE_PATTERN.finditer(text):
+        cost = 1 + (len(match.group()) - 1) // 6
+        if used + cost > max_tokens:
+            break
+        used += cost
+        end = match.end()
+    else:
+        return text
+
+    cut = text[:end]
+    # Revenir à la dernière fin de ligne / phrase si elle garde au moins la moitié du texte
+    boundary = max(cut.rfind("\n"), cut.rfind(". "), cut.rfind("; "))
+    if boundary > len(cut) // 2:
+        cut = cut[:boundary + 1]
+    return cut.rstrip() + " ..."
+
+
+def _shingles(text: str, n: int = 3) -> Set[Tuple[str, ...]]:
+    words = _WORD_PATTERN.findall(text.lower())
+    if len(words) < n:
+        return {tuple(words)} if words else set()
+    return {tuple(words[i:i + n]) for i in range(len(words) - n + 1)}
+
+
+def _is_duplicate(shingles: Set, kept: List[Set], threshold: float) -> bool:
+    """Quasi-doublon : la part de trigrammes communs avec un passage gardé (rapportée au plus petit) dépasse le seuil"""
+    for other in kept:
+        smaller = min(len(shingles), len(other))
+        if smaller and len(shingles & other) / smaller >= threshold:
+            return True
+    return False
+
+
+def pack_passages(hits: List[Dict], budget: int = DEFAULT_TOKEN_BUDGET, separator: str = SEPARATOR,
+                  threshold: float = DUPLICATE_THRESHOLD) -> Tuple[List[str], Dict[str, int]]:
+    """Remplir un budget de tokens avec les passages retrouvés, du meilleur au moins bon.
+
+    `hits` est déjà classé par la recherche (score ou fusion RRF). Les
+    quasi-doublons d'un passage mieux classé sont écartés ; un passage qui ne
+    tient plus en entier est coupé s'il reste au moins MIN_PARTIAL_TOKENS, et
+    les suivants sont encore essayés (un passage court peut tenir). Retourne les
+    textes gardés et des compteurs (tokens utilisés, doublons, coupés, écartés).
+    """
+    separator_tokens = estimate_tokens(separator)
+    passages: List[str] = []
+    kept_shingles: List[Set] = []
+    stats = {"tokens": 0, "passages": 0, "duplicates": 0, "truncated": 0, "dropped": 0}
+
+    for hit in hits:
+        text = hit["text"].strip()
+        if not text:
+            continue
+        shingles = _shingles(text)
+        if _is_duplicate(shingles, kept_shingles, threshold):
+            stats["duplicates"] += 1
+            continue
+
+        remaining = budget - stats["tokens"] - (separator_tokens if passages else 0)
+        tokens = estimate_tokens(text)
+        if tokens > remaining:
+            if remaining < MIN_PARTIAL_TOKENS:
+                stats["dropped"] += 1
+                continue
+            text = truncate_to_tokens(text, remaining - 3)  # " ..." ajouté (3 tokens)
+            tokens = estimate_tokens(text)
+            stats["truncated"] += 1
+
+        stats["tokens"] += tokens + (separator_tokens if passages else 0)
+        passages.append(text)
+        kept_shingles.append(shingles)
+
+    stats["passages"] = len(passages)
+    return passages, stats
@@ -0,0 +1,102 @@
+# doc_store.py
+import os
+import time
+from typing import Iterator, List, Optional
+
+import numpy as np
+
+BLOB_SUFFIX = ".bin"
+OFFSETS_SUFFIX = ".offsets.npy"
+# Tentatives d'ouverture d'un store en cours de remplacement par le builder
+OPEN_RETRIES = 20
+OPEN_RETRY_DELAY = 0.05
+
+
+def store_paths(docs_path: str):
+    """Fichiers du store binaire associés à un chemin de documents (docs/x_docs.json -> docs/x_docs.bin + .offsets.npy)"""
+    base = os.path.splitext(docs_path)[0]
+    return base + BLOB_SUFFIX, base + OFFSETS_SUFFIX
+
+
+def has_doc_store(docs_path: str) -> bool:
+    """Le store binaire existe-t-il pour ces documents ?"""
+    return all(os.path.exists(p) for p in store_paths(docs_path))
+
+
+def write_doc_store(docs: List[Optional[str]], docs_path: str):
+    """Écrire les documents : un blob UTF-8 concaténé et un tableau d'offsets int64 (n + 1).
+
+    Le document i occupe blob[offsets[i]:offsets[i + 1]] ; un emplacement vide
+    (None) a une longueur nulle. Les fichiers sont remplacés atomiquement pour
+    ne pas corrompre un lecteur qui les a déjà memory-mappés ; les offsets sont
+    remplacés en dernier et servent de point de validation (voir DocStore).
+    """
+    blob_path, offsets_path = store_paths(docs_path)
+    directory = os.path.dirname(blob_path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+
+    offsets = np.zeros(len(docs) + 1, dtype="int64")
+    with open(blob_path + ".tmp", "wb") as f:
+        for i, doc in enumerate(docs):
+            data = doc.encode("utf-8") if doc else b""
+            f.write(data)
+            offsets[i + 1] = offsets[i] + len(data)
+    with open(offsets_path + ".tmp", "wb") as f:
+        np.save(f, offsets)
+
+    # Ordre : blob puis offsets (un lecteur valide le couple blob/offsets)
+    os.replace(blob_path + ".tmp", blob_path)
+    os.replace(offsets_path + ".tmp", offsets_path)
+
+
+class DocStore:
+    """Accès O(1) par id FAISS aux documents, sans parser le corpus.
+
+    Le blob et les offsets sont memory-mappés : seules les pages des documents
+    réellement lus sont chargées. Se comporte comme une liste en lecture seule
+    (len, indexation, itération) où les emplacements vides valent None.
+
+    Si le builder remplace le store pendant l'ouverture, le blob peut ne pas
+    correspondre aux offsets lus : l'ouverture est alors recommencée (offsets
+    remplacés entre-temps ou taille du blob différente de offsets[-1]).
+    """
+
+    def __init__(self, docs_path: str):
+        self.blob_path, self.offsets_path = store_paths(docs_path)
+        for attempt in range(OPEN_RETRIES):
+            if self._open():
+                return
+            time.sleep(OPEN_RETRY_DELAY)
+        raise RuntimeError(f"Store {self.blob_path} incohérent (remplacement en cours ?)")
+
+    def _open(self) -> bool:
+        """Mapper offsets et blob ; False s'ils ne proviennent pas de la même écriture"""
+        before = os.stat(self.offsets_path)
+        self.offsets = np.load(self.offsets_path, mmap_mode="r")
+        size = int(self.offsets[-1])
+        # np.memmap refuse les fichiers vides
+        self.blob = np.memmap(self.blob_path, dtype="uint8", mode="r") if size else np.zeros(0, dtype="uint8")
+        after = os.stat(self.offsets_path)
+        return (before.st_ino, before.st_mtime_ns) == (after.st_ino, after.st_mtime_ns) and len(self.blob) == size
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i: int) -> Optional[str]:
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        start, end = int(self.offsets[i]), int(self.offsets[i + 1])
+        if start == end:
+            return None
+        return bytes(self.blob[start:end]).decode("utf-8")
+
+    def __iter__(self) -> Iterator[Optional[str]]:
+        for i in range(len(self)):
+            yield self[i]
+
+    def tolist(self) -> List[Optional[str]]:
+        """Charger tous les documents (utilisé par le builder pour les mises à jour)"""
+        return list(self)
@@ -0,0 +1,298 @@
+# embedding_cache.py
+import atexit
+import hashlib
+import json
+import os
+import re
+import threading
+from collections import OrderedDict
+from typing import Callable, List, Optional
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows : pas de verrou entre processus
+    fcntl = None
+
+# Répertoire du cache (EMBEDDING_CACHE_DIR pour en utiliser un autre, ex: benchmark)
+DEFAULT_CACHE_DIR = os.environ.get("EMBEDDING_CACHE_DIR", "embedding_cache")
+DEFAULT_MAX_ENTRIES = 200_000
+INITIAL_CAPACITY = 1024
+# Embeddings gardés en mémoire par un cache à écriture différée, en attendant `save`
+SESSION_MAX_ENTRIES = 10_000
+
+
+def normalize_text(text: str) -> str:
+    """Normaliser un texte avant calcul de la clé (espaces multiples, bords)"""
+    return " ".join(text.split())
+
+
+class EmbeddingCache:
+    """Cache disque des embeddings partagé par le builder et rag_query.
+
+    Les vecteurs sont stockés dans une matrice float32 memory-mappée
+    (vectors.f32) et un petit index JSON (keys.json) associe chaque clé
+    (modèle + texte normalisé) à sa ligne, dans l'ordre LRU. Quand le cache
+    atteint max_entries, les entrées les moins récemment utilisées sont
+    remplacées.
+
+    Plusieurs processus partagent le cache via un verrou fcntl (fichier .lock) :
+    un écrivain prend le verrou exclusif à sa première écriture, recharge
+    l'état du disque et le garde jusqu'à `save` ; les lecteurs prennent un
+    verrou partagé le temps de lire et rechargent keys.json s'il a changé.
+    Avec `deferred_writes` (chemin des requêtes), les embeddings absents sont
+    gardés en mémoire et ajoutés au disque par `save` (fin du processus) si le
+    verrou exclusif est libre ; un build en cours n'est jamais attendu : le
+    cache disque est alors ignoré et les nouvelles entrées abandonnées.
+    """
+
+    def __init__(self, model_name: str, cache_dir: str = DEFAULT_CACHE_DIR, max_entries: int = DEFAULT_MAX_ENTRIES,
+                 deferred_writes: bool = False):
+        self.model_name = model_name
+        self.max_entries = max_entries
+        self.deferred_writes = deferred_writes
+        self.directory = os.path.join(cache_dir, re.sub(r"[^A-Za-z0-9_.-]+", "_", model_name))
+        self.vectors_path = os.path.join(self.directory, "vectors.f32")
+        self.keys_path = os.path.join(self.directory, "keys.json")
+        self.lock_path = os.path.join(self.directory, ".lock")
+
+        self._lock = threading.Lock()
+        self._lock_file = None
+        self._writing = False
+        self._signature = None
+        self._session: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._pending: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._dirty = False
+        self._dimension: Optional[int] = None
+        self._capacity = 0
+        self._vectors: Optional[np.memmap] = None
+        self._rows: "OrderedDict[str, int]" = OrderedDict()
+        self._free_rows: List[int] = []
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+    def make_key(self, text: str) -> str:
+        """Clé de cache : hash du nom du modèle et du texte normalisé"""
+        payload = f"{self.model_name}\0{normalize_text(text)}"
+        return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+    # ---- Verrou entre processus ----
+
+    def _flock(self, exclusive: bool, blocking: bool = True) -> bool:
+        """Prendre le verrou de fichier partagé ou exclusif ; False s'il est tenu et blocking=False"""
+        if fcntl is None:
+            return True
+        if self._lock_file is None:
+            if not exclusive and not os.path.isdir(self.directory):
+                return False
+            os.makedirs(self.directory, exist_ok=True)
+            self._lock_file = open(self.lock_path, "a+")
+        try:
+            mode = fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH
+            fcntl.flock(self._lock_file, mode | (0 if blocking else fcntl.LOCK_NB))
+            return True
+        except BlockingIOError:
+            return False
+
+    def _unlock(self):
+        if fcntl is not None and self._lock_file is not None:
+            fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+
+    def _disk_signature(self):
+        try:
+            stat = os.stat(self.keys_path)
+            return stat.st_mtime_ns, stat.st_size
+        except OSError:
+            return None
+
+    # ---- Stockage ----
+
+    def _refresh(self):
+        """Recharger l'état du disque s'il a changé depuis la dernière lecture (sous verrou de fichier)"""
+        signature = self._disk_signature()
+        if signature != self._signature:
+            self._load()
+            self._signature = signature
+
+    def _load(self):
+        """Ouvrir le cache existant (sous verrou de fichier)"""
+        self._dimension, self._capacity, self._vectors = None, 0, None
+        self._rows, self._free_rows = OrderedDict(), []
+        if not (os.path.exists(self.keys_path) and os.path.exists(self.vectors_path)):
+            return
+        try:
+            with open(self.keys_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            self._dimension = meta["dimension"]
+            self._capacity = meta["capacity"]
+            self._rows = OrderedDict((key, row) for key, row in meta["entries"])
+            self._vectors = np.memmap(self.vectors_path, dtype="float32", mode="r+" if self._writing else "r",
+                                      shape=(self._capacity, self._dimension))
+            used = set(self._rows.values())
+            self._free_rows = [r for r in range(self._capacity) if r not in used]
+        except Exception as e:
+            print(f"⚠️ Cache d'embeddings illisible, il sera recréé : {str(e)}")
+            self._dimension, self._capacity, self._vectors = None, 0, None
+            self._rows, self._free_rows = OrderedDict(), []
+
+    def _grow(self, dimension: int, needed: int):
+        """Agrandir la matrice memory-mappée (capacité doublée, plafonnée à max_entries)"""
+        if self._dimension is None:
+            self._dimension = dimension
+        needed -= len(self._free_rows)
+        if needed <= 0:
+            return
+        new_capacity = max(self._capacity, INITIAL_CAPACITY)
+        while new_capacity < self._capacity + needed and new_capacity < self.max_entries:
+            new_capacity *= 2
+        new_capacity = min(new_capacity, self.max_entries)
+        if new_capacity <= self._capacity:
+            return
+
+        os.makedirs(self.directory, exist_ok=True)
+        if self._vectors is not None:
+            self._vectors.flush()
+            self._vectors = None
+        with open(self.vectors_path, "ab") as f:
+            # Ne jamais raccourcir le fichier (capacité relue sous verrou exclusif)
+            if f.tell() < new_capacity * self._dimension * 4:
+                f.truncate(new_capacity * self._dimension * 4)
+        self._vectors = np.memmap(self.vectors_path, dtype="float32", mode="r+",
+                                  shape=(new_capacity, self._dimension))
+        self._free_rows.extend(range(self._capacity, new_capacity))
+        self._capacity = new_capacity
+
+    def _allocate_row(self) -> int:
+        """Ligne libre, ou ligne de l'entrée la moins récemment utilisée"""
+        if self._free_rows:
+            return self._free_rows.pop()
+        _, row = self._rows.popitem(last=False)
+        self.stats["evictions"] += 1
+        return row
+
+    def save(self):
+        """Écrire l'index des clés, vider la matrice sur disque et rendre le verrou d'écriture"""
+        with self._lock:
+            if self._pending and not self._writing:
+                # Écriture différée : seulement si aucun build ne tient le cache
+                if self._flock(exclusive=True, blocking=False):
+                    self._writing = True
+                    self._load()
+                    self._write_rows(self._pending)
+                self._pending.clear()
+            if not self._writing:
+                return
+            try:
+                if self._dirty and self._vectors is not None:
+                    self._vectors.flush()
+                    meta = {
+                        "model": self.model_name,
+                        "dimension": self._dimension,
+                        "capacity": self._capacity,
+                        "entries": list(self._rows.items()),
+                    }
+                    tmp_path = self.keys_path + ".tmp"
+                    with open(tmp_path, "w", encoding="utf-8") as f:
+                        json.dump(meta, f)
+                    os.replace(tmp_path, self.keys_path)
+                    self._signature = self._disk_signature()
+                    self._dirty = False
+            finally:
+                self._writing = False
+                self._unlock()
+
+    def _read_cached(self, keys: List[str]) -> dict:
+        """Vecteurs présents sur disque (ou en mémoire) pour ces clés ; appelé sous self._lock"""
+        cached = {}
+        for key in keys:
+            if key in self._session and key not in cached:
+                self._session.move_to_end(key)
+                cached[key] = self._session[key]
+        if not self._writing:
+            # Lecteur : ne pas attendre un écrivain (le cache est alors ignoré)
+            if not self._flock(exclusive=False, blocking=not self.deferred_writes):
+                return cached
+        try:
+            if not self._writing:
+                self._refresh()
+            for key in keys:
+                row = self._rows.get(key)
+                if row is not None and key not in cached:
+                    self._rows.move_to_end(key)
+                    cached[key] = np.array(self._vectors[row])
+        finally:
+            if not self._writing:
+                self._unlock()
+        return cached
+
+    def _store(self, missing: "OrderedDict[str, str]", computed: np.ndarray):
+        """Ajouter les nouveaux embeddings ; appelé sous self._lock"""
+        if self.deferred_writes:
+            for key, vector in zip(missing, computed):
+                self._session[key] = vector
+                self._pending[key] = vector
+                if len(self._session) > SESSION_MAX_ENTRIES:
+                    old_key, _ = self._session.popitem(last=False)
+                    self._pending.pop(old_key, None)
+            return
+        if not self._writing:
+            # Verrou exclusif gardé jusqu'à save, puis état relu : aucune ligne écrite par un autre processus n'est réutilisée
+            self._flock(exclusive=True)
+            self._writing = True
+            self._load()
+        self._write_rows(dict(zip(missing, computed)))
+
+    def _write_rows(self, vectors: dict):
+        """Écrire les vecteurs des clés absentes dans la matrice (verrou exclusif tenu)"""
+        new = {key: vector for key, vector in vectors.items() if key not in self._rows}
+        if not new:
+            return
+        self._grow(len(next(iter(new.values()))), len(new))
+        for key, vector in new.items():
+            row = self._allocate_row()
+            self._vectors[row] = vector
+            self._rows[key] = row
+        self._dirty = True
+
+    # ---- API ----
+
+    def encode(self, texts: List[str], encode_fn: Callable[[List[str]], np.ndarray]) -> np.ndarray:
+        """Retourner les embeddings de `texts`, en n'appelant encode_fn que sur les textes absents"""
+        keys = [self.make_key(t) for t in texts]
+
+        with self._lock:
+            cached = self._read_cached(keys)
+
+        # Textes à encoder (dédoublonnés), hors verrou
+        missing = OrderedDict()
+        for key, text in zip(keys, texts):
+            if key not in cached:
+                missing.setdefault(key, text)
+        self.stats["hits"] += len(texts) - sum(1 for k in keys if k not in cached)
+        self.stats["misses"] += len(missing)
+
+        if missing:
+            computed = np.asarray(encode_fn(list(missing.values())), dtype="float32")
+            with self._lock:
+                self._store(missing, computed)
+            for key, vector in zip(missing, computed):
+                cached[key] = vector
+
+        dimension = next(iter(cached.values())).shape[0] if cached else (self._dimension or 0)
+        result = np.empty((len(texts), dimension), dtype="float32")
+        for i, key in enumerate(keys):
+            result[i] = cached[key]
+        return result
+
+    def get_stats(self) -> dict:
+        """Compteurs hits / misses / evictions et taille courante"""
+        with self._lock:
+            return dict(self.stats, entries=len(self._rows), capacity=self._capacity, session=len(self._session))
+
+
+def open_embedding_cache(model_name: str, cache_dir: str = DEFAULT_CACHE_DIR, max_entries: int = DEFAULT_MAX_ENTRIES,
+                         deferred_writes: bool = False) -> EmbeddingCache:
+    """Créer un cache d'embeddings sauvegardé automatiquement à la fin du processus"""
+    cache = EmbeddingCache(model_name, cache_dir=cache_dir, max_entries=max_entries, deferred_writes=deferred_writes)
+    atexit.register(cache.save)
+    return cache
@@ -0,0 +1,102 @@
+# encoder.py
+import importlib.util
+import os
+from typing import Dict, List
+
+import numpy as np
+
+# ==== Backends d'encodage CPU ====
+# torch      : SentenceTransformer PyTorch (référence)
+# torch-int8 : quantification dynamique int8 des couches Linear (torch seul)
+# onnx       : ONNX Runtime (pip install "sentence-transformers[onnx]", voir requirements.txt)
+# onnx-int8  : export ONNX quantifié int8 publié avec le modèle (ONNX_INT8_FILE pour en choisir un autre)
+ENCODER_BACKENDS = {
+    "torch": {"backend": "torch"},
+    "torch-int8": {"backend": "torch", "quantize": True},
+    "onnx": {"backend": "onnx"},
+    "onnx-int8": {"backend": "onnx", "file_name": os.environ.get("ONNX_INT8_FILE", "onnx/model_quint8_avx2.onnx")},
+}
+DEFAULT_BACKEND = os.environ.get("EMBEDDING_BACKEND", "torch")
+# Modules requis par les backends ONNX (absents de l'installation de base)
+ONNX_MODULES = ("onnxruntime", "optimum")
+ONNX_INSTALL_HINT = 'pip install "sentence-transformers[onnx]"'
+
+
+def missing_modules(backend: str) -> List[str]:
+    """Modules manquants pour utiliser `backend` (vérifiés sans les importer)"""
+    if ENCODER_BACKENDS.get(backend, {}).get("backend") != "onnx":
+        return []
+    return [name for name in ONNX_MODULES if importlib.util.find_spec(name) is None]
+
+
+def resolve_backend(backend: str) -> str:
+    """Backend réellement utilisable : torch (avec un avertissement) si les dépendances ONNX manquent.
+
+    À appeler avant encoder_id : l'identité des vecteurs (cache, manifestes)
+    doit être celle de l'encodeur effectivement chargé.
+    """
+    missing = missing_modules(backend)
+    if missing:
+        print(f"⚠️ Backend d'encodage '{backend}' indisponible ({', '.join(missing)} manquant) : "
+              f"utilisation de torch. Installez-le avec : {ONNX_INSTALL_HINT}")
+        return "torch"
+    return backend
+
+
+def encoder_id(model_name: str, backend: str = DEFAULT_BACKEND) -> str:
+    """Identifiant des vecteurs produits : clé du cache d'embeddings et des manifestes d'index"""
+    return model_name if backend == "torch" else f"{model_name}@{backend}"
+
+
+def load_encoder(model_name: str, backend: str = DEFAULT_BACKEND):
+    """Charger le modèle d'embedding avec le backend demandé (même interface SentenceTransformer)"""
+    if backend not in ENCODER_BACKENDS:
+        raise ValueError(f"Backend d'encodage '{backend}' inconnu. Disponibles : {', '.join(ENCODER_BACKENDS)}")
+    missing = missing_modules(backend)
+    if missing:
+        raise ImportError(f"Backend d'encodage '{backend}' : {', '.join(missing)} manquant ({ONNX_INSTALL_HINT})")
+    from sentence_transformers import SentenceTransformer
+
+    config = ENCODER_BACKENDS[backend]
+    if config["backend"] == "onnx":
+        model_kwargs = {"file_name": config["file_name"]} if "file_name" in config else None
+        return SentenceTransformer(model_name, backend="onnx", model_kwargs=model_kwargs)
+
+    model = SentenceTransformer(model_name)
+    if config.get("quantize"):
+        import torch
+        model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    return model
+
+
+def _top_k(queries: np.ndarray, docs: np.ndarray, k: int) -> np.ndarray:
+    """Ids des k plus proches voisins (distance L2, comme IndexFlatL2)"""
+    distances = (queries ** 2).sum(1)[:, None] - 2 * queries @ docs.T + (docs ** 2).sum(1)[None, :]
+    k = min(k, docs.shape[0])
+    nearest = np.argpartition(distances, k - 1, axis=1)[:, :k]
+    order = np.take_along_axis(distances, nearest, axis=1).argsort(axis=1)
+    return np.take_along_axis(nearest, order, axis=1)
+
+
+def check_parity(reference, candidate, texts: List[str], queries: List[str], k: int = 5,
+                 batch_size: int = 64) -> Dict[str, float]:
+    """Comparer un backend au modèle de référence sur un corpus.
+
+    overlap_at_k : part des k voisins de chaque requête retrouvés par le
+    backend (requêtes et corpus encodés par lui) parmi ceux de la référence ;
+    mean_cosine : similarité moyenne entre les vecteurs des deux backends.
+    """
+    ref_docs = np.asarray(reference.encode(texts, batch_size=batch_size, convert_to_numpy=True), dtype="float32")
+    cand_docs = np.asarray(candidate.encode(texts, batch_size=batch_size, convert_to_numpy=True), dtype="float32")
+    if ref_docs.shape[1] != cand_docs.shape[1]:
+        return {"dimension_match": False, "overlap_at_k": 0.0, "mean_cosine": 0.0, "k": k}
+
+    ref_queries = np.asarray(reference.encode(queries, batch_size=batch_size, convert_to_numpy=True), dtype="float32")
+    cand_queries = np.asarray(candidate.encode(queries, batch_size=batch_size, convert_to_numpy=True), dtype="float32")
+    ref_nearest = _top_k(ref_queries, ref_docs, k)
+    cand_nearest = _top_k(cand_queries, cand_docs, k)
+    overlap = np.mean([len(set(r) & set(c)) / len(r) for r, c in zip(ref_nearest, cand_nearest)])
+
+    norms = np.linalg.norm(ref_docs, axis=1) * np.linalg.norm(cand_docs, axis=1)
+    cosine = (ref_docs * cand_docs).sum(1) / np.maximum(norms, 1e-12)
+    return {"dimension_match": True, "overlap_at_k": float(overlap), "mean_cosine": float(cosine.mean()), "k": k}
@@ -1,32 +1,66 @@
 # enhanced_llama3_model.py
 import json
-import faiss
-import numpy as np
-from sentence_transformers import SentenceTransformer
-import subprocess
 import os
 import time
 import re
-import requests
 import base64
 from typing import Optional, List, Dict
+from Llama3_model import (AVAILABLE_DOMAINS, check_domain_files, generate_response, parse_plan, rag_query,
+                          retrieve_context, summarize_context)
+from asset_cache import AssetCache
+from image_pipeline import ImagePipeline
+from tracing import tracer
+
+# URL du serveur Automatic1111 local (LOCAL_SD_URL pour pointer vers un autre serveur)
+LOCAL_SD_URL = os.environ.get("LOCAL_SD_URL", "http://localhost:7860").rstrip("/")
 
 # Configuration des APIs d'images
+# timeout : (connexion, lecture) en secondes, propre à chaque backend
+# params : paramètres de génération, inclus dans la clé du cache d'assets
 IMAGE_APIS = {
     "stability": {
         "url": "https://api.stability.ai/v1/generation/stable-diffusion-xl-1024-v1-0/text-to-image",
-        "key": ""
+        "key": "",
+        "timeout": (5, 60),
+        "params": {
+            "prompt": "Technical diagram, {description}, clean minimal design, white background, professional, educational",
+            "cfg_scale": 7,
+            "height": 512,
+            "width": 512,
+            "samples": 1,
+            "steps": 30,
+            "style_preset": "digital-art"
+        }
     },
     "dall_e": {
         "url": "https://api.openai.com/v1/images/generations",
         "key": ""
     },
     "local_sd": {
-        "url": "http://localhost:7860/sdapi/v1/txt2img",  # Automatic1111
-        "key": None
+        "url": f"{LOCAL_SD_URL}/sdapi/v1/txt2img",  # Automatic1111
+        "key": None,
+        "timeout": (3, 120),
+        "params": {
+            "prompt": "Technical diagram, {description}, clean minimal design, white background, professional, educational, software architecture",
+            "negative_prompt": "blurry, low quality, text, watermark, signature, people, faces",
+            "steps": 20,
+            "width": 512,
+            "height": 512,
+            "cfg_scale": 7,
+            "sampler_name": "Euler a"
+        }
     }
 }
 
+# Pipeline d'images : nombre d'images générées en parallèle et taille de la file d'attente
+IMAGE_WORKERS = int(os.environ.get("IMAGE_WORKERS", "2"))
+IMAGE_MAX_PENDING = 8
+
+# Cache d'images et de diagrammes adressé par le contenu, partagé entre formations
+ASSET_CACHE_DIR = os.environ.get("ASSET_CACHE_DIR", "asset_cache")
+ASSET_CACHE_MAX_MB = int(os.environ.get("ASSET_CACHE_MAX_MB", "2048"))
+asset_cache = AssetCache(ASSET_CACHE_DIR, max_bytes=ASSET_CACHE_MAX_MB * 1024 * 1024)
+
 # Prompts pour générer des descriptions d'images
 IMAGE_DESCRIPTION_PROMPTS = {
     "fr": """En plus du contenu précédent, génère une description d'image technique qui serait utile pour illustrer "{current_topic}".
@@ -45,6 +79,20 @@ Example: "Diagram showing MVC architecture with 3 colored boxes (Model in blue,
 """
 }
 
+# Section "Description d'image" d'une réponse du LLM
+IMAGE_DESCRIPTION_PATTERNS = [
+    r'\*\*Description d\'image\*\*\s*:?\s*(.+?)(?=\n\n|\*\*|$)',
+    r'\*\*Image description\*\*\s*:?\s*(.+?)(?=\n\n|\*\*|$)',
+]
+
+def extract_image_description(response: str) -> Optional[str]:
+    """Extraire la description d'image d'une réponse, ou None si la section est absente"""
+    for pattern in IMAGE_DESCRIPTION_PATTERNS:
+        match = re.search(pattern, response, re.DOTALL | re.IGNORECASE)
+        if match and match.group(1).strip():
+            return match.group(1).strip()
+    return None
+
 def generate_image_description(content: str, current_topic: str, sujet: str, lang: str = "fr") -> str:
     """Génère une description d'image à partir du contenu"""
     
@@ -56,15 +104,9 @@ def generate_image_description(content: str, current_topic: str, sujet: str, lan
         response = generate_response(enhanced_prompt, max_retries=2, timeout=120)
         
         # Extraire la description d'image
-        patterns = [
-            r'\*\*Description d\'image\*\*\s*:?\s*(.+?)(?=\n\n|\*\*|$)',
-            r'\*\*Image description\*\*\s*:?\s*(.+?)(?=\n\n|\*\*|$)',
-        ]
-        
-        for pattern in patterns:
-            match = re.search(pattern, response, re.DOTALL | re.IGNORECASE)
-            if match:
-                return match.group(1).strip()
+        description = extract_image_description(response)
+        if description:
+            return description
         
         return f"Technical diagram illustrating {current_topic} in {sujet}"
         
@@ -72,7 +114,7 @@ def generate_image_description(content: str, current_topic: str, sujet: str, lan
         print(f"❌ Erreur génération description image: {e}")
         return f"Technical diagram for {current_topic}"
 
-def generate_image_with_stability(description: str, output_path: str) -> bool:
+def generate_image_with_stability(description: str, output_path: str, session=None, timeout=None) -> bool:
     """Génère une image avec Stability AI"""
     try:
         headers = {
@@ -80,22 +122,20 @@ def generate_image_with_stability(description: str, output_path: str) -> bool:
             "Content-Type": "application/json"
         }
         
+        params = dict(IMAGE_APIS['stability']['params'])
         data = {
             "text_prompts": [
                 {
-                    "text": f"Technical diagram, {description}, clean minimal design, white background, professional, educational",
+                    "text": params.pop("prompt").format(description=description),
                     "weight": 1
                 }
             ],
-            "cfg_scale": 7,
-            "height": 512,
-            "width": 512,
-            "samples": 1,
-            "steps": 30,
-            "style_preset": "digital-art"
+            **params
         }
         
-        response = requests.post(IMAGE_APIS['stability']['url'], headers=headers, json=data)
+        import requests
+        response = (session or requests).post(IMAGE_APIS['stability']['url'], headers=headers, json=data,
+                                          timeout=timeout or IMAGE_APIS['stability']['timeout'])
         
         if response.status_code == 200:
             data = response.json()
@@ -113,20 +153,15 @@ def generate_image_with_stability(description: str, output_path: str) -> bool:
         print(f"❌ Erreur génération image: {e}")
         return False
 
-def generate_image_with_local_sd(description: str, output_path: str) -> bool:
+def generate_image_with_local_sd(description: str, output_path: str, session=None, timeout=None) -> bool:
     """Génère une image avec Stable Diffusion local (Automatic1111)"""
     try:
-        data = {
-            "prompt": f"Technical diagram, {description}, clean minimal design, white background, professional, educational, software architecture",
-            "negative_prompt": "blurry, low quality, text, watermark, signature, people, faces",
-            "steps": 20,
-            "width": 512,
-            "height": 512,
-            "cfg_scale": 7,
-            "sampler_name": "Euler a"
-        }
+        data = dict(IMAGE_APIS['local_sd']['params'])
+        data["prompt"] = data["prompt"].format(description=description)
         
-        response = requests.post(IMAGE_APIS['local_sd']['url'], json=data)
+        import requests
+        response = (session or requests).post(IMAGE_APIS['local_sd']['url'], json=data,
+                                          timeout=timeout or IMAGE_APIS['local_sd']['timeout'])
         
         if response.status_code == 200:
             result = response.json()
@@ -144,6 +179,30 @@ def generate_image_with_local_sd(description: str, output_path: str) -> bool:
         print(f"❌ Erreur génération image locale: {e}")
         return False
 
+_image_pipeline = None
+
+def get_image_pipeline() -> ImagePipeline:
+    """Pipeline d'images partagée (session HTTP, threads et coupe-circuits communs à toutes les slides)"""
+    global _image_pipeline
+    if _image_pipeline is None:
+        backends = [{
+            "name": "local_sd",
+            "render": lambda session, description, path, timeout: generate_image_with_local_sd(description, path, session, timeout),
+            "timeout": IMAGE_APIS['local_sd']['timeout'],
+            "params": IMAGE_APIS['local_sd']['params']
+        }]
+        # Stability AI seulement si une clé est configurée
+        if IMAGE_APIS['stability']['key']:
+            backends.append({
+                "name": "stability",
+                "render": lambda session, description, path, timeout: generate_image_with_stability(description, path, session, timeout),
+                "timeout": IMAGE_APIS['stability']['timeout'],
+                "params": IMAGE_APIS['stability']['params']
+            })
+        _image_pipeline = ImagePipeline(backends, max_workers=IMAGE_WORKERS, max_pending=IMAGE_MAX_PENDING,
+                                        cache=asset_cache)
+    return _image_pipeline
+
 def create_mermaid_diagram(description: str, topic: str, subject: str) -> str:
     """Crée un diagramme Mermaid basé sur la description"""
     
@@ -201,42 +260,55 @@ graph TD
     
     return base_template
 
-def generate_visual_content(description: str, topic: str, subject: str, slide_number: int) -> Dict:
-    """Génère du contenu visuel (image + diagramme)"""
-    
-    # Créer les dossiers nécessaires
-    os.makedirs("images", exist_ok=True)
-    os.makedirs("diagrams", exist_ok=True)
+def asset_hash(path: str) -> str:
+    """Hash d'un asset à partir de son chemin dans le cache (nom de fichier sans extension)"""
+    return os.path.splitext(os.path.basename(path))[0]
+
+def generate_visual_content(description: str, topic: str, subject: str, slide_number: int, wait: bool = True) -> Dict:
+    """Génère du contenu visuel (image + diagramme).
+
+    Avec wait=False l'image est seulement mise en file : "image_future" est
+    résolu plus tard par collect_images, pendant que les slides suivantes s'écrivent.
+    Images et diagrammes sont rangés dans le cache d'assets : la slide les
+    référence par leur hash ("image_hash", "diagram_hash").
+    """
     
     visual_content = {
         "image_path": None,
+        "image_hash": None,
         "mermaid_diagram": None,
+        "diagram_path": None,
+        "diagram_hash": None,
         "description": description
     }
     
     # 1. Tenter de générer une image
     image_path = f"images/slide_{slide_number}_{subject}_{topic.replace(' ', '_')}.png"
     
-    # Essayer d'abord Stable Diffusion local
-    if generate_image_with_local_sd(description, image_path):
-        visual_content["image_path"] = image_path
-        print(f"✅ Image générée: {image_path}")
-    # Sinon essayer Stability AI (si configuré)
-    elif IMAGE_APIS['stability']['key'] != "YOUR_STABILITY_API_KEY":
-        if generate_image_with_stability(description, image_path):
-            visual_content["image_path"] = image_path
-            print(f"✅ Image générée: {image_path}")
+    # Stable Diffusion local puis Stability AI (si configuré), backends en panne ignorés
+    future = get_image_pipeline().submit(description, image_path)
+    if wait:
+        visual_content["image_path"] = future.result()
+        if visual_content["image_path"]:
+            visual_content["image_hash"] = asset_hash(visual_content["image_path"])
+            print(f"✅ Image générée: {visual_content['image_path']}")
+    else:
+        visual_content["image_future"] = future
     
     # 2. Générer un diagramme Mermaid
     mermaid_diagram = create_mermaid_diagram(description, topic, subject)
     visual_content["mermaid_diagram"] = mermaid_diagram
     
-    # Sauvegarder le diagramme
-    diagram_path = f"diagrams/slide_{slide_number}_{subject}_{topic.replace(' ', '_')}.mmd"
-    with open(diagram_path, "w", encoding="utf-8") as f:
-        f.write(mermaid_diagram)
-    
-    print(f"✅ Diagramme Mermaid créé: {diagram_path}")
+    # Sauvegarder le diagramme (réutilisé s'il existe déjà à l'identique)
+    with tracer.span("diagram_write") as span:
+        diagram_key = asset_cache.make_key("diagram", "mermaid", mermaid_diagram)
+        diagram_path = asset_cache.get(diagram_key)
+        span["cached"] = diagram_path is not None
+        if diagram_path is None:
+            diagram_path = asset_cache.put_text(diagram_key, mermaid_diagram, ".mmd", "diagram", "mermaid")
+            print(f"✅ Diagramme Mermaid créé: {diagram_path}")
+    visual_content["diagram_path"] = diagram_path
+    visual_content["diagram_hash"] = diagram_key
     
     return visual_content
 
@@ -288,17 +360,73 @@ IMPORTANT:
 """
 }
 
-def enhanced_rag_query(query: str, sujet: str, niveau: str, plan: str, history: str, current_topic: str, slide_number: int, lang: str = "fr", top_k: int = 3) -> Dict:
-    """RAG query améliorée avec génération de contenu visuel"""
+def collect_images(slides: List[Dict]):
+    """Attendre les images mises en file et renseigner leur chemin dans les slides"""
+    for slide in slides:
+        visual_content = slide["visual_content"] or {}
+        future = visual_content.pop("image_future", None)
+        if future is not None:
+            visual_content["image_path"] = future.result()
+            if visual_content["image_path"]:
+                visual_content["image_hash"] = asset_hash(visual_content["image_path"])
+                print(f"✅ Image générée: {visual_content['image_path']}")
+
+def generate_slide_with_description(sujet: str, niveau: str, current_topic: str, slide_number: int,
+                                    lang: str = "fr", top_k: int = 3) -> str:
+    """Un seul appel LLM : slide et description d'image générées ensemble via ENHANCED_SYSTEM_PROMPT"""
+    error = check_domain_files(sujet)
+    if error:
+        return error
     
-    # Génération du contenu textuel (code existant)
-    textual_response = rag_query(query, sujet, niveau, plan, history, current_topic, slide_number, lang, top_k)
+    try:
+        context = retrieve_context(sujet, current_topic, top_k)
+    except Exception as e:
+        print(f"❌ Erreur RAG: {str(e)}")
+        print("🔄 Génération sans contexte RAG...")
+        context = ""
+    
+    prompt = ENHANCED_SYSTEM_PROMPT[lang].format(
+        sujet=sujet,
+        niveau=niveau,
+        current_topic=current_topic,
+        slide_number=slide_number,
+        context_summary=summarize_context(context, sujet)
+    )
+    return generate_response(prompt, max_retries=2, timeout=180)
+
+def enhanced_rag_query(query: str, sujet: str, niveau: str, plan: str, history: str, current_topic: str, slide_number: int, lang: str = "fr", top_k: int = 3,
+                       wait_images: bool = True, single_pass: bool = True) -> Dict:
+    """RAG query améliorée avec génération de contenu visuel.
+    
+    En mode single_pass (langues de ENHANCED_SYSTEM_PROMPT), le texte et la
+    description d'image sortent du même appel LLM ; le second appel de
+    generate_image_description ne sert que si la section est absente.
+    """
+    image_description = None
+    if single_pass and lang in ENHANCED_SYSTEM_PROMPT:
+        textual_response = generate_slide_with_description(sujet, niveau, current_topic, slide_number, lang, top_k)
+        image_description = extract_image_description(textual_response)
+    else:
+        # Génération du contenu textuel (code existant)
+        textual_response = rag_query(query, sujet, niveau, plan, history, current_topic, slide_number, lang, top_k)
+    
+    # Génération échouée : ni description d'image ni contenu visuel
+    if "❌" in textual_response and "Échec" in textual_response:
+        return {
+            "textual_content": textual_response,
+            "visual_content": None,
+            "slide_number": slide_number,
+            "topic": current_topic
+        }
     
-    # Génération de la description d'image
-    image_description = generate_image_description(textual_response, current_topic, sujet, lang)
+    # Génération de la description d'image (deuxième passe)
+    if image_description is None:
+        if single_pass and lang in ENHANCED_SYSTEM_PROMPT:
+            print("ℹ️ Description d'image absente, second appel au LLM")
+        image_description = generate_image_description(textual_response, current_topic, sujet, lang)
     
     # Génération du contenu visuel
-    visual_content = generate_visual_content(image_description, current_topic, sujet, slide_number)
+    visual_content = generate_visual_content(image_description, current_topic, sujet, slide_number, wait=wait_images)
     
     return {
         "textual_content": textual_response,
@@ -307,6 +435,25 @@ def enhanced_rag_query(query: str, sujet: str, niveau: str, plan: str, history:
         "topic": current_topic
     }
 
+def generate_enhanced_course(plan_parts: List[str], sujet: str, niveau: str, lang: str = "fr") -> List[Dict]:
+    """Générer les slides enrichies d'un plan ; les images des premières slides
+    sont rendues pendant que les suivantes s'écrivent"""
+    plan_input = "\n".join(plan_parts)
+    enhanced_slides = []
+    for slide_number, current_part in enumerate(plan_parts, 1):
+        print(f"\n📌 Slide {slide_number}/{len(plan_parts)} : {current_part}")
+        question = f"Expliquer {current_part} pour {niveau} niveau en {sujet}"
+        with tracer.slide(slide_number, current_part, lang=lang):
+            enhanced_slides.append(enhanced_rag_query(question, sujet, niveau, plan_input, "", current_part,
+                                                      slide_number, lang, wait_images=False))
+    
+    # Attendre les images encore en file
+    collect_images(enhanced_slides)
+    print(f"🖼️ Pipeline d'images : {get_image_pipeline().get_stats()}")
+    print(f"🗃️ Cache d'assets : {asset_cache.get_stats()}")
+    tracer.print_summary()
+    return enhanced_slides
+
 def save_enhanced_slides_to_json(slides, filename):
     """Sauvegarde les slides avec contenu visuel"""
     data = {
@@ -338,22 +485,32 @@ def enhanced_main():
     # Vérifier la disponibilité des outils de génération d'images
     print("\n🔍 Vérification des outils de génération d'images...")
     
-    # Test Stable Diffusion local
-    try:
-        test_response = requests.get("http://localhost:7860/", timeout=5)
+    # Test Stable Diffusion local (injoignable : ignoré pour toute la formation)
+    if get_image_pipeline().probe("local_sd", f"{LOCAL_SD_URL}/", timeout=5):
         print("✅ Stable Diffusion local détecté")
-    except:
+    else:
         print("❌ Stable Diffusion local non disponible")
     
-    # Logique de génération des slides (adaptée)
-    enhanced_slides = []
+    print("\n🧭 Donnez le plan de la formation (axes séparés par des virgules, ou un par ligne puis une ligne vide).")
+    lines = []
+    while True:
+        line = input()
+        if line.strip() == "":
+            break
+        lines.append(line.strip())
+    plan_parts = parse_plan("\n".join(lines))
+    if not plan_parts:
+        print("❌ Aucun plan fourni. Arrêt du programme.")
+        return
     
-    # ... (même logique que l'original mais avec enhanced_rag_query)
+    # Logique de génération des slides (adaptée)
+    enhanced_slides = generate_enhanced_course(plan_parts, sujet, niveau, lang)
+    save_enhanced_slides_to_json(enhanced_slides, f"{lang}-enhanced-slides-{sujet}.json")
+    get_image_pipeline().close()
     
     print("\n✅ Formation enrichie générée avec succès!")
     print("📁 Fichiers créés:")
-    print("   - Images dans ./images/")
-    print("   - Diagrammes dans ./diagrams/")
+    print(f"   - Images et diagrammes dans ./{ASSET_CACHE_DIR}/ (référencés par hash)")
     print("   - Slides JSON enrichies")
 
 if __name__ == "__main__":
@@ -0,0 +1,109 @@
+# generation_cache.py
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Optional
+
+DEFAULT_CACHE_PATH = "generation_cache/generations.sqlite"
+DEFAULT_TTL = 30 * 24 * 3600  # 30 jours
+DEFAULT_MAX_ENTRIES = 5000
+
+
+class GenerationCache:
+    """Cache SQLite des réponses du LLM, adressé par le contenu du prompt.
+
+    La clé est le hash SHA-256 du prompt complet, du nom du modèle et de ses
+    options : un prompt identique (même domaine, niveau, topic, slide, langue
+    et contexte) ne repasse pas par le LLM. Les entrées expirent après `ttl`
+    secondes et les moins récemment utilisées sont supprimées au-delà de
+    `max_entries`.
+    """
+
+    def __init__(self, path: str = DEFAULT_CACHE_PATH, ttl: float = DEFAULT_TTL, max_entries: int = DEFAULT_MAX_ENTRIES):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute(
+                """CREATE TABLE IF NOT EXISTS generations (
+                    key TEXT PRIMARY KEY,
+                    model TEXT NOT NULL,
+                    options TEXT NOT NULL,
+                    response TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_used REAL NOT NULL
+                )"""
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_last_used ON generations(last_used)")
+            self._conn.commit()
+        return self._conn
+
+    @staticmethod
+    def make_key(prompt: str, model: str, options: Optional[Dict] = None) -> str:
+        """Clé de cache : hash du prompt complet, du modèle et des options"""
+        payload = json.dumps({"model": model, "options": options or {}, "prompt": prompt},
+                             sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, prompt: str, model: str, options: Optional[Dict] = None) -> Optional[str]:
+        """Réponse en cache pour ce prompt, ou None (absente ou expirée)"""
+        key = self.make_key(prompt, model, options)
+        now = time.time()
+        with self._lock:
+            conn = self._connection()
+            row = conn.execute("SELECT response, created_at FROM generations WHERE key = ?", (key,)).fetchone()
+            if row is None or now - row[1] > self.ttl:
+                if row is not None:
+                    conn.execute("DELETE FROM generations WHERE key = ?", (key,))
+                    conn.commit()
+                self.stats["misses"] += 1
+                return None
+            conn.execute("UPDATE generations SET last_used = ? WHERE key = ?", (now, key))
+            conn.commit()
+            self.stats["hits"] += 1
+            return row[0]
+
+    def put(self, prompt: str, model: str, response: str, options: Optional[Dict] = None):
+        """Enregistrer une réponse puis appliquer l'éviction TTL / taille"""
+        key = self.make_key(prompt, model, options)
+        now = time.time()
+        with self._lock:
+            conn = self._connection()
+            conn.execute(
+                "INSERT OR REPLACE INTO generations (key, model, options, response, created_at, last_used) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (key, model, json.dumps(options or {}, sort_keys=True), response, now, now)
+            )
+            expired = conn.execute("DELETE FROM generations WHERE created_at < ?", (now - self.ttl,)).rowcount
+            overflow = conn.execute(
+                "DELETE FROM generations WHERE key IN ("
+                "SELECT key FROM generations ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,)
+            ).rowcount
+            conn.commit()
+            self.stats["evictions"] += expired + overflow
+
+    def clear(self):
+        """Vider le cache"""
+        with self._lock:
+            conn = self._connection()
+            conn.execute("DELETE FROM generations")
+            conn.commit()
+
+    def get_stats(self) -> Dict[str, int]:
+        """Compteurs hits / misses / evictions et nombre d'entrées"""
+        with self._lock:
+            entries = self._connection().execute("SELECT COUNT(*) FROM generations").fetchone()[0]
+            return dict(self.stats, entries=entries)
@@ -0,0 +1,219 @@
+# image_pipeline.py
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, List, Optional, Set
+
+from asset_cache import AssetCache, normalize_description
+from tracing import tracer
+
+DEFAULT_WORKERS = 2
+DEFAULT_MAX_PENDING = 8
+FAILURE_THRESHOLD = 3
+RESET_TIMEOUT = 120  # secondes avant de retenter un backend coupé
+
+
+class CircuitBreaker:
+    """Coupe-circuit d'un backend d'images.
+
+    Après `failure_threshold` échecs consécutifs le backend est ignoré pendant
+    `reset_timeout` secondes, puis un seul appel d'essai est autorisé : un
+    succès le rétablit, un échec le coupe à nouveau.
+    """
+
+    def __init__(self, failure_threshold: int = FAILURE_THRESHOLD, reset_timeout: float = RESET_TIMEOUT):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._trial_running = False
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._opened_at is None:
+                return "closed"
+            if time.monotonic() - self._opened_at >= self.reset_timeout:
+                return "half-open"
+            return "open"
+
+    def allow(self) -> bool:
+        """Le backend peut-il être appelé maintenant ?"""
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if time.monotonic() - self._opened_at < self.reset_timeout or self._trial_running:
+                return False
+            self._trial_running = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._trial_running = False
+            if self._opened_at is not None or self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+
+    def trip(self):
+        """Couper immédiatement (ex: backend injoignable au démarrage)"""
+        with self._lock:
+            self._failures = self.failure_threshold
+            self._opened_at = time.monotonic()
+            self._trial_running = False
+
+
+class ImagePipeline:
+    """File de génération d'images servie par un pool de threads borné.
+
+    Les backends sont essayés dans l'ordre ; chacun a son timeout et son
+    coupe-circuit, un backend en panne est donc ignoré au lieu d'être
+    réessayé à chaque slide. Les appels HTTP partagent une session
+    keep-alive. `submit` bloque quand `max_pending` images attendent déjà,
+    ce qui borne la file sans arrêter la rédaction des slides.
+
+    Chaque backend est un dict {"name", "render", "timeout", "params"} où
+    render(session, description, output_path, timeout) retourne True en cas de succès.
+    Avec un AssetCache, une image déjà générée pour la même description et les
+    mêmes paramètres est réutilisée, et une description déjà en file n'est
+    pas soumise deux fois.
+    """
+
+    def __init__(self, backends: List[Dict], max_workers: int = DEFAULT_WORKERS,
+                 max_pending: int = DEFAULT_MAX_PENDING, failure_threshold: int = FAILURE_THRESHOLD,
+                 reset_timeout: float = RESET_TIMEOUT, cache: Optional[AssetCache] = None):
+        self.backends = backends
+        self.cache = cache
+        self._inflight: Dict[str, Future] = {}
+        self._pending: Set[Future] = set()
+        self.max_workers = max(1, max_workers)
+        self.breakers = {b["name"]: CircuitBreaker(failure_threshold, reset_timeout) for b in backends}
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="image")
+        self._slots = threading.BoundedSemaphore(self.max_workers + max(0, max_pending))
+        self._session = None
+        self._lock = threading.Lock()
+        self.stats = {"submitted": 0, "generated": 0, "cached": 0, "deduplicated": 0, "failed": 0, "skipped": 0}
+
+    @property
+    def session(self):
+        """Session HTTP partagée par tous les backends (pool de connexions keep-alive)"""
+        if self._session is None:
+            import requests
+            from requests.adapters import HTTPAdapter
+
+            with self._lock:
+                if self._session is None:
+                    session = requests.Session()
+                    adapter = HTTPAdapter(pool_connections=len(self.backends) or 1, pool_maxsize=self.max_workers)
+                    session.mount("http://", adapter)
+                    session.mount("https://", adapter)
+                    self._session = session
+        return self._session
+
+    def _count(self, key: str):
+        with self._lock:
+            self.stats[key] += 1
+
+    def _render(self, description: str, output_path: str) -> Optional[str]:
+        """Essayer les backends disponibles dans l'ordre ; retourne le chemin de l'image ou None"""
+        keys = {}
+        if self.cache is not None:
+            for backend in self.backends:
+                keys[backend["name"]] = self.cache.make_key("image", backend["name"], description, backend.get("params"))
+                cached = self.cache.get(keys[backend["name"]])
+                if cached:
+                    self._count("cached")
+                    tracer.event("image_cache_hit", backend=backend["name"])
+                    return cached
+
+        for backend in self.backends:
+            name = backend["name"]
+            breaker = self.breakers[name]
+            if not breaker.allow():
+                self._count("skipped")
+                tracer.event("image_skipped", backend=name, breaker=breaker.state)
+                continue
+            target = self.cache.staging_path(".png") if self.cache is not None else output_path
+            with tracer.span("image", backend=name) as span:
+                try:
+                    ok = backend["render"](self.session, description, target, backend.get("timeout", 60))
+                except Exception as e:
+                    print(f"❌ Backend d'images {name}: {str(e)}")
+                    ok = False
+                if not ok:
+                    span["status"] = "error"
+            if ok:
+                breaker.record_success()
+                self._count("generated")
+                if self.cache is not None:
+                    return self.cache.put(keys[name], target, ".png", "image", name)
+                return target
+            if self.cache is not None and os.path.exists(target):
+                os.remove(target)
+            breaker.record_failure()
+            if breaker.state == "open":
+                print(f"⛔ Backend d'images {name} désactivé pour {breaker.reset_timeout:.0f}s")
+        self._count("failed")
+        return None
+
+    def submit(self, description: str, output_path: str) -> Future:
+        """Mettre une image en file ; le Future donne le chemin de l'image ou None"""
+        inflight_key = normalize_description(description)
+        if self.cache is not None:
+            with self._lock:
+                future = self._inflight.get(inflight_key)
+                if future is not None:
+                    self.stats["deduplicated"] += 1
+                    return future
+
+        self._slots.acquire()
+        self._count("submitted")
+        try:
+            # Les spans de l'image restent rattachés à la slide qui l'a demandée
+            future = self._executor.submit(tracer.wrap(self._render), description, output_path)
+        except Exception:
+            self._slots.release()
+            raise
+        with self._lock:
+            self._pending.add(future)
+            if self.cache is not None:
+                self._inflight[inflight_key] = future
+        future.add_done_callback(lambda _: self._finish(inflight_key, future))
+        return future
+
+    def _finish(self, inflight_key: str, future: Future):
+        with self._lock:
+            self._pending.discard(future)
+            if self._inflight.get(inflight_key) is future:
+                del self._inflight[inflight_key]
+        self._slots.release()
+
+    def probe(self, name: str, url: str, timeout: float = 5) -> bool:
+        """Vérifier qu'un backend répond ; sinon il est coupé tout de suite"""
+        try:
+            self.session.get(url, timeout=timeout)
+            return True
+        except Exception:
+            self.breakers[name].trip()
+            return False
+
+    def close(self, wait: bool = True):
+        """Attendre (ou abandonner) les images en file et libérer les threads"""
+        if not wait:
+            # Annuler à la main les images encore en file (cancel_futures n'existe qu'à partir de Python 3.9)
+            with self._lock:
+                pending = list(self._pending)
+            for future in pending:
+                future.cancel()
+        self._executor.shutdown(wait=wait)
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            return dict(self.stats, breakers={name: b.state for name, b in self.breakers.items()})
@@ -0,0 +1,118 @@
+# lexical_index.py
+import os
+import re
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+LEXICAL_SUFFIX = ".bm25.npz"
+BM25_K1 = 1.5
+BM25_B = 0.75
+RRF_K = 60
+
+# Identifiants de code : @Component, ArrayList, ng-model, System.out...
+TOKEN_PATTERN = re.compile(r"@?[A-Za-z_][A-Za-z0-9_]*")
+
+
+def lexical_index_path(index_path: str) -> str:
+    """Fichier de l'index lexical associé à un index FAISS (faiss_index/x.index -> faiss_index/x.bm25.npz)"""
+    return os.path.splitext(index_path)[0] + LEXICAL_SUFFIX
+
+
+def tokenize(text: str) -> List[str]:
+    """Tokens en minuscules ; une annotation (@Entity) produit aussi le mot nu (entity)"""
+    tokens = []
+    for token in TOKEN_PATTERN.findall(text):
+        token = token.lower()
+        tokens.append(token)
+        if token.startswith("@") and len(token) > 1:
+            tokens.append(token[1:])
+    return tokens
+
+
+def write_lexical_index(docs: List[Optional[str]], path: str):
+    """Construire l'index inversé des documents (ids alignés sur les ids FAISS).
+
+    Les postings sont stockés en CSR : pour le terme t (vocab trié),
+    doc_ids[indptr[t]:indptr[t + 1]] et tfs[...] donnent les documents et
+    fréquences. Les emplacements vides (None) ont une longueur nulle.
+    """
+    postings: Dict[str, Dict[int, int]] = {}
+    doc_lengths = np.zeros(len(docs), dtype="float32")
+    for doc_id, doc in enumerate(docs):
+        if not doc:
+            continue
+        tokens = tokenize(doc)
+        doc_lengths[doc_id] = len(tokens)
+        for token in tokens:
+            counts = postings.setdefault(token, {})
+            counts[doc_id] = counts.get(doc_id, 0) + 1
+
+    vocab = sorted(postings)
+    indptr = np.zeros(len(vocab) + 1, dtype="int64")
+    for t, term in enumerate(vocab):
+        indptr[t + 1] = indptr[t] + len(postings[term])
+    doc_ids = np.empty(int(indptr[-1]), dtype="int32")
+    tfs = np.empty(int(indptr[-1]), dtype="float32")
+    for t, term in enumerate(vocab):
+        items = sorted(postings[term].items())
+        doc_ids[indptr[t]:indptr[t + 1]] = [doc_id for doc_id, _ in items]
+        tfs[indptr[t]:indptr[t + 1]] = [tf for _, tf in items]
+
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path + ".tmp", "wb") as f:
+        np.savez(f, vocab=np.array(vocab, dtype="U"), indptr=indptr, doc_ids=doc_ids,
+                 tfs=tfs, doc_lengths=doc_lengths)
+    os.replace(path + ".tmp", path)
+
+
+class LexicalIndex:
+    """Index inversé BM25 en mémoire, chargé depuis le fichier écrit par le builder"""
+
+    def __init__(self, path: str, k1: float = BM25_K1, b: float = BM25_B):
+        with np.load(path) as data:
+            vocab = data["vocab"]
+            self.indptr = data["indptr"]
+            self.doc_ids = data["doc_ids"]
+            self.tfs = data["tfs"]
+            doc_lengths = data["doc_lengths"]
+        self.terms = {term: t for t, term in enumerate(vocab.tolist())}
+        self.k1, self.b = k1, b
+
+        n_docs = int(np.count_nonzero(doc_lengths))
+        avg_length = float(doc_lengths.sum()) / n_docs if n_docs else 1.0
+        doc_freq = np.diff(self.indptr).astype("float32")
+        self.idf = np.log(1.0 + (n_docs - doc_freq + 0.5) / (doc_freq + 0.5)).astype("float32")
+        # Dénominateur BM25 précalculé par document : k1 * (1 - b + b * |d| / avgdl)
+        self.norm = (k1 * (1.0 - b + b * doc_lengths / avg_length)).astype("float32")
+
+    def __len__(self) -> int:
+        return len(self.norm)
+
+    def search(self, query: str, top_k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """(scores, ids) BM25 des top_k documents contenant au moins un terme de la requête"""
+        scores = np.zeros(len(self.norm), dtype="float32")
+        for token in set(tokenize(query)):
+            t = self.terms.get(token)
+            if t is None:
+                continue
+            start, end = self.indptr[t], self.indptr[t + 1]
+            ids, tf = self.doc_ids[start:end], self.tfs[start:end]
+            scores[ids] += self.idf[t] * tf * (self.k1 + 1.0) / (tf + self.norm[ids])
+
+        matched = np.flatnonzero(scores)
+        if len(matched) > top_k:
+            matched = matched[np.argpartition(-scores[matched], top_k - 1)[:top_k]]
+        order = matched[np.argsort(-scores[matched], kind="stable")]
+        return scores[order], order
+
+
+def reciprocal_rank_fusion(rankings: List[List], k: int = RRF_K) -> List[Tuple[object, float]]:
+    """Fusionner plusieurs classements (listes de clés, meilleure en premier) : score = somme de 1 / (k + rang)"""
+    fused: Dict[object, float] = {}
+    for ranking in rankings:
+        for rank, key in enumerate(ranking, 1):
+            fused[key] = fused.get(key, 0.0) + 1.0 / (k + rank)
+    return sorted(fused.items(), key=lambda item: item[1], reverse=True)
@@ -0,0 +1,125 @@
+# ollama_client.py
+import json
+import os
+import threading
+import time
+from typing import Dict, Iterator, Optional
+
+# ==== Configuration du serveur Ollama ====
+OLLAMA_HOST = os.environ.get("OLLAMA_HOST", "http://localhost:11434")
+OLLAMA_MODEL = os.environ.get("OLLAMA_MODEL", "llama3")
+# Durée pendant laquelle Ollama garde le modèle chargé en mémoire après un appel
+OLLAMA_KEEP_ALIVE = os.environ.get("OLLAMA_KEEP_ALIVE", "30m")
+CONNECT_TIMEOUT = 5
+
+
+def _normalize_base_url(host: str) -> str:
+    """OLLAMA_HOST peut être donné sans schéma (ex: 127.0.0.1:11434)"""
+    if not host.startswith(("http://", "https://")):
+        host = f"http://{host}"
+    return host.rstrip("/")
+
+
+class OllamaClient:
+    """Client HTTP vers l'API REST d'Ollama (/api/generate).
+
+    Les connexions sont réutilisées via un pool keep-alive et l'état du
+    serveur n'est vérifié qu'une fois (résultat positif mis en cache pendant
+    health_ttl secondes, invalidé dès qu'un appel échoue à se connecter).
+    """
+
+    def __init__(self, base_url: str = OLLAMA_HOST, model: str = OLLAMA_MODEL,
+                 keep_alive: str = OLLAMA_KEEP_ALIVE, pool_size: int = 8, health_ttl: float = 300):
+        self.base_url = _normalize_base_url(base_url)
+        self.model = model
+        self.keep_alive = keep_alive
+        self.health_ttl = health_ttl
+        self.pool_size = pool_size
+
+        self._session = None
+        self._lock = threading.Lock()
+        self._healthy_until = 0.0
+
+    @property
+    def session(self):
+        """Session HTTP créée au premier appel (requests n'est importé qu'à ce moment)"""
+        if self._session is None:
+            import requests
+            from requests.adapters import HTTPAdapter
+
+            with self._lock:
+                if self._session is None:
+                    session = requests.Session()
+                    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size)
+                    session.mount("http://", adapter)
+                    session.mount("https://", adapter)
+                    self._session = session
+        return self._session
+
+    def is_available(self, force: bool = False) -> bool:
+        """Vérifier que le serveur Ollama répond (GET /api/tags)"""
+        import requests
+        with self._lock:
+            if not force and time.monotonic() < self._healthy_until:
+                return True
+        try:
+            response = self.session.get(f"{self.base_url}/api/tags", timeout=CONNECT_TIMEOUT)
+            healthy = response.status_code == 200
+        except requests.RequestException:
+            healthy = False
+        with self._lock:
+            self._healthy_until = time.monotonic() + self.health_ttl if healthy else 0.0
+        return healthy
+
+    def _post(self, endpoint: str, payload: Dict, timeout: float) -> Dict:
+        import requests
+        try:
+            response = self.session.post(f"{self.base_url}{endpoint}", json=payload,
+                                         timeout=(CONNECT_TIMEOUT, timeout))
+        except requests.ConnectionError:
+            # Serveur injoignable : forcer une nouvelle vérification au prochain appel
+            with self._lock:
+                self._healthy_until = 0.0
+            raise
+        response.raise_for_status()
+        return response.json()
+
+    def _payload(self, options: Optional[Dict]) -> Dict:
+        payload = {"model": self.model, "stream": False, "keep_alive": self.keep_alive}
+        if options:
+            payload["options"] = options
+        return payload
+
+    def generate(self, prompt: str, timeout: float = 300, options: Optional[Dict] = None) -> str:
+        """Complétion simple via /api/generate"""
+        payload = self._payload(options)
+        payload["prompt"] = prompt
+        return self._post("/api/generate", payload, timeout).get("response", "")
+
+    def generate_stream(self, prompt: str, timeout: float = 300, options: Optional[Dict] = None) -> Iterator[str]:
+        """Complétion en streaming via /api/generate : produit les tokens au fil de l'eau.
+
+        `timeout` borne l'attente entre deux morceaux reçus, pas la durée totale.
+        """
+        payload = self._payload(options)
+        payload.update(prompt=prompt, stream=True)
+        import requests
+        try:
+            response = self.session.post(f"{self.base_url}/api/generate", json=payload,
+                                         timeout=(CONNECT_TIMEOUT, timeout), stream=True)
+        except requests.ConnectionError:
+            with self._lock:
+                self._healthy_until = 0.0
+            raise
+        with response:
+            response.raise_for_status()
+            for line in response.iter_lines():
+                if not line:
+                    continue
+                chunk = json.loads(line)
+                if chunk.get("error"):
+                    raise RuntimeError(chunk["error"])
+                if chunk.get("response"):
+                    yield chunk["response"]
+                if chunk.get("done"):
+                    break
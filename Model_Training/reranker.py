@@ -0,0 +1,92 @@
+# reranker.py
+import threading
+import time
+from typing import Dict, List, Optional
+
+DEFAULT_RERANK_MODEL = "cross-encoder/ms-marco-MiniLM-L-6-v2"
+DEFAULT_BATCH_SIZE = 16
+DEFAULT_MAX_LATENCY_MS = 300.0
+# Longueur maximale (caractères) d'un passage envoyé au cross-encoder
+MAX_PASSAGE_CHARS = 1000
+
+
+class Reranker:
+    """Re-classement des candidats par un petit cross-encoder CPU.
+
+    Les paires (requête, passage) de toutes les requêtes sont scorées ensemble
+    par batches de `batch_size`, candidats les mieux classés d'abord. Si
+    `max_latency_ms` est dépassé, les batches restants ne sont pas scorés :
+    ces candidats gardent leur ordre de recherche, derrière les candidats
+    re-classés de leur requête. Le modèle (sentence-transformers) n'est chargé
+    qu'au premier appel.
+    """
+
+    def __init__(self, model_name: str = DEFAULT_RERANK_MODEL, batch_size: int = DEFAULT_BATCH_SIZE,
+                 max_latency_ms: float = DEFAULT_MAX_LATENCY_MS):
+        self.model_name = model_name
+        self.batch_size = max(1, batch_size)
+        self.max_latency_ms = max_latency_ms
+        self._model = None
+        self._lock = threading.Lock()
+        self.stats = {"queries": 0, "pairs": 0, "scored": 0, "capped": 0}
+
+    @property
+    def model(self):
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    from sentence_transformers import CrossEncoder
+                    print(f"🧠 Chargement du re-ranker {self.model_name}...")
+                    self._model = CrossEncoder(self.model_name, device="cpu")
+        return self._model
+
+    def rerank_many(self, queries: List[str], candidates: List[List[Dict]], top_k: int) -> List[List[Dict]]:
+        """Top-k re-classés de chaque requête ; chaque hit gardé reçoit un champ "rerank" s'il a été scoré"""
+        # Rang 0 de toutes les requêtes, puis rang 1... : un plafond de latence
+        # atteint en cours de route pénalise les derniers candidats, pas les dernières requêtes
+        pairs = [(q, rank) for rank in range(max((len(c) for c in candidates), default=0))
+                 for q in range(len(queries)) if rank < len(candidates[q])]
+        scores: Dict[tuple, float] = {}
+        model = self.model if pairs else None
+        start = time.perf_counter()
+        for i in range(0, len(pairs), self.batch_size):
+            if i and (time.perf_counter() - start) * 1000 > self.max_latency_ms:
+                self.stats["capped"] += 1
+                break
+            batch = pairs[i:i + self.batch_size]
+            predicted = model.predict([(queries[q], candidates[q][rank]["text"][:MAX_PASSAGE_CHARS])
+                                       for q, rank in batch], batch_size=self.batch_size)
+            for (q, rank), score in zip(batch, predicted):
+                scores[(q, rank)] = float(score)
+
+        with self._lock:
+            self.stats["queries"] += len(queries)
+            self.stats["pairs"] += len(pairs)
+            self.stats["scored"] += len(scores)
+
+        results = []
+        for q, hits in enumerate(candidates):
+            scored = sorted((rank for rank in range(len(hits)) if (q, rank) in scores),
+                            key=lambda rank: scores[(q, rank)], reverse=True)
+            unscored = [rank for rank in range(len(hits)) if (q, rank) not in scores]
+            results.append([dict(hits[rank], rerank=scores[(q, rank)]) if (q, rank) in scores else hits[rank]
+                            for rank in (scored + unscored)[:top_k]])
+        return results
+
+    def get_stats(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self.stats)
+
+
+_reranker: Optional[Reranker] = None
+_reranker_lock = threading.Lock()
+
+
+def get_reranker(model_name: str = DEFAULT_RERANK_MODEL, batch_size: int = DEFAULT_BATCH_SIZE,
+                 max_latency_ms: float = DEFAULT_MAX_LATENCY_MS) -> Reranker:
+    """Re-ranker partagé par le processus (créé au premier appel)"""
+    global _reranker
+    with _reranker_lock:
+        if _reranker is None:
+            _reranker = Reranker(model_name, batch_size, max_latency_ms)
+        return _reranker
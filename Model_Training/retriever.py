@@ -0,0 +1,350 @@
+# retriever.py
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+from doc_store import DocStore, has_doc_store, store_paths
+from lexical_index import LexicalIndex, lexical_index_path
+from tracing import tracer
+
+
+# Clé interne de l'index combiné (tous les domaines, ids étiquetés par domaine)
+COMBINED_KEY = "__combined__"
+# Les ids de l'index combiné valent (étiquette du domaine << TAG_SHIFT) | id local
+TAG_SHIFT = 32
+
+
+def combined_tags_path(index_path: str) -> str:
+    """Fichier associant chaque domaine à son étiquette dans l'index combiné"""
+    return os.path.splitext(index_path)[0] + ".domains.json"
+
+
+def manifest_path_for(index_path: str) -> str:
+    """Chemin du manifeste stocké à côté de l'index (faiss_index/x.index -> faiss_index/x.manifest.json)"""
+    return os.path.splitext(index_path)[0] + ".manifest.json"
+
+
+def l2_to_similarity(distance: float) -> float:
+    """Distance L2 au carré -> similarité cosinus (vecteurs normalisés, comme MiniLM).
+
+    Rend les scores comparables d'un index à l'autre ; 0.0 correspond à l'ancien seuil L2 < 2.0.
+    """
+    return 1.0 - float(distance) / 2.0
+
+
+def similarity_function(index):
+    """Conversion du score FAISS en similarité cosinus selon la métrique de l'index.
+
+    Index produit scalaire (index_spec "metric": "ip") : le score est déjà le
+    cosinus ; index L2 (historique) : voir l2_to_similarity.
+    """
+    import faiss
+    if index.metric_type == faiss.METRIC_INNER_PRODUCT:
+        return float
+    return l2_to_similarity
+
+
+def manifest_hash(index_path: str) -> Optional[str]:
+    """Version d'un domaine : hash de son manifeste (réécrit à chaque mise à jour de l'index), None s'il manque"""
+    path = manifest_path_for(index_path)
+    return _file_hash(path) if os.path.exists(path) else None
+
+
+def _file_signature(path: str) -> Tuple[int, int]:
+    """Signature rapide d'un fichier : (mtime en ns, taille)"""
+    stat = os.stat(path)
+    return stat.st_mtime_ns, stat.st_size
+
+
+def _file_hash(path: str) -> str:
+    """Hash SHA-256 du contenu d'un fichier, lu par blocs"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class DomainRetrieverRegistry:
+    """Registre process-wide des index FAISS et documents par domaine.
+
+    Chaque domaine est chargé une seule fois puis gardé en mémoire. Il n'est
+    rechargé que si le mtime/la taille d'un fichier change ET que son contenu
+    (hash SHA-256) a réellement changé.
+    """
+
+    def __init__(self, domains: Dict[str, Dict[str, str]], verify_hash: bool = True,
+                 combined_index: Optional[str] = None, max_workers: Optional[int] = None):
+        self.domains = domains
+        self.verify_hash = verify_hash
+        self.combined_index = combined_index
+        self.max_workers = max_workers or max(1, len(domains))
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._entries: Dict[str, Dict] = {}
+        self._locks: Dict[str, threading.Lock] = {}
+        self._registry_lock = threading.Lock()
+        self._manifest_hashes: Dict[str, Tuple[Tuple[int, int], str]] = {}
+        self._stale_warned = False
+        self._stats = {"hits": 0, "misses": 0, "reloads": 0}
+
+    def _domain_lock(self, sujet: str) -> threading.Lock:
+        with self._registry_lock:
+            return self._locks.setdefault(sujet, threading.Lock())
+
+    def _count(self, key: str):
+        with self._registry_lock:
+            self._stats[key] += 1
+
+    def _apply_search_params(self, sujet: str, index):
+        """Régler les paramètres de recherche (nprobe, efSearch...) déclarés pour le domaine"""
+        import faiss
+        params = self.domains[sujet].get("search_params") or {}
+        space = faiss.ParameterSpace()
+        for name, value in params.items():
+            space.set_index_parameter(index, name, value)
+
+    def _domain_files(self, sujet: str) -> Dict[str, str]:
+        """Fichiers surveillés d'un domaine : index + store binaire (ou JSON historique)"""
+        if sujet == COMBINED_KEY:
+            return {"index": self.combined_index, "tags": combined_tags_path(self.combined_index)}
+        docs_path = self.domains[sujet]["docs"]
+        files = {"index": self.domains[sujet]["index"]}
+        if has_doc_store(docs_path):
+            files["blob"], files["offsets"] = store_paths(docs_path)
+        else:
+            files["docs"] = docs_path
+        if os.path.exists(lexical_index_path(files["index"])):
+            files["lexical"] = lexical_index_path(files["index"])
+        return files
+
+    def _load(self, sujet: str) -> Dict:
+        """Charger l'index et les documents d'un domaine (memory-mappés si possible)"""
+        import faiss  # import différé : inutile tant qu'aucune recherche n'est faite
+        files = self._domain_files(sujet)
+
+        # IO_FLAG_MMAP : seules les pages touchées par la recherche sont chargées
+        index = faiss.read_index(files["index"], faiss.IO_FLAG_MMAP)
+        manifests = None
+        if sujet == COMBINED_KEY:
+            with open(files["tags"], "r", encoding="utf-8") as f:
+                docs = json.load(f)
+            # Ancien format {domaine: étiquette} : versions des domaines inconnues, index considéré périmé
+            if "tags" in docs:
+                docs, manifests = docs["tags"], docs.get("manifests")
+        elif "blob" in files:
+            self._apply_search_params(sujet, index)
+            docs = DocStore(self.domains[sujet]["docs"])
+        else:
+            self._apply_search_params(sujet, index)
+            with open(files["docs"], "r", encoding="utf-8") as f:
+                docs = json.load(f)
+
+        return {
+            "index": index,
+            "docs": docs,
+            "lexical": LexicalIndex(files["lexical"]) if "lexical" in files else None,
+            "manifests": manifests,
+            "files": files,
+            "signatures": {key: _file_signature(path) for key, path in files.items()},
+            "hashes": {key: _file_hash(path) if self.verify_hash else None for key, path in files.items()},
+        }
+
+    def _is_stale(self, sujet: str, entry: Dict) -> bool:
+        """Vérifier si les fichiers d'un domaine ont changé depuis le chargement"""
+        if self._domain_files(sujet) != entry["files"]:
+            return True
+        stale = False
+        for key, path in entry["files"].items():
+            signature = _file_signature(path)
+            if signature == entry["signatures"][key]:
+                continue
+            if self.verify_hash and _file_hash(path) == entry["hashes"][key]:
+                # Fichier "touché" mais contenu identique : pas de rechargement
+                entry["signatures"][key] = signature
+                continue
+            stale = True
+        return stale
+
+    def get(self, sujet: str):
+        """Retourner (index, docs) pour un domaine, en les chargeant si nécessaire.
+
+        Pour COMBINED_KEY, retourne (index combiné, {domaine: étiquette}).
+        """
+        if sujet not in self.domains and not (sujet == COMBINED_KEY and self.combined_index):
+            raise KeyError(f"Domaine '{sujet}' non disponible")
+
+        with self._domain_lock(sujet):
+            entry = self._entries.get(sujet)
+            if entry is None:
+                self._count("misses")
+                with tracer.span("index_load", domain=sujet):
+                    entry = self._load(sujet)
+                self._entries[sujet] = entry
+            elif self._is_stale(sujet, entry):
+                self._count("reloads")
+                print(f"🔄 Rechargement de l'index '{sujet}' (fichiers modifiés)")
+                with tracer.span("index_load", domain=sujet, reload=True):
+                    entry = self._load(sujet)
+                self._entries[sujet] = entry
+            else:
+                self._count("hits")
+            return entry["index"], entry["docs"]
+
+    # ---- Recherche ----
+
+    def search(self, sujet: str, query_vectors, top_k: int) -> Tuple[List[List[Dict]], float]:
+        """Recherche dans un domaine, une ligne de hits par requête (un seul appel FAISS).
+
+        Chaque hit contient le domaine, l'id, le score et le texte ; retourne aussi la latence en ms.
+        """
+        start = time.perf_counter()
+        index, docs = self.get(sujet)
+        distances, indices = index.search(query_vectors, top_k)
+        to_similarity = similarity_function(index)
+        results = []
+        for row_distances, row_indices in zip(distances, indices):
+            hits = []
+            for distance, idx in zip(row_distances, row_indices):
+                if 0 <= idx < len(docs) and docs[idx]:
+                    hits.append({"domain": sujet, "id": int(idx), "score": to_similarity(distance),
+                                 "text": docs[idx]})
+            results.append(hits)
+        return results, (time.perf_counter() - start) * 1000
+
+    def _pool(self) -> ThreadPoolExecutor:
+        with self._registry_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers,
+                                                    thread_name_prefix="faiss-shard")
+            return self._executor
+
+    def federated_search(self, sujets: List[str], query_vectors, top_k: int) -> Tuple[List[List[Dict]], Dict[str, float]]:
+        """Recherche parallèle dans plusieurs domaines, fusion des top-k par score normalisé.
+
+        Les requêtes sont encodées une seule fois par l'appelant ; FAISS
+        relâche le GIL, les domaines sont donc réellement cherchés en parallèle.
+        Retourne les hits fusionnés par requête et la latence (ms) par domaine et totale.
+        """
+        start = time.perf_counter()
+        if len(sujets) == 1:
+            results, latency = self.search(sujets[0], query_vectors, top_k)
+            return results, {sujets[0]: latency, "total": (time.perf_counter() - start) * 1000}
+
+        futures = {s: self._pool().submit(self.search, s, query_vectors, top_k) for s in sujets}
+        merged, latencies = [[] for _ in range(len(query_vectors))], {}
+        for sujet, future in futures.items():
+            results, latencies[sujet] = future.result()
+            for row, hits in zip(merged, results):
+                row.extend(hits)
+        for row in merged:
+            row.sort(key=lambda hit: hit["score"], reverse=True)
+            del row[top_k:]
+        latencies["total"] = (time.perf_counter() - start) * 1000
+        return merged, latencies
+
+    def _domain_version(self, sujet: str) -> Optional[str]:
+        """manifest_hash d'un domaine, recalculé seulement si le mtime/la taille du manifeste change"""
+        index_path = self.domains[sujet]["index"]
+        try:
+            signature = _file_signature(manifest_path_for(index_path))
+        except OSError:
+            return None
+        cached = self._manifest_hashes.get(sujet)
+        if cached is None or cached[0] != signature:
+            cached = (signature, manifest_hash(index_path))
+            self._manifest_hashes[sujet] = cached
+        return cached[1]
+
+    def combined_is_fresh(self, sujets: List[str]) -> bool:
+        """L'index combiné a-t-il été construit sur les versions actuelles de ces domaines ?"""
+        self.get(COMBINED_KEY)
+        manifests = self._entries[COMBINED_KEY]["manifests"]
+        if manifests is None:
+            return False
+        return all(manifests.get(s) is not None and manifests.get(s) == self._domain_version(s) for s in sujets)
+
+    def combined_search(self, query_vectors, top_k: int, sujets: Optional[List[str]] = None) -> Tuple[List[List[Dict]], Dict[str, float]]:
+        """Recherche dans l'index combiné, filtrée sur `sujets` par étiquette de domaine.
+
+        Si un domaine a été reconstruit depuis l'index combiné (ids locaux
+        libérés ou réutilisés), la recherche se replie sur federated_search.
+        """
+        import faiss
+        start = time.perf_counter()
+        index, tags = self.get(COMBINED_KEY)
+        checked = [s for s in (sujets or tags) if s in self.domains]
+        if not self.combined_is_fresh(checked):
+            if not self._stale_warned:
+                self._stale_warned = True
+                print("⚠️ Index combiné périmé (domaine reconstruit depuis) : recherche par domaine. "
+                      "Relancez build_faiss_index.py pour le mettre à jour.")
+            return self.federated_search(checked, query_vectors, top_k)
+
+        params = None
+        selectors = [faiss.IDSelectorRange(tags[s] << TAG_SHIFT, (tags[s] + 1) << TAG_SHIFT)
+                     for s in (sujets or []) if s in tags]
+        if selectors:
+            selector = selectors[0]
+            for other in selectors[1:]:
+                selector = faiss.IDSelectorOr(selector, other)
+                selectors.append(selector)  # garder les références Python vivantes
+            params = faiss.SearchParameters(sel=selector)
+
+        distances, ids = index.search(query_vectors, top_k, params=params)
+        to_similarity = similarity_function(index)
+        domain_by_tag = {tag: s for s, tag in tags.items()}
+        results = []
+        for row_distances, row_ids in zip(distances, ids):
+            hits = []
+            for distance, tagged_id in zip(row_distances, row_ids):
+                if tagged_id < 0:
+                    continue
+                sujet = domain_by_tag.get(int(tagged_id) >> TAG_SHIFT)
+                local_id = int(tagged_id) & ((1 << TAG_SHIFT) - 1)
+                if sujet is None:
+                    continue
+                _, docs = self.get(sujet)
+                if local_id < len(docs) and docs[local_id]:
+                    hits.append({"domain": sujet, "id": local_id, "score": to_similarity(distance),
+                                 "text": docs[local_id]})
+            results.append(hits)
+        return results, {"combined": (time.perf_counter() - start) * 1000}
+
+    def lexical_search(self, sujets: List[str], queries: List[str], top_k: int) -> List[List[Dict]]:
+        """Recherche BM25 dans les index lexicaux des domaines, classée par score BM25.
+
+        Les domaines sans index lexical (construits avant son introduction) sont ignorés.
+        """
+        results = [[] for _ in queries]
+        for sujet in sujets:
+            _, docs = self.get(sujet)
+            lexical = self._entries[sujet]["lexical"]
+            if lexical is None:
+                continue
+            for row, query in zip(results, queries):
+                scores, ids = lexical.search(query, top_k)
+                for score, idx in zip(scores, ids):
+                    if idx < len(docs) and docs[idx]:
+                        row.append({"domain": sujet, "id": int(idx), "bm25": float(score),
+                                    "text": docs[idx]})
+        for row in results:
+            row.sort(key=lambda hit: hit["bm25"], reverse=True)
+            del row[top_k:]
+        return results
+
+    def invalidate(self, sujet: Optional[str] = None):
+        """Oublier un domaine (ou tous) pour forcer un rechargement"""
+        with self._registry_lock:
+            if sujet is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(sujet, None)
+
+    def get_stats(self) -> Dict[str, int]:
+        """Compteurs hits / misses / reloads"""
+        with self._registry_lock:
+            return dict(self._stats)
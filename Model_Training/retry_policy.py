@@ -0,0 +1,217 @@
+# retry_policy.py
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable, Optional
+
+from tracing import tracer
+
+# Codes HTTP pour lesquels une nouvelle tentative a des chances d'aboutir
+RETRYABLE_STATUS = {408, 425, 429, 500, 502, 503, 504}
+# En dessous de ce temps restant, une tentative n'a plus de sens (secondes)
+MIN_ATTEMPT_TIME = 2.0
+# Nombre de latences observées avant d'activer les requêtes de couverture
+HEDGE_MIN_SAMPLES = 5
+
+
+class RetryError(Exception):
+    """Échec définitif : erreur non récupérable, tentatives épuisées ou échéance dépassée"""
+
+    def __init__(self, reason: str, last_error: Optional[BaseException] = None):
+        super().__init__(reason)
+        self.reason = reason
+        self.last_error = last_error
+
+
+class EmptyResponse(Exception):
+    """Réponse vide du serveur (traitée comme une erreur récupérable)"""
+
+
+def classify_error(error: BaseException) -> str:
+    """"retryable" (timeout, connexion, 5xx/429, réponse vide ou illisible) ou "fatal" (4xx, bug)"""
+    import requests
+    if isinstance(error, (requests.Timeout, requests.ConnectionError, EmptyResponse)):
+        return "retryable"
+    if isinstance(error, requests.HTTPError):
+        status = error.response.status_code if error.response is not None else None
+        return "retryable" if status is None or status in RETRYABLE_STATUS else "fatal"
+    if isinstance(error, ValueError):  # JSON tronqué
+        return "retryable"
+    return "fatal"
+
+
+class LatencyWindow:
+    """Dernières latences réussies, pour déclencher une requête de couverture au-delà d'un percentile"""
+
+    def __init__(self, size: int = 50):
+        self._values = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float):
+        with self._lock:
+            self._values.append(seconds)
+
+    def __len__(self) -> int:
+        return len(self._values)
+
+    def percentile(self, q: float) -> Optional[float]:
+        with self._lock:
+            values = sorted(self._values)
+        if not values:
+            return None
+        return values[min(len(values) - 1, int(round(q * (len(values) - 1))))]
+
+
+class RetryPolicy:
+    """Nouvelles tentatives avec backoff exponentiel à jitter, échéance globale et couverture.
+
+    - délai avant la tentative n+1 : moitié fixe + moitié aléatoire de
+      min(max_delay, base_delay * 2**n) ("equal jitter"), pour que des slides
+      en échec simultané ne relancent pas toutes au même instant ;
+    - `deadline` (secondes) borne la durée totale, backoff compris : le timeout
+      de chaque tentative est réduit au temps restant ;
+    - une erreur "fatal" (voir classify_error) arrête tout de suite ;
+    - avec `hedge_quantile` (ex: 0.95), si une tentative dépasse ce percentile des
+      latences observées, une seconde requête identique est lancée et la
+      première réponse valide est gardée.
+    """
+
+    def __init__(self, max_attempts: int = 3, attempt_timeout: float = 300, deadline: Optional[float] = None,
+                 base_delay: float = 1.0, max_delay: float = 20.0, hedge_quantile: Optional[float] = None):
+        self.max_attempts = max(1, max_attempts)
+        self.attempt_timeout = attempt_timeout
+        self.deadline = deadline
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.hedge_quantile = hedge_quantile
+
+    def delay(self, attempt: int) -> float:
+        """Attente avant la tentative suivante (attempt commence à 0)"""
+        ceiling = min(self.max_delay, self.base_delay * (2 ** attempt))
+        return ceiling / 2 + random.uniform(0, ceiling / 2)
+
+
+_hedge_executor: Optional[ThreadPoolExecutor] = None
+_hedge_lock = threading.Lock()
+
+
+def _hedge_pool() -> ThreadPoolExecutor:
+    global _hedge_executor
+    with _hedge_lock:
+        if _hedge_executor is None:
+            _hedge_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="hedge")
+        return _hedge_executor
+
+
+def _discard_when_done(future, discard: Optional[Callable[[object], None]]):
+    """Passer à discard le résultat d'un appel perdant, dès qu'il est disponible"""
+    if discard is None:
+        return
+    future.add_done_callback(lambda f: discard(f.result()) if f.exception() is None else None)
+
+def _hedged_call(call: Callable[[float], object], timeout: float, hedge_after: float, name: str,
+                 accept: Callable[[object], bool] = bool, discard: Optional[Callable[[object], None]] = None):
+    """Lancer call(timeout) ; passé hedge_after secondes sans réponse, lancer une copie et garder la première réussie.
+
+    Une réponse refusée par `accept` ou une erreur de l'une des requêtes ne met
+    pas fin à l'attente : l'autre requête en cours peut encore réussir. La
+    requête perdante n'est pas interrompue (requests ne sait pas annuler un
+    appel en cours) : son résultat est passé à `discard` (ex: fermer un stream).
+    """
+    pool = _hedge_pool()
+    primary = pool.submit(tracer.wrap(call), timeout)
+    done, _ = wait([primary], timeout=hedge_after)
+    if done:
+        return primary.result()
+    tracer.event(f"{name}_hedge", after_ms=round(hedge_after * 1000, 1))
+    print(f"🪁 Pas de réponse après {hedge_after:.1f}s, requête de couverture lancée")
+    pending = {primary, pool.submit(tracer.wrap(call), max(MIN_ATTEMPT_TIME, timeout - hedge_after))}
+    error: Optional[BaseException] = None
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            try:
+                result = future.result()
+            except Exception as e:
+                error = e
+                continue
+            if not accept(result):
+                error = EmptyResponse("réponse vide")
+                _discard_when_done(future, discard)
+                continue
+            for other in (done - {future}) | pending:
+                _discard_when_done(other, discard)
+            return result
+    raise error
+
+
+def run_with_retry(call: Callable[[float], object], policy: RetryPolicy, accept: Callable[[object], bool] = bool,
+                   latencies: Optional[LatencyWindow] = None, name: str = "llm",
+                   discard: Optional[Callable[[object], None]] = None):
+    """Appeler call(timeout) selon la politique ; retourne le premier résultat accepté.
+
+    Lève RetryError si l'erreur est fatale, si les tentatives sont épuisées ou
+    si l'échéance est atteinte. Chaque tentative, attente et erreur est tracée
+    (étapes `name`, `name`_backoff, `name`_timeout, `name`_error). Les résultats
+    non retenus (refusés, ou requête de couverture perdante) sont passés à `discard`.
+    """
+    import requests
+    start = time.monotonic()
+    last_error: Optional[BaseException] = None
+
+    for attempt in range(policy.max_attempts):
+        timeout = policy.attempt_timeout
+        if policy.deadline is not None:
+            remaining = policy.deadline - (time.monotonic() - start)
+            if remaining < MIN_ATTEMPT_TIME:
+                tracer.event(f"{name}_deadline", attempt=attempt + 1, deadline=policy.deadline)
+                raise RetryError(f"échéance de {policy.deadline:.0f}s atteinte", last_error)
+            timeout = min(timeout, remaining)
+
+        hedge_after = None
+        if policy.hedge_quantile is not None and latencies is not None and len(latencies) >= HEDGE_MIN_SAMPLES:
+            hedge_after = latencies.percentile(policy.hedge_quantile)
+            if hedge_after is not None and hedge_after >= timeout:
+                hedge_after = None
+
+        print(f"🔄 Tentative {attempt + 1}/{policy.max_attempts}")
+        attempt_start = time.monotonic()
+        try:
+            with tracer.span(name, attempt=attempt + 1, timeout=round(timeout, 1), hedged=hedge_after is not None):
+                if hedge_after is not None:
+                    result = _hedged_call(call, timeout, hedge_after, name, accept, discard)
+                else:
+                    result = call(timeout)
+            if not accept(result):
+                if discard is not None:
+                    discard(result)
+                raise EmptyResponse("réponse vide")
+            if latencies is not None:
+                latencies.record(time.monotonic() - attempt_start)
+            return result
+        except Exception as e:
+            last_error = e
+            kind = classify_error(e)
+            if isinstance(e, requests.Timeout):
+                print(f"❌ Timeout ({timeout:.0f}s) - Tentative {attempt + 1}")
+                tracer.event(f"{name}_timeout", attempt=attempt + 1, timeout=round(timeout, 1))
+            else:
+                print(f"❌ Erreur: {str(e)}")
+                tracer.event(f"{name}_error", attempt=attempt + 1, error=type(e).__name__, kind=kind)
+            if kind == "fatal":
+                raise RetryError(f"erreur non récupérable ({type(e).__name__})", e)
+
+        if attempt < policy.max_attempts - 1:
+            delay = policy.delay(attempt)
+            if policy.deadline is not None:
+                remaining = policy.deadline - (time.monotonic() - start)
+                if remaining - delay < MIN_ATTEMPT_TIME:
+                    tracer.event(f"{name}_deadline", attempt=attempt + 1, deadline=policy.deadline)
+                    raise RetryError(f"échéance de {policy.deadline:.0f}s atteinte", last_error)
+            print(f"🔄 Nouvelle tentative dans {delay:.1f}s...")
+            with tracer.span(f"{name}_backoff", attempt=attempt + 1):
+                time.sleep(delay)
+
+    raise RetryError(f"{policy.max_attempts} tentatives échouées", last_error)
@@ -0,0 +1,140 @@
+# tracing.py
+import contextvars
+import json
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+# Fichier JSONL où écrire les spans (RAG_TRACE_FILE ou --trace) ; vide = collecte en mémoire seulement
+DEFAULT_TRACE_FILE = os.environ.get("RAG_TRACE_FILE", "")
+# Spans gardés en mémoire pour le tableau de fin d'exécution (les plus anciens sont oubliés au-delà)
+MAX_SPANS = int(os.environ.get("RAG_TRACE_MAX_SPANS", "10000"))
+
+# Slide en cours dans le thread (ou la tâche) courant : {"trace_id", "slide", "topic", "lang"...}
+_current_trace: contextvars.ContextVar[Optional[Dict]] = contextvars.ContextVar("rag_trace", default=None)
+
+
+def _percentile(values: List[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+
+class Tracer:
+    """Collecteur de spans par étape (chargement d'index, encodage, FAISS, prompt, LLM...).
+
+    Chaque span est un dict {trace_id, slide, stage, start, duration_ms, status, ...}
+    rattaché à la slide courante (voir `slide`) ; les événements ponctuels
+    (nouvelle tentative, timeout) sont des spans de durée nulle. Les `max_spans`
+    derniers spans sont gardés en mémoire pour le tableau de fin d'exécution et,
+    si `path` est donné, tous sont ajoutés ligne par ligne à un fichier JSONL.
+    """
+
+    def __init__(self, path: str = DEFAULT_TRACE_FILE, max_spans: int = MAX_SPANS):
+        self.path = path
+        self.spans = deque(maxlen=max(1, max_spans))
+        self._lock = threading.Lock()
+
+    def configure(self, path: str):
+        """Changer le fichier JSONL (ex: option --trace)"""
+        with self._lock:
+            self.path = path
+
+    def _record(self, span: Dict):
+        trace = _current_trace.get()
+        if trace:
+            span = dict(trace, **span)
+        with self._lock:
+            self.spans.append(span)
+            if self.path:
+                directory = os.path.dirname(self.path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(span, ensure_ascii=False) + "\n")
+
+    @contextmanager
+    def slide(self, slide_number: int, topic: str = "", **attrs):
+        """Rattacher les spans émis dans ce bloc (et les tâches lancées via `wrap`) à une slide"""
+        token = _current_trace.set(dict(trace_id=uuid.uuid4().hex[:12], slide=slide_number, topic=topic, **attrs))
+        start = time.perf_counter()
+        status = "ok"
+        try:
+            yield
+        except BaseException:
+            status = "error"
+            raise
+        finally:
+            self._record({"stage": "slide", "start": time.time() - (time.perf_counter() - start),
+                          "duration_ms": round((time.perf_counter() - start) * 1000, 3), "status": status})
+            _current_trace.reset(token)
+
+    @contextmanager
+    def span(self, stage: str, **attrs):
+        """Mesurer la durée d'une étape ; une exception est notée status="error" puis propagée"""
+        span = {"stage": stage, "start": time.time(), **attrs}
+        start = time.perf_counter()
+        span["status"] = "ok"
+        try:
+            yield span
+        except BaseException as e:
+            span["status"] = "error"
+            span["error"] = type(e).__name__
+            raise
+        finally:
+            span["duration_ms"] = round((time.perf_counter() - start) * 1000, 3)
+            self._record(span)
+
+    def event(self, stage: str, **attrs):
+        """Événement ponctuel (nouvelle tentative, timeout, réponse en cache...)"""
+        self._record({"stage": stage, "start": time.time(), "duration_ms": 0.0, "status": "event", **attrs})
+
+    @staticmethod
+    def wrap(fn):
+        """Exécuter fn dans le contexte de trace courant (pour un ThreadPoolExecutor)"""
+        context = contextvars.copy_context()
+        return lambda *args, **kwargs: context.run(fn, *args, **kwargs)
+
+    def reset(self):
+        with self._lock:
+            self.spans.clear()
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        """Statistiques par étape : nombre, total, p50, p95 et max (ms), erreurs"""
+        with self._lock:
+            spans = list(self.spans)
+        by_stage: Dict[str, List[Dict]] = {}
+        for span in spans:
+            by_stage.setdefault(span["stage"], []).append(span)
+        stats = {}
+        for stage, items in by_stage.items():
+            durations = [span["duration_ms"] for span in items]
+            stats[stage] = {
+                "count": len(items),
+                "total_ms": round(sum(durations), 1),
+                "p50_ms": round(_percentile(durations, 0.50), 1),
+                "p95_ms": round(_percentile(durations, 0.95), 1),
+                "max_ms": round(max(durations), 1),
+                "errors": sum(1 for span in items if span["status"] == "error"),
+            }
+        return stats
+
+    def print_summary(self):
+        """Tableau des temps par étape en fin d'exécution"""
+        stats = self.summary()
+        if not stats:
+            return
+        print("\n⏱️ Temps par étape :")
+        print(f"{'étape':<18}{'n':>6}{'total ms':>12}{'p50 ms':>10}{'p95 ms':>10}{'max ms':>10}{'err':>6}")
+        for stage, s in sorted(stats.items(), key=lambda item: -item[1]["total_ms"]):
+            print(f"{stage:<18}{s['count']:>6}{s['total_ms']:>12.1f}{s['p50_ms']:>10.1f}"
+                  f"{s['p95_ms']:>10.1f}{s['max_ms']:>10.1f}{s['errors']:>6}")
+        if self.path:
+            print(f"📝 Trace détaillée : {self.path}")
+
+
+# Collecteur partagé par tous les modules du pipeline
+tracer = Tracer()